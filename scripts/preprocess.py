@@ -8,18 +8,20 @@ Winter 2020
 """
 import os
 import configparser
-import json
+from concurrent.futures import ProcessPoolExecutor
 import csv
 import pandas as pd
 import geopandas as gpd
 import pyproj
-from shapely.geometry import Polygon, MultiPolygon, mapping, shape, MultiLineString, LineString
+from shapely.geometry import Point, Polygon, MultiPolygon, mapping, shape, MultiLineString, LineString
 from shapely.ops import transform, unary_union, nearest_points
+from shapely.prepared import prep
 import fiona
-import fiona.crs
 import rasterio
-from rasterio.mask import mask
-from rasterstats import zonal_stats
+from rasterio.enums import MergeAlg
+from rasterio.features import rasterize
+from rasterio.windows import Window, from_bounds
+from scipy import ndimage
 import networkx as nx
 from rtree import index
 import numpy as np
@@ -34,6 +36,12 @@ DATA_RAW = os.path.join(BASE_PATH, 'raw')
 DATA_INTERMEDIATE = os.path.join(BASE_PATH, 'intermediate')
 DATA_PROCESSED = os.path.join(BASE_PATH, 'processed')
 
+# number of raster rows read at a time when clipping global raster layers
+CLIP_BLOCK_ROWS = CONFIG.getint('preprocess', 'clip_block_rows', fallback=512)
+
+# number of worker processes used for per-region preprocessing
+WORKERS = CONFIG.getint('preprocess', 'workers', fallback=1)
+
 
 def find_country_list(continent_list):
     """
@@ -201,124 +209,173 @@ def process_regions(country):
     return print('Complete')
 
 
-def process_settlement_layer(country):
+def process_settlement_layer(countries):
     """
-    Clip the settlement layer to the chosen country boundary and place in
-    desired country folder.
+    Clip the settlement layer to the chosen country boundaries and place in
+    the desired country folders.
 
     Parameters
     ----------
-    country : string
-        Three digit ISO country code.
+    countries : dict or list of dicts
+        Contains specific country parameters, for one or more countries.
 
     """
-    iso3 = country['iso3']
-    regional_level = country['regional_level']
-
     path_settlements = os.path.join(DATA_RAW,'settlement_layer',
         'ppp_2020_1km_Aggregated.tif')
 
-    settlements = rasterio.open(path_settlements, 'r+')
-    settlements.nodata = 255
-    settlements.crs = {"init": "epsg:4326"}
+    clip_raster_layer(path_settlements, countries, 'settlements.tif', 255)
 
-    iso3 = country['iso3']
-    path_country = os.path.join(DATA_INTERMEDIATE, iso3,
-        'national_outline.shp')
+    return print('Completed processing of settlement layer')
 
-    if os.path.exists(path_country):
-        country = gpd.read_file(path_country)
-    else:
-        print('Must generate national_outline.shp first' )
 
-    path_country = os.path.join(DATA_INTERMEDIATE, iso3)
-    shape_path = os.path.join(path_country, 'settlements.tif')
+def process_night_lights(countries):
+    """
+    Clip the nightlights layer to the chosen country boundaries and place in
+    the desired country folders.
 
-    if os.path.exists(shape_path):
-        return print('Completed settlement layer processing')
+    Parameters
+    ----------
+    countries : dict or list of dicts
+        Contains specific country parameters, for one or more countries.
 
-    print('----')
-    print('Working on {} level {}'.format(iso3, regional_level))
+    """
+    filename = 'F182013.v4c_web.stable_lights.avg_vis.tif'
+    path_night_lights = os.path.join(DATA_RAW, 'nightlights', '2013',
+        filename)
 
-    bbox = country.envelope
-    geo = gpd.GeoDataFrame()
+    clip_raster_layer(path_night_lights, countries, 'night_lights.tif', 0)
 
-    geo = gpd.GeoDataFrame({'geometry': bbox})
+    return print('Completed processing of night lights layer')
 
-    coords = [json.loads(geo.to_json())['features'][0]['geometry']]
 
-    #chop on coords
-    out_img, out_transform = mask(settlements, coords, crop=True)
+def clip_raster_layer(path_input, countries, filename, nodata):
+    """
+    Clip a global raster layer to the bounding box of each country in a
+    single sweep over the global raster.
 
-    # Copy the metadata
-    out_meta = settlements.meta.copy()
+    Each country's pixel window is computed from the bounds of its national
+    outline, and the global raster is then read in strips of CLIP_BLOCK_ROWS
+    rows, writing each strip to every country window it overlaps. Only one
+    strip per country is held in memory at a time.
 
-    out_meta.update({"driver": "GTiff",
-                    "height": out_img.shape[1],
-                    "width": out_img.shape[2],
-                    "transform": out_transform,
-                    "crs": 'epsg:4326'})
+    Parameters
+    ----------
+    path_input : string
+        Path to the global raster layer.
+    countries : dict or list of dicts
+        Contains specific country parameters, for one or more countries.
+    filename : string
+        Name of the clipped raster in each country folder.
+    nodata : int
+        Nodata value of the clipped rasters.
 
-    with rasterio.open(shape_path, "w", **out_meta) as dest:
-            dest.write(out_img)
+    """
+    if isinstance(countries, dict):
+        countries = [countries]
 
-    return print('Completed processing of settlement layer')
+    with rasterio.open(path_input) as src:
 
+        out_meta = src.meta.copy()
 
-def process_night_lights(country):
-    """
-    Clip the nightlights layer to the chosen country boundary and place in
-    desired country folder.
+        outputs = []
 
-    Parameters
-    ----------
-    country : string
-        Three digit ISO country code.
+        for country in countries:
 
-    """
-    iso3 = country['iso3']
+            iso3 = country['iso3']
+            folder = os.path.join(DATA_INTERMEDIATE, iso3)
+            path_output = os.path.join(folder, filename)
 
-    folder = os.path.join(DATA_INTERMEDIATE, iso3)
-    path_output = os.path.join(folder,'night_lights.tif')
+            if os.path.exists(path_output):
+                continue
 
-    if os.path.exists(path_output):
-        return print('Completed processing of nightlight layer')
+            path_country = os.path.join(folder, 'national_outline.shp')
 
-    path_country = os.path.join(folder, 'national_outline.shp')
+            if not os.path.exists(path_country):
+                print('Must generate national_outline.shp first for {}'.format(iso3))
+                continue
 
-    filename = 'F182013.v4c_web.stable_lights.avg_vis.tif'
-    path_night_lights = os.path.join(DATA_RAW, 'nightlights', '2013',
-        filename)
+            bounds = gpd.read_file(path_country).total_bounds
+            window = get_raster_window(src, bounds)
 
-    country = gpd.read_file(path_country)
+            if window is None:
+                print('{} does not overlap {}'.format(iso3, path_input))
+                continue
 
-    print('----')
-    print('working on {}'.format(iso3))
+            print('Clipping {} for {}'.format(filename, iso3))
 
-    bbox = country.envelope
+            meta = dict(out_meta)
+            meta.update({"driver": "GTiff",
+                        "height": window.height,
+                        "width": window.width,
+                        "transform": src.window_transform(window),
+                        "crs": 'epsg:4326',
+                        "nodata": nodata})
 
-    geo = gpd.GeoDataFrame()
-    geo = gpd.GeoDataFrame({'geometry': bbox}, crs=fiona.crs.from_epsg('4326'))
+            outputs.append((window, path_output, meta))
 
-    coords = [json.loads(geo.to_json())['features'][0]['geometry']]
+        if len(outputs) == 0:
+            return
 
-    night_lights = rasterio.open(path_night_lights, "r+")
-    night_lights.nodata = 0
+        dests = []
 
-    out_img, out_transform = mask(night_lights, coords, crop=True)
+        try:
+            for window, path_output, meta in outputs:
+                dests.append((window, rasterio.open(path_output, "w", **meta)))
 
-    out_meta = night_lights.meta.copy()
+            row_start = min(window.row_off for window, dest in dests)
+            row_end = max(window.row_off + window.height for window, dest in dests)
 
-    out_meta.update({"driver": "GTiff",
-                    "height": out_img.shape[1],
-                    "width": out_img.shape[2],
-                    "transform": out_transform,
-                    "crs": 'epsg:4326'})
+            for row in range(row_start, row_end, CLIP_BLOCK_ROWS):
 
-    with rasterio.open(path_output, "w", **out_meta) as dest:
-            dest.write(out_img)
+                strip_end = min(row + CLIP_BLOCK_ROWS, row_end)
 
-    return print('Completed processing of night lights layer')
+                for window, dest in dests:
+
+                    top = max(row, window.row_off)
+                    bottom = min(strip_end, window.row_off + window.height)
+
+                    if top >= bottom:
+                        continue
+
+                    data = src.read(window=Window(
+                        window.col_off, top, window.width, bottom - top))
+
+                    dest.write(data, window=Window(
+                        0, top - window.row_off, window.width, bottom - top))
+        finally:
+            for window, dest in dests:
+                dest.close()
+
+
+def get_raster_window(src, bounds):
+    """
+    Get the pixel window of a raster covering the given bounds, clipped to
+    the raster extent.
+
+    Parameters
+    ----------
+    src : rasterio dataset
+        The open raster.
+    bounds : list
+        Bounds as (left, bottom, right, top).
+
+    Returns
+    -------
+    window : rasterio Window
+        The pixel window, or None if the bounds do not overlap the raster.
+
+    """
+    window = from_bounds(*bounds, transform=src.transform)
+
+    col_off = max(int(math.floor(window.col_off)), 0)
+    row_off = max(int(math.floor(window.row_off)), 0)
+    col_end = min(int(math.ceil(window.col_off + window.width)), src.width)
+    row_end = min(int(math.ceil(window.row_off + window.height)), src.height)
+
+    if col_end <= col_off or row_end <= row_off:
+        return None
+
+    return Window(col_off, row_off, col_end - col_off, row_end - row_off)
 
 
 def process_coverage_shapes(country):
@@ -499,36 +556,18 @@ def get_pop_and_luminosity_data(country):
 
     regions = gpd.read_file(path)
 
-    results = []
-
-    for index, region in regions.iterrows():
-
-        with rasterio.open(path_night_lights) as src:
+    luminosity = get_zonal_sums(path_night_lights, regions['geometry'])
+    population = get_zonal_sums(path_settlements, regions['geometry'])
 
-            affine = src.transform
-            array = src.read(1)
-            array[array <= 0] = 0
-
-            luminosity_summation = [d['sum'] for d in zonal_stats(
-                region['geometry'],
-                array,
-                stats=['sum'],
-                affine=affine)][0]
-
-        with rasterio.open(path_settlements) as src:
+    results = []
 
-            affine = src.transform
-            array = src.read(1)
-            array[array <= 0] = 0
+    for idx, region in enumerate(regions.to_dict('records')):
 
-            population_summation = [d['sum'] for d in zonal_stats(
-                region['geometry'], array, stats=['sum'], affine=affine)][0]
+        luminosity_summation = float(luminosity[idx])
+        population_summation = float(population[idx])
 
         area_km2 = round(area_of_polygon(region['geometry']) / 1e6)
 
-        if luminosity_summation == None:
-            luminosity_summation = 0
-
         if area_km2 > 0:
             mean_luminosity_km2 = (
                 luminosity_summation / area_km2 if luminosity_summation else 0)
@@ -555,6 +594,96 @@ def get_pop_and_luminosity_data(country):
     return print('Completed population/luminosity data gathering')
 
 
+def get_zonal_sums(path, geometries):
+    """
+    Sum the (non-negative) raster values within each geometry.
+
+    The raster is read once and all geometries are burned into a label
+    grid aligned with it, so the sums for every geometry come from a
+    single np.bincount. As with zonal_stats, a pixel belongs to a
+    geometry when its center falls inside it, and nodata pixels are
+    excluded.
+
+    A label grid holds one geometry per pixel, so pixels covered by more
+    than one (overlapping) geometry are left out of the bincount, and
+    added to each geometry covering them from a mask of that geometry.
+
+    Parameters
+    ----------
+    path : string
+        Path to the raster layer.
+    geometries : list of shapely geometries
+        Geometries to sum the raster values for.
+
+    Returns
+    -------
+    sums : numpy.ndarray
+        Sum of the raster values within each geometry.
+
+    """
+    shapes = [(geom, idx + 1) for idx, geom in enumerate(geometries)
+        if geom is not None and not geom.is_empty]
+
+    if len(shapes) == 0:
+        return np.zeros(len(geometries))
+
+    with rasterio.open(path) as src:
+
+        array = src.read(1).astype('float64')
+
+        invalid = ~np.isfinite(array) | (array <= 0)
+        if src.nodata is not None:
+            invalid |= array == src.nodata
+        array[invalid] = 0
+
+        labels = rasterize(
+            shapes,
+            out_shape=array.shape,
+            transform=src.transform,
+            fill=0,
+            dtype='int32'
+        )
+
+        coverage = rasterize(
+            [(geom, 1) for geom, idx in shapes],
+            out_shape=array.shape,
+            transform=src.transform,
+            fill=0,
+            merge_alg=MergeAlg.add,
+            dtype='int32'
+        )
+
+        overlaps = coverage > 1
+        labels[overlaps] = 0
+
+        sums = np.bincount(labels.ravel(), weights=array.ravel(),
+            minlength=len(geometries) + 1)
+
+        if overlaps.any():
+            for geom, idx in shapes:
+
+                window = get_raster_window(src, geom.bounds)
+                if window is None:
+                    continue
+
+                rows, cols = window.toslices()
+                window_overlaps = overlaps[rows, cols]
+                if not window_overlaps.any():
+                    continue
+
+                mask = rasterize(
+                    [(geom, 1)],
+                    out_shape=window_overlaps.shape,
+                    transform=src.window_transform(window),
+                    fill=0,
+                    dtype='uint8'
+                ).astype(bool)
+
+                sums[idx] += array[rows, cols][mask & window_overlaps].sum()
+
+    return sums[1:]
+
+
 def get_regional_data(country):
     """
     Allocate regional coverage, estimated sites and backhaul.
@@ -940,29 +1069,13 @@ def estimate_core_nodes(iso3, pop_density_km2, settlement_size):
     path = os.path.join(DATA_INTERMEDIATE, iso3, 'settlements.tif')
 
     with rasterio.open(path) as src:
-        data = src.read()
-        threshold = pop_density_km2
-        data[data < threshold] = 0
-        data[data >= threshold] = 1
-        polygons = rasterio.features.shapes(data, transform=src.transform)
-        shapes_df = gpd.GeoDataFrame.from_features(
-            [
-                {'geometry': poly, 'properties':{'value':value}}
-                for poly, value in polygons
-                if value > 0
-            ],
-            crs='epsg:4326'
-        )
-
-    stats = zonal_stats(shapes_df['geometry'], path, stats=['count', 'sum'])
-
-    stats_df = pd.DataFrame(stats)
-
-    nodes = pd.concat([shapes_df, stats_df], axis=1).drop(columns='value')
+        settlements = find_settlements(src.read(1), src.transform,
+            pop_density_km2, src.nodata)
 
-    nodes = nodes[nodes['sum'] >= settlement_size]
+    nodes = settlements[settlements['sum'] >= settlement_size]
 
-    nodes['geometry'] = nodes['geometry'].centroid
+    nodes = gpd.GeoDataFrame(nodes, crs='epsg:4326',
+        geometry=gpd.points_from_xy(nodes['x'], nodes['y']))
 
     nodes = get_points_inside_country(nodes, iso3)
 
@@ -983,6 +1096,67 @@ def estimate_core_nodes(iso3, pop_density_km2, settlement_size):
     return output
 
 
+def find_settlements(data, raster_transform, threshold, nodata=None):
+    """
+    Identify settlements as the connected groups of pixels (4-connected,
+    as polygonized by rasterio.features.shapes) at or above a population
+    density threshold.
+
+    Population is summed per settlement with np.bincount over the
+    component labels, and each centroid is the mean pixel center of the
+    settlement (its label moments), which equals the centroid of the
+    polygonized shape.
+
+    Parameters
+    ----------
+    data : numpy.ndarray
+        Population raster band.
+    raster_transform : affine.Affine
+        Transform of the raster band.
+    threshold : int
+        Population density threshold for identifying built up areas.
+    nodata : float, optional
+        Nodata value, excluded from the count and sum (as in zonal_stats).
+
+    Returns
+    -------
+    settlements : dataframe
+        Pixel count, population sum and centroid (x, y) of each settlement.
+
+    """
+    built_up = data >= threshold
+
+    labels, number = ndimage.label(built_up)
+
+    rows, cols = np.nonzero(labels)
+    ids = labels[rows, cols]
+    values = data[rows, cols]
+
+    if nodata is not None:
+        valid = values != nodata
+    else:
+        valid = np.ones(len(values), dtype=bool)
+
+    minlength = number + 1
+
+    pixels = np.bincount(ids, minlength=minlength)[1:]
+    count = np.bincount(ids, weights=valid, minlength=minlength)[1:]
+    population = np.bincount(ids, weights=np.where(valid, values, 0),
+        minlength=minlength)[1:]
+
+    mean_row = np.bincount(ids, weights=rows, minlength=minlength)[1:] / pixels
+    mean_col = np.bincount(ids, weights=cols, minlength=minlength)[1:] / pixels
+
+    x, y = raster_transform * (mean_col + 0.5, mean_row + 0.5)
+
+    return pd.DataFrame({
+        'count': count.astype(int),
+        'sum': population,
+        'x': x,
+        'y': y,
+    })
+
+
 def get_points_inside_country(nodes, iso3):
     """
     Check settlement locations lie inside target country.
@@ -1039,43 +1213,26 @@ def generate_agglomeration_lut(country):
     regions = gpd.read_file(path, crs="epsg:4326")
 
     path_settlements = os.path.join(DATA_INTERMEDIATE, iso3, 'settlements.tif')
-    settlements = rasterio.open(path_settlements, 'r+')
-    settlements.nodata = 255
-    settlements.crs = {"init": "epsg:4326"}
-
-    folder_tifs = os.path.join(DATA_INTERMEDIATE, iso3, 'agglomerations', 'tifs')
-    if not os.path.exists(folder_tifs):
-        os.makedirs(folder_tifs)
-
-    for idx, region in regions.iterrows():
-
-        bbox = region['geometry'].envelope
-        geo = gpd.GeoDataFrame()
-        geo = gpd.GeoDataFrame({'geometry': bbox}, index=[idx])
-        coords = [json.loads(geo.to_json())['features'][0]['geometry']]
 
-        #chop on coords
-        out_img, out_transform = mask(settlements, coords, crop=True)
-
-        # Copy the metadata
-        out_meta = settlements.meta.copy()
-
-        out_meta.update({"driver": "GTiff",
-                        "height": out_img.shape[1],
-                        "width": out_img.shape[2],
-                        "transform": out_transform,
-                        "crs": 'epsg:4326'})
-
-        path_output = os.path.join(folder_tifs, region[GID_level] + '.tif')
-
-        with rasterio.open(path_output, "w", **out_meta) as dest:
-                dest.write(out_img)
+    with rasterio.open(path_settlements) as src:
+        windows = get_region_windows(src, regions, GID_level)
 
     print('Completed settlement.tif regional segmentation')
 
-    nodes, missing_nodes = find_nodes(country, regions)
+    #one pool of workers is shared by all settlement searches
+    if WORKERS > 1:
+        executor = ProcessPoolExecutor(WORKERS)
+    else:
+        executor = None
+
+    try:
+        nodes, missing_nodes = find_nodes(country, regions, windows, executor)
 
-    missing_nodes = get_missing_nodes(country, regions, missing_nodes, 10, 10)
+        missing_nodes = get_missing_nodes(country, regions, missing_nodes, 10,
+            10, windows, executor)
+    finally:
+        if executor is not None:
+            executor.shutdown()
 
     nodes = nodes + missing_nodes
 
@@ -1085,35 +1242,10 @@ def generate_agglomeration_lut(country):
     nodes = pd.concat([nodes, bool_list], axis=1)
     nodes = nodes[nodes[0] == True].drop(columns=0)
 
-    agglomerations = []
-
     print('Identifying agglomerations')
-    for idx1, region in regions.iterrows():
-        seen = set()
-        for idx2, node in nodes.iterrows():
-            if node['geometry'].intersects(region['geometry']):
-                agglomerations.append({
-                    'type': 'Feature',
-                    'geometry': mapping(node['geometry']),
-                    'properties': {
-                        'id': idx1,
-                        'GID_0': region['GID_0'],
-                        GID_level: region[GID_level],
-                        'population': node['sum'],
-                    }
-                })
-                seen.add(region[GID_level])
-        if len(seen) == 0:
-            agglomerations.append({
-                    'type': 'Feature',
-                    'geometry': mapping(region['geometry'].centroid),
-                    'properties': {
-                        'id': 'regional_node',
-                        'GID_0': region['GID_0'],
-                        GID_level: region[GID_level],
-                        'population': 1,
-                    }
-                })
+    agglomerations = get_agglomerations(regions.index,
+        regions.to_dict('records'), list(nodes['geometry']), list(nodes['sum']),
+        GID_level)
 
     agglomerations = gpd.GeoDataFrame.from_features(
             [
@@ -1144,6 +1276,106 @@ def generate_agglomeration_lut(country):
     return print('Agglomerations layer complete')
 
 
+def get_agglomerations(ids, regions, nodes, populations, GID_level):
+    """
+    Get the agglomeration features of each region, from the nodes
+    intersecting it, or its centroid if there are none.
+
+    Parameters
+    ----------
+    ids : list
+        Id of each region.
+    regions : list of dicts
+        Data for all regions, including their geometry.
+    nodes : list of shapely geometries
+        Node points.
+    populations : list
+        Population of each node.
+    GID_level : string
+        Regional id column, e.g. 'GID_2'.
+
+    Returns
+    -------
+    agglomerations : list of dicts
+        Agglomeration features.
+
+    """
+    agglomerations = []
+
+    regional_nodes = find_nodes_in_regions(nodes,
+        [region['geometry'] for region in regions])
+
+    for idx1, region, node_ids in zip(ids, regions, regional_nodes):
+        for idx2 in node_ids:
+            agglomerations.append({
+                'type': 'Feature',
+                'geometry': mapping(nodes[idx2]),
+                'properties': {
+                    'id': idx1,
+                    'GID_0': region['GID_0'],
+                    GID_level: region[GID_level],
+                    'population': populations[idx2],
+                }
+            })
+        if len(node_ids) == 0:
+            agglomerations.append({
+                    'type': 'Feature',
+                    'geometry': mapping(region['geometry'].centroid),
+                    'properties': {
+                        'id': 'regional_node',
+                        'GID_0': region['GID_0'],
+                        GID_level: region[GID_level],
+                        'population': 1,
+                    }
+                })
+
+    return agglomerations
+
+
+def find_nodes_in_regions(nodes, regions):
+    """
+    Find the nodes intersecting each region using a spatial index.
+
+    All nodes are bulk loaded into an rtree index, so each region only
+    tests the nodes within its bounds rather than every node.
+
+    Parameters
+    ----------
+    nodes : list of shapely geometries
+        Node points.
+    regions : list of shapely geometries
+        Region polygons.
+
+    Returns
+    -------
+    regional_nodes : list of lists
+        Positions of the nodes intersecting each region, in node order.
+
+    """
+    nodes = list(nodes)
+
+    if len(nodes) == 0:
+        return [[] for region in regions]
+
+    idx = index.Index(
+        (node_id, node.bounds, None) for node_id, node in enumerate(nodes)
+    )
+
+    regional_nodes = []
+
+    for region in regions:
+
+        candidates = sorted(idx.intersection(region.bounds))
+
+        if len(candidates) > 0:
+            region = prep(region)
+
+        regional_nodes.append([node_id for node_id in candidates
+            if region.intersects(nodes[node_id])])
+
+    return regional_nodes
+
+
 def process_existing_fiber(country):
     """
     Load and process existing fiber data.
@@ -1266,82 +1498,43 @@ def find_nodes_on_existing_infrastructure(country):
     return print('Found nodes on existing infrastructure')
 
 
-def find_nodes(country, regions):
+def find_nodes(country, regions, windows, executor=None):
     """
     Find key nodes.
 
     """
-    iso3 = country['iso3']
     regional_level = country['regional_level']
     GID_level = 'GID_{}'.format(regional_level)
 
     threshold = country['pop_density_km2']
     settlement_size = country['settlement_size']
 
-    folder_tifs = os.path.join(DATA_INTERMEDIATE, iso3, 'agglomerations', 'tifs')
+    region_ids = list(regions[GID_level])
 
     interim = []
     missing_nodes = set()
 
     print('Working on gathering data from regional rasters')
-    for idx, region in regions.iterrows():
+    settlements = find_region_settlements(windows, region_ids, threshold,
+        executor)
 
-        path = os.path.join(folder_tifs, region[GID_level] + '.tif')
-
-        with rasterio.open(path) as src:
-            data = src.read()
-            data[data < threshold] = 0
-            data[data >= threshold] = 1
-            polygons = rasterio.features.shapes(data, transform=src.transform)
-            shapes_df = gpd.GeoDataFrame.from_features(
-                [
-                    {'geometry': poly, 'properties':{'value':value}}
-                    for poly, value in polygons
-                    if value > 0
-                ],
-                crs='epsg:4326'
-            )
+    for region_id in region_ids:
 
-        geojson_region = [
-            {
-                'geometry': region['geometry'],
-                'properties': {
-                    GID_level: region[GID_level]
-                }
-            }
-        ]
-
-        gpd_region = gpd.GeoDataFrame.from_features(
-                [
-                    {'geometry': poly['geometry'],
-                    'properties':{
-                        GID_level: poly['properties'][GID_level]
-                        }}
-                    for poly in geojson_region
-                ], crs='epsg:4326'
-            )
+        nodes = settlements[region_id]
 
-        if len(shapes_df) == 0:
+        if len(nodes) == 0:
             continue
 
-        nodes = gpd.overlay(shapes_df, gpd_region, how='intersection')
-
-        stats = zonal_stats(shapes_df['geometry'], path, stats=['count', 'sum'])
-
-        stats_df = pd.DataFrame(stats)
-
-        nodes = pd.concat([shapes_df, stats_df], axis=1).drop(columns='value')
-
         nodes_subset = nodes[nodes['sum'] >= settlement_size]
 
         if len(nodes_subset) == 0:
-            missing_nodes.add(region[GID_level])
+            missing_nodes.add(region_id)
 
-        for idx, item in nodes_subset.iterrows():
+        for item in nodes_subset.to_dict('records'):
             interim.append({
-                    'geometry': item['geometry'].centroid,
+                    'geometry': Point(item['x'], item['y']),
                     'properties': {
-                        GID_level: region[GID_level],
+                        GID_level: region_id,
                         'count': item['count'],
                         'sum': item['sum']
                     }
@@ -1350,76 +1543,36 @@ def find_nodes(country, regions):
     return interim, missing_nodes
 
 
-def get_missing_nodes(country, regions, missing_nodes, threshold, settlement_size):
+def get_missing_nodes(country, regions, missing_nodes, threshold,
+    settlement_size, windows, executor=None):
     """
     Find any missing nodes
 
     """
-    iso3 = country['iso3']
     regional_level = country['regional_level']
     GID_level = 'GID_{}'.format(regional_level)
 
-    folder_tifs = os.path.join(DATA_INTERMEDIATE, iso3, 'agglomerations', 'tifs')
+    region_ids = [region_id for region_id in regions[GID_level]
+        if region_id in missing_nodes]
 
     interim = []
 
-    for idx, region in regions.iterrows():
-
-        if not region[GID_level] in list(missing_nodes):
-            continue
-
-        path = os.path.join(folder_tifs, region[GID_level] + '.tif')
-
-        with rasterio.open(path) as src:
-            data = src.read()
-            data[data < threshold] = 0
-            data[data >= threshold] = 1
-            polygons = rasterio.features.shapes(data, transform=src.transform)
-            shapes_df = gpd.GeoDataFrame.from_features(
-                [
-                    {'geometry': poly, 'properties':{'value':value}}
-                    for poly, value in polygons
-                    if value > 0
-                ],
-                crs='epsg:4326'
-            )
+    settlements = find_region_settlements(windows, region_ids, threshold,
+        executor)
 
-        geojson_region = [
-            {
-                'geometry': region['geometry'],
-                'properties': {
-                    GID_level: region[GID_level]
-                }
-            }
-        ]
-
-        gpd_region = gpd.GeoDataFrame.from_features(
-                [
-                    {'geometry': poly['geometry'],
-                    'properties':{
-                        GID_level: poly['properties'][GID_level]
-                        }}
-                    for poly in geojson_region
-                ], crs='epsg:4326'
-            )
+    for region_id in region_ids:
 
-        nodes = gpd.overlay(shapes_df, gpd_region, how='intersection')
-
-        stats = zonal_stats(shapes_df['geometry'], path, stats=['count', 'sum'])
-
-        stats_df = pd.DataFrame(stats)
-
-        nodes = pd.concat([shapes_df, stats_df], axis=1).drop(columns='value')
+        nodes = settlements[region_id]
 
         max_sum = nodes['sum'].max()
 
         nodes = nodes[nodes['sum'] > max_sum - 1]
 
-        for idx, item in nodes.iterrows():
+        for item in nodes.to_dict('records'):
             interim.append({
-                    'geometry': item['geometry'].centroid,
+                    'geometry': Point(item['x'], item['y']),
                     'properties': {
-                        GID_level: region[GID_level],
+                        GID_level: region_id,
                         'count': item['count'],
                         'sum': item['sum']
                     }
@@ -1428,6 +1581,89 @@ def get_missing_nodes(country, regions, missing_nodes, threshold, settlement_siz
     return interim
 
 
+def get_region_windows(src, regions, GID_level):
+    """
+    Read the settlement raster once and get the window covering each
+    region's envelope as an in-memory array view.
+
+    Parameters
+    ----------
+    src : rasterio dataset
+        The open settlement raster.
+    regions : dataframe
+        A geopandas dataframe containing the regions.
+    GID_level : string
+        Regional id column, e.g. 'GID_2'.
+
+    Returns
+    -------
+    windows : dict
+        The array view, transform and nodata value of each region's
+        window, by regional id.
+
+    """
+    data = src.read(1)
+
+    windows = {}
+
+    for region in regions.to_dict('records'):
+
+        window = get_raster_window(src, region['geometry'].bounds)
+
+        if window is None:
+            window = Window(0, 0, 0, 0)
+
+        windows[region[GID_level]] = {
+            'data': data[
+                window.row_off:window.row_off + window.height,
+                window.col_off:window.col_off + window.width
+            ],
+            'transform': src.window_transform(window),
+            'nodata': src.nodata,
+        }
+
+    return windows
+
+
+def find_region_settlements(windows, region_ids, threshold, executor=None):
+    """
+    Find the settlements within each region's window, in parallel when
+    given an executor.
+
+    Parameters
+    ----------
+    windows : dict
+        Settlement raster window of each region, by regional id.
+    region_ids : list
+        Regional ids to find settlements for.
+    threshold : int
+        Population density threshold for identifying built up areas.
+    executor : ProcessPoolExecutor, optional
+        Pool of preprocessing workers (otherwise regions are processed
+        serially).
+
+    Returns
+    -------
+    settlements : dict
+        Settlements dataframe (see find_settlements), by regional id.
+
+    """
+    args = (
+        [windows[region_id]['data'] for region_id in region_ids],
+        [windows[region_id]['transform'] for region_id in region_ids],
+        [threshold] * len(region_ids),
+        [windows[region_id]['nodata'] for region_id in region_ids],
+    )
+
+    if executor is not None and len(region_ids) > 1:
+        results = list(executor.map(find_settlements, *args,
+            chunksize=max(1, len(region_ids) // (WORKERS * 4))))
+    else:
+        results = list(map(find_settlements, *args))
+
+    return dict(zip(region_ids, results))
+
+
 def find_regional_nodes(country):
     """
 
@@ -2251,11 +2487,15 @@ if __name__ == '__main__':
         print('Processing regions')
         process_regions(country)
 
-        print('Processing settlement layer')
-        process_settlement_layer(country)
+    print('Processing settlement layer')
+    process_settlement_layer(countries)
 
-        print('Processing night lights')
-        process_night_lights(country)
+    print('Processing night lights')
+    process_night_lights(countries)
+
+    for country in countries:
+
+        print('Working on {}'.format(country['iso3']))
 
         print('Processing coverage shapes')
         process_coverage_shapes(country)
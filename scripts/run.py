@@ -8,17 +8,25 @@ Winter 2020
 """
 import os
 import csv
+import json
 import configparser
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 import pandas as pd
 import geopandas
 from tqdm import tqdm
-from collections import OrderedDict
+from collections import deque
+from itertools import groupby
 
 from options import OPTIONS, COUNTRY_PARAMETERS
-from pytal.demand import estimate_demand
-from pytal.supply import estimate_supply
+from pytal.demand import (estimate_demand_arrays, get_region_columns,
+    update_regions, collect_annual_demand)
+from pytal.supply import estimate_supply_by_ci
 from pytal.assess import assess
-from write import define_deciles, write_mno_demand, write_results
+from pytal.costs import compile_core_lut, attach_core_lut
+from pytal.strategy import compile_option, get_stage_key
+from write import define_deciles, ResultsSink
 
 CONFIG = configparser.ConfigParser()
 CONFIG.read(os.path.join(os.path.dirname(__file__), 'script_config.ini'))
@@ -28,6 +36,32 @@ DATA_RAW = os.path.join(BASE_PATH, 'raw')
 DATA_INTERMEDIATE = os.path.join(BASE_PATH, 'intermediate')
 DATA_PROCESSED = os.path.join(BASE_PATH, 'processed')
 
+#lower population density thresholds (persons per km^2) for each geotype
+GEOTYPE_THRESHOLDS = [5000, 1500, 1000, 500, 100, 50, 10]
+GEOTYPE_LABELS = [
+    'urban', 'suburban 1', 'suburban 2',
+    'rural 1', 'rural 2', 'rural 3', 'rural 4'
+]
+
+#number of worker processes (1 runs the model in the main process)
+WORKERS = CONFIG.getint('run', 'workers', fallback=1)
+
+#maximum number of work units submitted to the workers at once
+MAX_PENDING_UNITS = CONFIG.getint('run', 'max_pending_units',
+    fallback=2 * WORKERS)
+
+#results output formats (csv, parquet and/or arrow)
+OUTPUT_FORMATS = [
+    output_format.strip() for output_format in
+    CONFIG.get('run', 'output_formats', fallback='csv').split(',')
+]
+
+#annual demand results for each region (regional) or country (national)
+ANNUAL_DEMAND = CONFIG.get('run', 'annual_demand', fallback='regional')
+
+#lookup tables and parameters held by each (worker) process
+WORKER = {}
+
 
 def load_regions(path):
     """
@@ -36,7 +70,7 @@ def load_regions(path):
     """
     regions = pd.read_csv(path)
 
-    regions['geotype'] = regions.apply(define_geotype, axis=1)
+    regions['geotype'] = define_geotypes(regions['population_km2'])
 
     regions.columns = regions.columns.str.replace(
         'sites_estimated_total', #old column name
@@ -46,32 +80,29 @@ def load_regions(path):
     return regions
 
 
-def define_geotype(x):
+def define_geotypes(population_km2):
     """
-    Allocate geotype given a specific population density.
+    Allocate geotypes given population densities, for all regions at once.
+
+    Regions are allocated the first geotype whose lower population density
+    threshold they exceed (see GEOTYPE_THRESHOLDS), and 'rural 5' otherwise.
 
     Parameters
     ----------
-    x : pandas df
-        The column we wish to apply the geotype definition to.
-
-    """
-    if x['population_km2'] > 5000:
-        return 'urban'
-    elif x['population_km2'] > 1500:
-        return 'suburban 1'
-    elif x['population_km2'] > 1000:
-        return 'suburban 2'
-    elif x['population_km2'] > 500:
-        return 'rural 1'
-    elif x['population_km2'] > 100:
-        return 'rural 2'
-    elif x['population_km2'] > 50:
-        return 'rural 3'
-    elif x['population_km2'] > 10:
-        return 'rural 4'
-    else:
-        return 'rural 5'
+    population_km2 : pandas series
+        Population density for each region.
+
+    Returns
+    -------
+    geotypes : numpy array
+        The geotype of each region.
+
+    """
+    population_km2 = np.asarray(population_km2, dtype=float)
+
+    conditions = [population_km2 > threshold for threshold in GEOTYPE_THRESHOLDS]
+
+    return np.select(conditions, GEOTYPE_LABELS, default='rural 5')
 
 
 def read_capacity_lookup(path):
@@ -125,6 +156,131 @@ def read_capacity_lookup(path):
     return capacity_lookup_table
 
 
+class CapacityLookupTable(Mapping):
+    """
+    Read-only capacity lookup table backed by a memory-mapped array.
+
+    Each (environment, ant_type, frequency, generation, ci) key maps to a
+    zero-copy slice of (sites_per_km2, capacity_mbps_km2) rows, sorted by
+    site density, so worker processes share the same pages of the file.
+
+    """
+    def __init__(self, data_path, index_path):
+
+        self.data_path = data_path
+        self.index_path = index_path
+
+        self.data = np.load(data_path, mmap_mode='r')
+
+        with open(index_path, 'r') as source:
+            index = json.load(source)
+
+        self.index = {
+            tuple(item['key']): (item['start'], item['stop'])
+            for item in index['keys']
+        }
+
+    def __getitem__(self, key):
+        start, stop = self.index[key]
+        return self.data[start:stop]
+
+    def __iter__(self):
+        return iter(self.index)
+
+    def __len__(self):
+        return len(self.index)
+
+    def __reduce__(self):
+        return (CapacityLookupTable, (self.data_path, self.index_path))
+
+
+def compile_capacity_lookup(path, data_path, index_path):
+    """
+    Compile the capacity lookup table csv into a binary array file
+    and a key index.
+
+    Parameters
+    ----------
+    path : string
+        Directory path to the capacity lookup table, generated by pysim5g.
+    data_path : string
+        Path of the .npy array file to write.
+    index_path : string
+        Path of the .json key index to write.
+
+    """
+    capacity_lookup_table = read_capacity_lookup(path)
+
+    keys = []
+    arrays = []
+    start = 0
+
+    for key in sorted(capacity_lookup_table.keys()):
+        values = capacity_lookup_table[key]
+        keys.append({'key': list(key), 'start': start, 'stop': start + len(values)})
+        arrays.append(np.array(values, dtype='float64').reshape(-1, 2))
+        start += len(values)
+
+    if len(arrays) > 0:
+        data = np.concatenate(arrays)
+    else:
+        data = np.empty((0, 2), dtype='float64')
+
+    stat = os.stat(path)
+
+    np.save(data_path, data)
+
+    with open(index_path, 'w') as sink:
+        json.dump({
+            'source': {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns},
+            'keys': keys,
+        }, sink)
+
+
+def load_capacity_lookup(path, folder):
+    """
+    Load the capacity lookup table from its compiled binary form,
+    (re)compiling it only when the source csv has changed.
+
+    Parameters
+    ----------
+    path : string
+        Directory path to the capacity lookup table, generated by pysim5g.
+    folder : string
+        Directory to store the compiled lookup table in.
+
+    Return
+    ------
+    capacity_lookup_table : CapacityLookupTable
+        The loaded lookup table.
+
+    """
+    if not os.path.exists(folder):
+        os.makedirs(folder)
+
+    filename = os.path.splitext(os.path.basename(path))[0]
+    data_path = os.path.join(folder, filename + '.npy')
+    index_path = os.path.join(folder, filename + '.json')
+
+    stat = os.stat(path)
+
+    stale = True
+
+    if os.path.exists(data_path) and os.path.exists(index_path):
+        with open(index_path, 'r') as source:
+            compiled = json.load(source)['source']
+        stale = not (
+            compiled['size'] == stat.st_size and
+            compiled['mtime_ns'] == stat.st_mtime_ns
+        )
+
+    if stale:
+        print('Compiling capacity lookup table')
+        compile_capacity_lookup(path, data_path, index_path)
+
+    return CapacityLookupTable(data_path, index_path)
+
+
 def load_cluster(path, iso3):
     """
     Load cluster number. You need to make sure the
@@ -203,18 +359,6 @@ def load_core_lut(path):
         Directory path to the core network lookup table.
 
     """
-    interim = []
-
-    with open(path, 'r') as source:
-        reader = csv.DictReader(source)
-        for row in reader:
-            interim.append({
-                'GID_id': row['GID_id'],
-                'asset': row['asset'],
-                'source': row['source'],
-                'value': int(round(float(row['value']))),
-            })
-
     asset_types = [
         'core_edge',
         'core_node',
@@ -224,39 +368,341 @@ def load_core_lut(path):
 
     output = {}
 
-    for asset_type in asset_types:
-        asset_dict = {}
-        for row in interim:
-            if asset_type == row['asset']:
-                combined_key = '{}_{}'.format(row['GID_id'], row['source'])
-                asset_dict[combined_key] = row['value']
-                output[asset_type] = asset_dict
+    with open(path, 'r') as source:
+        reader = csv.DictReader(source)
+        for row in reader:
+
+            asset_type = row['asset']
+
+            if asset_type not in asset_types:
+                continue
+
+            if asset_type not in output:
+                output[asset_type] = {}
+
+            combined_key = '{}_{}'.format(row['GID_id'], row['source'])
+            output[asset_type][combined_key] = int(round(float(row['value'])))
 
     return output
 
 
-def allocate_deciles(data):
+def relabel(data, strategy):
     """
-    Convert to pandas df, define deciles, and then return as a list of dicts.
+    Copy memoized results, labelling them with the strategy being assessed.
 
     Parameters
     ----------
     data : list of dicts
-        The data for all regions being modeled.
+        Memoized demand or supply results.
+    strategy : string
+        The strategy being assessed.
 
     Returns
     -------
     data : list of dicts
-        The data for all regions being modeled, with deciles allocated.
+        Copies of the results, with the strategy set.
+
+    """
+    return [dict(item, strategy=strategy) for item in data]
+
+
+def init_worker(capacity_lut, global_parameters, costs, timesteps):
+    """
+    Hold the lookup tables and model parameters in a (worker) process.
+
+    Parameters
+    ----------
+    capacity_lut : CapacityLookupTable
+        The capacity lookup table (memory-mapped, so shared between workers).
+    global_parameters : dict
+        All global model parameters.
+    costs : dict
+        All equipment costs.
+    timesteps : list
+        All years for the assessment period.
+
+    """
+    WORKER.clear()
+    WORKER['capacity_lut'] = capacity_lut
+    WORKER['global_parameters'] = global_parameters
+    WORKER['costs'] = costs
+    WORKER['timesteps'] = timesteps
+    WORKER['countries'] = {}
+
 
+def load_country_luts(country):
     """
-    data = pd.DataFrame(data)
+    Load the prepared regions and lookup tables for a country, once per
+    (worker) process.
+
+    Only the most recently used country is held, as work units are ordered
+    by country (see plan_work_units), so the regions of a country are
+    released once a worker moves on to the next country.
 
-    data = define_deciles(data)
+    Parameters
+    ----------
+    country : dict
+        Country information.
+
+    Returns
+    -------
+    luts : dict
+        The regions (geotyped, with deciles and core network records
+        attached), the region columns used to estimate demand, and the
+        penetration, smartphone and core network lookup tables.
 
-    data = data.to_dict('records')
+    """
+    iso3 = country['iso3']
 
-    return data
+    if iso3 in WORKER['countries']:
+        return WORKER['countries'][iso3]
+
+    WORKER['countries'].clear()
+
+    folder = os.path.join(DATA_INTERMEDIATE, iso3, 'subscriptions')
+    filename = 'subs_forecast.csv'
+    penetration_lut = load_penetration(os.path.join(folder, filename))
+
+    folder = os.path.join(DATA_INTERMEDIATE, iso3, 'smartphones')
+    filename = 'smartphone_forecast.csv'
+    smartphone_lut = load_smartphones(os.path.join(folder, filename))
+
+    folder = os.path.join(DATA_INTERMEDIATE, iso3)
+    filename = 'core_lut.csv'
+    core_lut = load_core_lut(os.path.join(folder, filename))
+    core_records = compile_core_lut(core_lut)
+
+    path = os.path.join(DATA_INTERMEDIATE, iso3, 'regional_data.csv')
+    regions = load_regions(path)
+
+    #deciles only depend on population density, so are the same for all
+    #options (regions without area are not modeled)
+    modeled = regions['area_km2'] > 0
+    regions['decile'] = np.int8(-1)
+    regions.loc[modeled, 'decile'] = define_deciles(
+        regions.loc[modeled, 'population_km2'])
+
+    regions = regions.to_dict('records')
+    regions = attach_core_lut(regions, core_records)
+
+    WORKER['countries'][iso3] = {
+        'regions': regions,
+        'columns': get_region_columns(regions),
+        'penetration_lut': penetration_lut,
+        'smartphone_lut': smartphone_lut,
+        'core_lut': core_lut,
+    }
+
+    return WORKER['countries'][iso3]
+
+
+def plan_work_units(countries, options, confidence_intervals):
+    """
+    Split a sweep into independent work units.
+
+    Each unit is a country, with a run of adjacent options which share the
+    same demand results (i.e. the same scenario and network strategy), split
+    into runs of options which also share the same supply results (i.e.
+    which only differ by spectrum or tax). Demand is run once per unit, and
+    supply once per group for all confidence intervals. Units are ordered by
+    country and then option, so their results follow the order of a serial
+    sweep.
+
+    Parameters
+    ----------
+    countries : list of dicts
+        All countries being modeled.
+    options : list of dicts
+        All options being tested.
+    confidence_intervals : list
+        All confidence intervals.
+
+    Returns
+    -------
+    units : list of dicts
+        The work units.
+
+    """
+    units = []
+
+    for country in countries:
+
+        #only adjacent options are grouped, so results keep the option order
+        for demand_key, members in groupby(options,
+            key=lambda option: get_stage_key(option, 'demand')):
+
+            supply_groups = [
+                list(group) for supply_key, group in groupby(members,
+                    key=lambda option: get_stage_key(option, 'supply'))
+            ]
+
+            units.append({
+                'country': country,
+                'confidence_intervals': list(confidence_intervals),
+                'supply_groups': supply_groups,
+            })
+
+    return units
+
+
+def run_work_unit(unit):
+    """
+    Run demand once, supply once per group of options, and assess each
+    option, for a work unit.
+
+    Parameters
+    ----------
+    unit : dict
+        The work unit (see plan_work_units).
+
+    Returns
+    -------
+    results : list of tuples
+        (annual_demand, final_results) for each option and confidence
+        interval.
+
+    """
+    global_parameters = WORKER['global_parameters']
+    costs = WORKER['costs']
+    timesteps = WORKER['timesteps']
+
+    country = unit['country']
+    confidence_intervals = unit['confidence_intervals']
+    iso3 = country['iso3']
+
+    country_parameters = COUNTRY_PARAMETERS[iso3]
+    luts = load_country_luts(country)
+
+    results = []
+
+    data_demand = None
+
+    for members in unit['supply_groups']:
+
+        data_supply = None
+
+        for option in members:
+
+            print('Assessing {} and {} in {}'.format(
+                option['scenario'], option['strategy'], iso3))
+
+            option = compile_option(option, country_parameters)
+            strategy = option['strategy'].name
+
+            if data_demand is None:
+
+                demand = estimate_demand_arrays(
+                    luts['columns'],
+                    option,
+                    global_parameters,
+                    country_parameters,
+                    timesteps,
+                    luts['penetration_lut'],
+                    luts['smartphone_lut']
+                )
+
+                #copy, as the demand estimates are written to the regions
+                data_demand = update_regions(
+                    [dict(region) for region in luts['regions']], demand)
+
+                annual_demand = collect_annual_demand(
+                    data_demand,
+                    demand,
+                    option['scenario'].name,
+                    strategy,
+                    global_parameters['confidence'][0],
+                    timesteps
+                )
+
+            if data_supply is None:
+
+                #supply leaves the demand results unchanged, so they are
+                #shared by all groups
+                data_supply = estimate_supply_by_ci(
+                    country,
+                    data_demand,
+                    WORKER['capacity_lut'],
+                    option,
+                    global_parameters,
+                    country_parameters,
+                    costs,
+                    luts['core_lut'],
+                    confidence_intervals
+                )
+
+            for ci in confidence_intervals:
+
+                data_assess = assess(
+                    country,
+                    relabel(data_supply[ci], strategy),
+                    option,
+                    global_parameters,
+                    country_parameters,
+                    timesteps,
+                    costs
+                )
+
+                results.append((annual_demand.relabel(strategy), data_assess))
+
+    return results
+
+
+def run_work_units(units, executor=None, max_pending=None):
+    """
+    Run all work units, in parallel when given an executor, yielding the
+    results of each option as soon as its unit completes (in unit order).
+
+    At most max_pending units are submitted to the executor at once, so only
+    the results of those units (running, or completed but waiting for an
+    earlier unit) are held in memory, along with the unit being yielded.
+
+    Parameters
+    ----------
+    units : list of dicts
+        The work units (see plan_work_units).
+    executor : ProcessPoolExecutor, optional
+        Pool of initialized workers (see init_worker).
+    max_pending : int, optional
+        Maximum number of units submitted at once (defaults to
+        MAX_PENDING_UNITS).
+
+    Yields
+    ------
+    annual_demand : AnnualDemand
+        Annual demand for an option.
+    final_results : list of dicts
+        Regional results for an option.
+
+    """
+    if max_pending is None:
+        max_pending = MAX_PENDING_UNITS
+
+    if executor is None:
+        for unit in units:
+            for annual_demand, final_results in run_work_unit(unit):
+                yield annual_demand, final_results
+        return
+
+    units = iter(units)
+    pending = deque()
+
+    for unit in units:
+        pending.append(executor.submit(run_work_unit, unit))
+        if len(pending) >= max_pending:
+            break
+
+    while pending:
+
+        results = pending.popleft().result()
+
+        for unit in units:
+            pending.append(executor.submit(run_work_unit, unit))
+            break
+
+        for annual_demand, final_results in results:
+            yield annual_demand, final_results
+
+        del results
 
 
 if __name__ == '__main__':
@@ -334,7 +780,8 @@ if __name__ == '__main__':
         }
 
     path = os.path.join(DATA_RAW, 'pysim5g', 'capacity_lut_by_frequency.csv')
-    capacity_lut = read_capacity_lookup(path)
+    folder = os.path.join(DATA_INTERMEDIATE, 'pysim5g')
+    capacity_lut = load_capacity_lookup(path, folder)
 
     countries = [
         {'iso3': 'MWI', 'iso2': 'MW', 'regional_level': 2, 'regional_nodes_level': 2},
@@ -354,101 +801,47 @@ if __name__ == '__main__':
         'mixed_options',
     ]
 
-    all_results = []
-
-    for decision_option in decision_options:
-
-        options = OPTIONS[decision_option]
-
-        regional_annual_demand = []
-        regional_results = []
-        regional_cost_structure = []
-
-        for country in countries:
-
-            iso3 = country['iso3']
-
-            country_parameters = COUNTRY_PARAMETERS[iso3]
-
-            folder = os.path.join(BASE_PATH, '..', 'vis', 'clustering', 'results')
-            filename = 'data_clustering_results.csv'
-            country['cluster'] = load_cluster(os.path.join(folder, filename), iso3)
+    for country in countries:
+        folder = os.path.join(BASE_PATH, '..', 'vis', 'clustering', 'results')
+        filename = 'data_clustering_results.csv'
+        country['cluster'] = load_cluster(os.path.join(folder, filename), country['iso3'])
 
-            folder = os.path.join(DATA_INTERMEDIATE, iso3, 'subscriptions')
-            filename = 'subs_forecast.csv'
-            penetration_lut = load_penetration(os.path.join(folder, filename))
+    initargs = (capacity_lut, GLOBAL_PARAMETERS, COSTS, TIMESTEPS)
 
-            folder = os.path.join(DATA_INTERMEDIATE, iso3, 'smartphones')
-            filename = 'smartphone_forecast.csv'
-            smartphone_lut = load_smartphones(os.path.join(folder, filename))
-
-            folder = os.path.join(DATA_INTERMEDIATE, iso3)
-            filename = 'core_lut.csv'
-            core_lut = load_core_lut(os.path.join(folder, filename))
-
-            print('-----')
-            print('Working on {} in {}'.format(decision_option, iso3))
-            print('-----')
-
-            for option in options:
-
-                print('Assessing {} and {}'.format(option['scenario'], option['strategy']))
-
-                confidence_intervals = GLOBAL_PARAMETERS['confidence']
-
-                for ci in confidence_intervals:
-
-                    path = os.path.join(DATA_INTERMEDIATE, iso3, 'regional_data.csv')
-                    data = load_regions(path)
+    if WORKERS > 1:
+        executor = ProcessPoolExecutor(max_workers=WORKERS,
+            initializer=init_worker, initargs=initargs)
+    else:
+        init_worker(*initargs)
+        executor = None
 
-                    data_initial = data.to_dict('records')
+    folder = os.path.join(BASE_PATH, '..', 'results')
+    all_results = ResultsSink(folder, 'all_options', formats=OUTPUT_FORMATS)
 
-                    data_demand, annual_demand = estimate_demand(
-                        data_initial,
-                        option,
-                        GLOBAL_PARAMETERS,
-                        country_parameters,
-                        TIMESTEPS,
-                        penetration_lut,
-                        smartphone_lut
-                    )
+    for decision_option in decision_options:
 
-                    data_supply = estimate_supply(
-                        country,
-                        data_demand,
-                        capacity_lut,
-                        option,
-                        GLOBAL_PARAMETERS,
-                        country_parameters,
-                        COSTS,
-                        core_lut,
-                        ci
-                    )
+        options = OPTIONS[decision_option]
 
-                    data_assess = assess(
-                        country,
-                        data_supply,
-                        option,
-                        GLOBAL_PARAMETERS,
-                        country_parameters,
-                        TIMESTEPS,
-                        COSTS
-                    )
+        print('-----')
+        print('Working on {}'.format(decision_option))
+        print('-----')
 
-                    final_results = allocate_deciles(data_assess)
+        units = plan_work_units(countries, options, GLOBAL_PARAMETERS['confidence'])
 
-                    regional_annual_demand = regional_annual_demand + annual_demand
-                    regional_results = regional_results + final_results
+        path = os.path.join(folder, '{}_annual_demand_{}.csv'.format(
+            ANNUAL_DEMAND, decision_option))
+        regional_results = ResultsSink(folder, decision_option, path,
+            formats=OUTPUT_FORMATS, annual_demand=ANNUAL_DEMAND)
 
-        folder = os.path.join(BASE_PATH, '..', 'results')
-        path = os.path.join(folder, 'regional_annual_demand_{}.csv'.format(decision_option))
-        write_mno_demand(regional_annual_demand, folder, decision_option, path)
+        for annual_demand, final_results in run_work_units(units, executor):
+            regional_results.add(final_results, annual_demand)
+            all_results.add(final_results)
 
-        write_results(regional_results, folder, decision_option)
+        regional_results.close()
 
-        all_results = all_results + regional_results
+    if executor is not None:
+        executor.shutdown()
 
-    folder = os.path.join(BASE_PATH, '..', 'results')
-    write_results(all_results, folder, 'all_options')
+    all_results.close()
 
     print('Completed model run')
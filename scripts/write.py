@@ -7,27 +7,40 @@ Written by Ed Oughton
 
 """
 import os
+import shutil
+import numpy as np
 import pandas as pd
+from collections import OrderedDict
 
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
 
-def define_deciles(regions):
+
+def define_deciles(population_km2):
     """
-    Allocate deciles to regions.
+    Allocate deciles to regions, from 100 (the least dense) to 0 (the most
+    dense), using eleven population density quantiles.
+
+    Parameters
+    ----------
+    population_km2 : pandas series
+        Population density for each region.
+
+    Returns
+    -------
+    deciles : numpy array
+        The decile of each region (int8), or -1 where the population
+        density is missing.
 
     """
-    regions = regions.sort_values(by='population_km2', ascending=True)
+    codes = pd.qcut(population_km2, q=11, labels=False, duplicates='drop')
 
-    regions['decile'] = regions.groupby([
-        'GID_0',
-        'scenario',
-        'strategy',
-        'confidence'
-    ], as_index=True).population_km2.apply( #cost_per_sp_user
-        pd.qcut, q=11, precision=0,
-        labels=[100,90,80,70,60,50,40,30,20,10,0],
-        duplicates='drop') #   [0,10,20,30,40,50,60,70,80,90,100]
+    deciles = np.where(codes.isnull(), -1, 100 - 10 * codes.fillna(0))
 
-    return regions
+    return deciles.astype('int8')
 
 
 def write_mno_demand(regional_annual_demand, folder, metric, path):
@@ -37,262 +50,437 @@ def write_mno_demand(regional_annual_demand, folder, metric, path):
 
     """
     print('Writing annual_demand')
-    regional_annual_demand = pd.DataFrame(regional_annual_demand)
-    regional_annual_demand = regional_annual_demand[[
-        'GID_0', 'GID_id', 'scenario', 'strategy',
-        'confidence', 'year', 'population', 'area_km2', 'population_km2',
-        'geotype', 'arpu_discounted_monthly', 'penetration', 'population_with_phones',
-        'phones_on_network', 'smartphone_penetration',
-        'smartphones_on_network', 'revenue'
-    ]]
+    regional_annual_demand = get_annual_demand(regional_annual_demand)
 
     regional_annual_demand.to_csv(path, index=False)
 
 
+def aggregate_results(regional_results):
+    """
+    Aggregate regional results into the national, decile and regional
+    results tables.
+
+    The results frame is built once, and each table is selected from it,
+    deduplicated on its own columns and grouped nationally or by decile
+    (allocated when the regions are prepared, see define_deciles).
+
+    Parameters
+    ----------
+    regional_results : list of dicts
+        Results for all regions.
+
+    Returns
+    -------
+    tables : dict
+        Results tables (pandas dfs), by file name.
+
+    """
+    regions = pd.DataFrame(regional_results)
+
+    for column in ['GID_0', 'scenario', 'strategy']:
+        regions[column] = regions[column].astype('category')
+    regions['decile'] = regions['decile'].astype('int8')
+
+    tables = OrderedDict()
+
+    for name, spec in RESULTS_TABLE_SPECS.items():
+
+        level, columns, cost, phones, smartphones = spec[:5]
+
+        #duplicates are dropped on the columns of each table (as regions with
+        #identical results are only counted once)
+        if level == 'national':
+            table = regions[NATIONAL_GROUP + columns].drop_duplicates()
+            table = table.groupby(NATIONAL_GROUP, observed=True)[columns].sum()
+        elif level == 'decile':
+            table = regions[DECILE_GROUP + columns].drop_duplicates()
+            table = table.groupby(DECILE_GROUP, observed=True)[columns].sum()
+        else:
+            table = regions[columns].drop_duplicates()
+
+        if 'population_km2' in spec[5]:
+            table['population_km2'] = table['population'] / table['area_km2']
+        if 'densities' in spec[5]:
+            table['phone_density_on_network_km2'] = (
+                table['phones_on_network'] / table['area_km2'])
+            table['sp_density_on_network_km2'] = (
+                table['smartphones_on_network'] / table['area_km2'])
+            table['total_estimated_sites_km2'] = (
+                table['total_estimated_sites'] / table['area_km2'])
+            table['existing_mno_sites_km2'] = (
+                table['existing_mno_sites'] / table['area_km2'])
+
+        table['cost_per_network_user'] = table[cost] / table[phones]
+        table['cost_per_smartphone_user'] = table[cost] / table[smartphones]
+
+        if 'composition' in spec[5]:
+            prefix = 'total_' if cost == 'total_market_cost' else ''
+            #Calculate private, govt and societal costs
+            table['private_cost'] = table[cost]
+            table['government_cost'] = (
+                table[prefix + 'required_state_subsidy'] -
+                    (table[prefix + 'spectrum_cost'] + table[prefix + 'tax']))
+            table['societal_cost'] = (
+                table['private_cost'] + table['government_cost'])
+
+        tables[name] = table
+
+    return tables
+
+
 def write_results(regional_results, folder, metric):
     """
     Write all results.
 
     """
-    print('Writing national MNO results')
-    national_results = pd.DataFrame(regional_results)
-    national_results = national_results[[
-        'GID_0', 'scenario', 'strategy', 'confidence', 'population', 'area_km2',
-        'phones_on_network', 'smartphones_on_network', 'total_estimated_sites',
-        'existing_mno_sites', 'upgraded_mno_sites', 'new_mno_sites',
-        'total_mno_revenue', 'total_mno_cost',
-    ]]
-    national_results = national_results.drop_duplicates()
-    national_results = national_results.groupby([
-        'GID_0', 'scenario', 'strategy', 'confidence'], as_index=True).sum()
-    national_results['cost_per_network_user'] = (
-        national_results['total_mno_cost'] / national_results['phones_on_network'])
-    national_results['cost_per_smartphone_user'] = (
-        national_results['total_mno_cost'] / national_results['smartphones_on_network'])
-    path = os.path.join(folder,'national_mno_results_{}.csv'.format(metric))
-    national_results.to_csv(path, index=True)
-
-
-    print('Writing national cost composition results')
-    national_cost_results = pd.DataFrame(regional_results)
-    national_cost_results = national_cost_results[[
-        'GID_0', 'scenario', 'strategy', 'confidence', 'population',
-        'phones_on_network', 'smartphones_on_network', 'total_mno_revenue',
-        'ran', 'backhaul_fronthaul', 'civils', 'core_network',
-        'administration', 'spectrum_cost', 'tax', 'profit_margin',
-        'total_mno_cost', 'available_cross_subsidy', 'deficit',
-        'used_cross_subsidy', 'required_state_subsidy',
-    ]]
-    national_cost_results = national_cost_results.drop_duplicates()
-    national_cost_results = national_cost_results.groupby([
-        'GID_0', 'scenario', 'strategy', 'confidence'], as_index=True).sum()
-    national_cost_results['cost_per_network_user'] = (
-        national_cost_results['total_mno_cost'] /
-        national_cost_results['phones_on_network'])
-    national_cost_results['cost_per_smartphone_user'] = (
-        national_cost_results['total_mno_cost'] /
-        national_cost_results['smartphones_on_network'])
-    #Calculate private, govt and societal costs
-    national_cost_results['private_cost'] = national_cost_results['total_mno_cost']
-    national_cost_results['government_cost'] = (
-        national_cost_results['required_state_subsidy'] -
-            (national_cost_results['spectrum_cost'] + national_cost_results['tax']))
-    national_cost_results['societal_cost'] = (
-        national_cost_results['private_cost'] + national_cost_results['government_cost'])
-    path = os.path.join(folder,'national_mno_cost_results_{}.csv'.format(metric))
-    national_cost_results.to_csv(path, index=True)
-
-
-    print('Writing general decile results')
-    decile_results = pd.DataFrame(regional_results)
-    decile_results = define_deciles(decile_results)
-    decile_results = decile_results[[
-        'GID_0', 'scenario', 'strategy', 'decile', 'confidence',
-        'population', 'area_km2', 'phones_on_network',
-        'smartphones_on_network', 'total_estimated_sites',
-        'existing_mno_sites', 'upgraded_mno_sites', 'new_mno_sites',
-        'total_mno_revenue', 'total_mno_cost',
-    ]]
-    decile_results = decile_results.drop_duplicates()
-    decile_results = decile_results.groupby([
-        'GID_0', 'scenario', 'strategy', 'confidence', 'decile'], as_index=True).sum()
-    decile_results['population_km2'] = (
-        decile_results['population'] / decile_results['area_km2'])
-    decile_results['phone_density_on_network_km2'] = (
-        decile_results['phones_on_network'] / decile_results['area_km2'])
-    decile_results['sp_density_on_network_km2'] = (
-        decile_results['smartphones_on_network'] / decile_results['area_km2'])
-    decile_results['total_estimated_sites_km2'] = (
-        decile_results['total_estimated_sites'] / decile_results['area_km2'])
-    decile_results['existing_mno_sites_km2'] = (
-        decile_results['existing_mno_sites'] / decile_results['area_km2'])
-    decile_results['cost_per_network_user'] = (
-        decile_results['total_mno_cost'] / decile_results['phones_on_network'])
-    decile_results['cost_per_smartphone_user'] = (
-        decile_results['total_mno_cost'] / decile_results['smartphones_on_network'])
-    path = os.path.join(folder,'decile_mno_results_{}.csv'.format(metric))
-    decile_results.to_csv(path, index=True)
-
-
-    print('Writing cost decile results')
-    decile_cost_results = pd.DataFrame(regional_results)
-    decile_cost_results = define_deciles(decile_cost_results)
-    decile_cost_results = decile_cost_results[[
-        'GID_0', 'scenario', 'strategy', 'decile', 'confidence',
-        'population', 'area_km2', 'phones_on_network', 'smartphones_on_network',
-        'total_mno_revenue', 'ran', 'backhaul_fronthaul', 'civils', 'core_network',
-        'administration', 'spectrum_cost', 'tax', 'profit_margin', 'total_mno_cost',
-        'available_cross_subsidy', 'deficit', 'used_cross_subsidy',
-        'required_state_subsidy',
-    ]]
-    decile_cost_results = decile_cost_results.drop_duplicates()
-    decile_cost_results = decile_cost_results.groupby([
-        'GID_0', 'scenario', 'strategy', 'confidence', 'decile'], as_index=True).sum()
-    decile_cost_results['cost_per_network_user'] = (
-        decile_cost_results['total_mno_cost'] / decile_cost_results['phones_on_network'])
-    decile_cost_results['cost_per_smartphone_user'] = (
-        decile_cost_results['total_mno_cost'] / decile_cost_results['smartphones_on_network'])
-    path = os.path.join(folder,'decile_mno_cost_results_{}.csv'.format(metric))
-    decile_cost_results.to_csv(path, index=True)
-
-
-    print('Writing regional results')
-    regional_mno_results = pd.DataFrame(regional_results)
-    regional_mno_results = define_deciles(regional_mno_results)
-    regional_mno_results = regional_mno_results[[
-        'GID_0', 'GID_id', 'scenario', 'strategy', 'decile',
-        'confidence', 'population', 'area_km2',
-        'phones_on_network', 'smartphones_on_network',
-        'total_estimated_sites', 'existing_mno_sites',
-        'upgraded_mno_sites', 'new_mno_sites',
-        'total_mno_revenue', 'total_mno_cost',
-    ]]
-    regional_mno_results = regional_mno_results.drop_duplicates()
-    regional_mno_results['cost_per_network_user'] = (
-        regional_mno_results['total_mno_cost'] / regional_mno_results['phones_on_network'])
-    regional_mno_results['cost_per_smartphone_user'] = (
-        regional_mno_results['total_mno_cost'] / regional_mno_results['smartphones_on_network'])
-    path = os.path.join(folder,'regional_mno_results_{}.csv'.format(metric))
-    regional_mno_results.to_csv(path, index=True)
-
-
-    print('Writing national market results')
-    national_results = pd.DataFrame(regional_results)
-    national_results = national_results[[
-        'GID_0', 'scenario', 'strategy', 'confidence', 'population', 'area_km2',
-        'total_phones', 'total_smartphones',
-        'total_estimated_sites',
-        'total_upgraded_sites',
-        'total_new_sites',
-        'total_market_revenue', 'total_market_cost',
-    ]]
-    national_results = national_results.drop_duplicates()
-    national_results = national_results.groupby([
-        'GID_0', 'scenario', 'strategy', 'confidence'], as_index=True).sum()
-    national_results['cost_per_network_user'] = (
-        national_results['total_market_cost'] / national_results['total_phones'])
-    national_results['cost_per_smartphone_user'] = (
-        national_results['total_market_cost'] / national_results['total_smartphones'])
-    path = os.path.join(folder,'national_market_results_{}.csv'.format(metric))
-    national_results.to_csv(path, index=True)
-
-
-    #=cost / market share * 100
-    print('Writing national market cost composition results')
-    national_cost_results = pd.DataFrame(regional_results)
-    national_cost_results = national_cost_results[[
-        'GID_0', 'scenario', 'strategy', 'confidence', 'population',
-        'total_phones', 'total_smartphones',
-        'total_market_revenue', 'total_ran', 'total_backhaul_fronthaul',
-        'total_civils', 'total_core_network',
-        'total_administration', 'total_spectrum_cost',
-        'total_tax', 'total_profit_margin',
-        'total_market_cost', 'total_available_cross_subsidy',
-        'total_deficit', 'total_used_cross_subsidy',
-        'total_required_state_subsidy',
-    ]]
-    national_cost_results = national_cost_results.drop_duplicates()
-    national_cost_results = national_cost_results.groupby([
-        'GID_0', 'scenario', 'strategy', 'confidence'], as_index=True).sum()
-    national_cost_results['cost_per_network_user'] = (
-        national_cost_results['total_market_cost'] / national_cost_results['total_phones'])
-    national_cost_results['cost_per_smartphone_user'] = (
-        national_cost_results['total_market_cost'] / national_cost_results['total_smartphones'])
-    #Calculate private, govt and societal costs
-    national_cost_results['private_cost'] = (
-        national_cost_results['total_market_cost'])
-    national_cost_results['government_cost'] = (
-        national_cost_results['total_required_state_subsidy'] -
-            (national_cost_results['total_spectrum_cost'] + national_cost_results['total_tax']))
-    national_cost_results['societal_cost'] = (
-        national_cost_results['private_cost'] + national_cost_results['government_cost'])
-    path = os.path.join(folder,'national_market_cost_results_{}.csv'.format(metric))
-    national_cost_results.to_csv(path, index=True)
-
-
-    print('Writing general decile results')
-    decile_results = pd.DataFrame(regional_results)
-    decile_results = define_deciles(decile_results)
-    decile_results = decile_results[[
-        'GID_0', 'scenario', 'strategy', 'decile', 'confidence',
+    tables = aggregate_results(regional_results)
+
+    for name, table in tables.items():
+        print('Writing {}'.format(name))
+        path = os.path.join(folder, '{}_{}.csv'.format(name, metric))
+        table.to_csv(path, index=True)
+
+
+class ResultsSink(object):
+    """
+    Write results incrementally, one batch (a country, option and confidence
+    interval) at a time.
+
+    Regional and annual demand results are appended to disk as each batch
+    arrives. Every batch is a single GID_0, scenario, strategy and
+    confidence group, so aggregating batches separately gives the same
+    national and decile results as aggregating all results at once.
+    Repeated batches (e.g. an option shared by several decision options)
+    are only written once.
+
+    What remains in memory until close is the aggregated national and decile
+    rows of each batch (one national row and up to eleven decile rows per
+    table, so they are sorted and written together), and the keys of the
+    batches seen.
+
+    Parameters
+    ----------
+    folder : string
+        Folder to write the results to.
+    metric : string
+        Name of the results set (e.g. the decision option).
+    demand_path : string, optional
+        Path to write annual demand results to (as .csv).
+    formats : list, optional
+        Output formats: 'csv', and/or 'parquet' or 'arrow' (Arrow IPC) for
+        datasets (in folder/<format>/<table>) partitioned by decision_option,
+        GID_0 and strategy.
+    annual_demand : string, optional
+        Write annual demand for each region ('regional'), or only the
+        national totals for each year ('national').
+
+    """
+    def __init__(self, folder, metric, demand_path=None, formats=('csv',),
+        annual_demand='regional'):
+
+        if annual_demand not in ANNUAL_DEMAND_LEVELS:
+            raise ValueError('Did not recognise annual demand level {}'.format(
+                annual_demand))
+
+        for output_format in formats:
+            if output_format not in OUTPUT_FORMATS:
+                raise ValueError('Did not recognise output format {}'.format(
+                    output_format))
+            if output_format != 'csv' and pyarrow is None:
+                raise ImportError('pyarrow is required for {} output'.format(
+                    output_format))
+
+        self.folder = folder
+        self.metric = metric
+        self.demand_path = demand_path
+        self.formats = list(formats)
+        self.annual_demand = annual_demand
+        self.demand_table = '{}_annual_demand'.format(annual_demand)
+        self.batches = set()
+        self.aggregates = OrderedDict()
+        self.offsets = {}
+
+        #start new files, rather than appending to results of a previous run
+        if 'csv' in self.formats:
+            for name in REGIONAL_TABLES:
+                path = self.get_path(name)
+                if os.path.exists(path):
+                    os.remove(path)
+
+            if demand_path is not None and os.path.exists(demand_path):
+                os.remove(demand_path)
+
+        if any(output_format != 'csv' for output_format in self.formats):
+            names = list(RESULTS_TABLE_SPECS)
+            if demand_path is not None:
+                names.append(self.demand_table)
+
+            for output_format in self.formats:
+                for name in names:
+                    path = self.get_partition_folder(output_format, name)
+                    if output_format != 'csv' and os.path.exists(path):
+                        shutil.rmtree(path)
+
+    def get_path(self, name):
+        """
+        Return the path of a results table.
+
+        """
+        return os.path.join(self.folder, '{}_{}.csv'.format(name, self.metric))
+
+    def get_partition_folder(self, output_format, name, gid_0=None, strategy=None):
+        """
+        Return the folder of a partition of a columnar results dataset.
+
+        """
+        parts = [self.folder, output_format, name,
+            'decision_option={}'.format(self.metric)]
+
+        if gid_0 is not None:
+            parts.append('GID_0={}'.format(gid_0))
+        if strategy is not None:
+            parts.append('strategy={}'.format(strategy))
+
+        return os.path.join(*parts)
+
+    def write_partitions(self, name, data, filename):
+        """
+        Write a pandas df to the columnar datasets, one file per GID_0 and
+        strategy partition.
+
+        """
+        for output_format in self.formats:
+
+            if output_format == 'csv':
+                continue
+
+            for (gid_0, strategy), partition in data.groupby(
+                ['GID_0', 'strategy'], sort=False):
+
+                folder = self.get_partition_folder(output_format, name,
+                    gid_0, strategy)
+                if not os.path.exists(folder):
+                    os.makedirs(folder)
+
+                path = os.path.join(folder, '{}.{}'.format(filename, output_format))
+
+                partition = partition.drop(columns=['GID_0', 'strategy'])
+                write_columnar(partition, path, output_format)
+
+    def add(self, regional_results, regional_annual_demand=None):
+        """
+        Add the results of a batch.
+
+        Parameters
+        ----------
+        regional_results : list of dicts
+            Results for all regions in the batch.
+        regional_annual_demand : AnnualDemand, optional
+            Annual demand results for all regions in the batch.
+
+        """
+        if len(regional_results) == 0:
+            return
+
+        first = regional_results[0]
+        batch = (first['GID_0'], first['scenario'], first['strategy'],
+            first['confidence'])
+
+        if batch in self.batches:
+            return
+        self.batches.add(batch)
+
+        filename = '{}_{}'.format(first['scenario'], first['confidence'])
+
+        if self.demand_path is not None and regional_annual_demand:
+            demand = get_annual_demand(regional_annual_demand, self.annual_demand)
+            if 'csv' in self.formats:
+                append_csv(demand, self.demand_path, index=False)
+            self.write_partitions(self.demand_table, demand, filename)
+
+        tables = aggregate_results(regional_results)
+
+        for name, table in tables.items():
+            if name in REGIONAL_TABLES:
+                #keep row labels unique across batches
+                offset = self.offsets.get(name, 0)
+                self.offsets[name] = offset + len(regional_results)
+                table.index = table.index + offset
+                if 'csv' in self.formats:
+                    append_csv(table, self.get_path(name), index=True)
+                self.write_partitions(name, table.reset_index(drop=True), filename)
+            else:
+                if name not in self.aggregates:
+                    self.aggregates[name] = []
+                self.aggregates[name].append(table)
+
+    def close(self):
+        """
+        Write the national and decile results tables.
+
+        """
+        for name, tables in self.aggregates.items():
+            print('Writing {}'.format(name))
+            table = pd.concat(tables).sort_index()
+            if 'csv' in self.formats:
+                table.to_csv(self.get_path(name), index=True)
+            self.write_partitions(name, table.reset_index(), 'results')
+
+        self.aggregates = OrderedDict()
+
+
+def get_annual_demand(annual_demand, level='regional'):
+    """
+    Return annual demand as a pandas df, for each region or as national
+    totals for each year.
+
+    Parameters
+    ----------
+    annual_demand : AnnualDemand
+        Annual demand for all regions.
+    level : string, optional
+        'regional' or 'national'.
+
+    Returns
+    -------
+    annual_demand : pandas df
+        The annual demand table.
+
+    """
+    if level == 'national':
+        annual_demand = pd.DataFrame(annual_demand.national())
+    else:
+        annual_demand = pd.DataFrame(annual_demand.to_columns())
+
+    if level == 'national':
+        return annual_demand[NATIONAL_ANNUAL_DEMAND_COLUMNS]
+
+    return annual_demand[ANNUAL_DEMAND_COLUMNS]
+
+
+def append_csv(data, path, index):
+    """
+    Append a pandas df to a .csv, writing the header if the file is new.
+
+    """
+    header = not os.path.exists(path)
+
+    data.to_csv(path, mode='a', header=header, index=index)
+
+
+def write_columnar(data, path, output_format):
+    """
+    Write a pandas df to a Parquet or Arrow IPC file, with the scenario
+    column dictionary-encoded.
+
+    """
+    data = data.copy()
+    data['scenario'] = data['scenario'].astype('category')
+
+    table = pyarrow.Table.from_pandas(data, preserve_index=False)
+
+    if output_format == 'parquet':
+        pyarrow.parquet.write_table(table, path)
+    else:
+        with pyarrow.OSFile(path, 'wb') as sink:
+            writer = pyarrow.ipc.new_file(sink, table.schema)
+            writer.write_table(table)
+            writer.close()
+
+
+OUTPUT_FORMATS = ['csv', 'parquet', 'arrow']
+
+ANNUAL_DEMAND_LEVELS = ['regional', 'national']
+
+ANNUAL_DEMAND_COLUMNS = [
+    'GID_0', 'GID_id', 'scenario', 'strategy',
+    'confidence', 'year', 'population', 'area_km2', 'population_km2',
+    'geotype', 'arpu_discounted_monthly', 'penetration', 'population_with_phones',
+    'phones_on_network', 'smartphone_penetration',
+    'smartphones_on_network', 'revenue'
+]
+
+NATIONAL_ANNUAL_DEMAND_COLUMNS = [
+    'GID_0', 'scenario', 'strategy', 'confidence', 'year',
+    'population', 'area_km2', 'population_with_phones',
+    'phones_on_network', 'smartphones_on_network', 'revenue'
+]
+
+#tables with one row per region, which are streamed to disk
+REGIONAL_TABLES = ['regional_mno_results', 'regional_market_results']
+
+NATIONAL_GROUP = ['GID_0', 'scenario', 'strategy', 'confidence']
+
+DECILE_GROUP = ['GID_0', 'scenario', 'strategy', 'confidence', 'decile']
+
+MNO_COLUMNS = [
+    'population', 'area_km2', 'phones_on_network', 'smartphones_on_network',
+    'total_estimated_sites', 'existing_mno_sites', 'upgraded_mno_sites',
+    'new_mno_sites', 'total_mno_revenue', 'total_mno_cost',
+]
+
+MNO_COST_COLUMNS = [
+    'phones_on_network', 'smartphones_on_network', 'total_mno_revenue',
+    'ran', 'backhaul_fronthaul', 'civils', 'core_network',
+    'administration', 'spectrum_cost', 'tax', 'profit_margin',
+    'total_mno_cost', 'available_cross_subsidy', 'deficit',
+    'used_cross_subsidy', 'required_state_subsidy',
+]
+
+MARKET_COST_COLUMNS = [
+    'total_phones', 'total_smartphones',
+    'total_market_revenue', 'total_ran', 'total_backhaul_fronthaul',
+    'total_civils', 'total_core_network',
+    'total_administration', 'total_spectrum_cost',
+    'total_tax', 'total_profit_margin',
+    'total_market_cost', 'total_available_cross_subsidy',
+    'total_deficit', 'total_used_cross_subsidy',
+    'total_required_state_subsidy',
+]
+
+#name: (level, columns, cost, phones, smartphones, derived columns)
+RESULTS_TABLE_SPECS = OrderedDict([
+    ('national_mno_results', ('national', MNO_COLUMNS,
+        'total_mno_cost', 'phones_on_network', 'smartphones_on_network', [])),
+    ('national_mno_cost_results', ('national', ['population'] + MNO_COST_COLUMNS,
+        'total_mno_cost', 'phones_on_network', 'smartphones_on_network',
+        ['composition'])),
+    ('decile_mno_results', ('decile', MNO_COLUMNS,
+        'total_mno_cost', 'phones_on_network', 'smartphones_on_network',
+        ['population_km2', 'densities'])),
+    ('decile_mno_cost_results', ('decile',
+        ['population', 'area_km2'] + MNO_COST_COLUMNS,
+        'total_mno_cost', 'phones_on_network', 'smartphones_on_network', [])),
+    ('regional_mno_results', ('regional',
+        ['GID_0', 'GID_id', 'scenario', 'strategy', 'decile', 'confidence']
+            + MNO_COLUMNS,
+        'total_mno_cost', 'phones_on_network', 'smartphones_on_network', [])),
+    ('national_market_results', ('national', [
+        'population', 'area_km2', 'total_phones', 'total_smartphones',
+        'total_estimated_sites', 'total_upgraded_sites', 'total_new_sites',
+        'total_market_revenue', 'total_market_cost'],
+        'total_market_cost', 'total_phones', 'total_smartphones', [])),
+    ('national_market_cost_results', ('national',
+        ['population'] + MARKET_COST_COLUMNS,
+        'total_market_cost', 'total_phones', 'total_smartphones',
+        ['composition'])),
+    ('decile_market_results', ('decile', [
         'population', 'area_km2', 'total_phones', 'total_smartphones',
-        'total_market_revenue', 'total_market_cost',
-    ]]
-    decile_results = decile_results.drop_duplicates()
-    decile_results = decile_results.groupby([
-        'GID_0', 'scenario', 'strategy', 'confidence', 'decile'], as_index=True).sum()
-    decile_results['population_km2'] = (
-        decile_results['population'] / decile_results['area_km2'])
-    decile_results['cost_per_network_user'] = (
-        decile_results['total_market_cost'] / decile_results['total_phones'])
-    decile_results['cost_per_smartphone_user'] = (
-        decile_results['total_market_cost'] / decile_results['total_smartphones'])
-    path = os.path.join(folder,'decile_market_results_{}.csv'.format(metric))
-    decile_results.to_csv(path, index=True)
-
-
-    print('Writing cost decile results')
-    decile_cost_results = pd.DataFrame(regional_results)
-    decile_cost_results = define_deciles(decile_cost_results)
-    decile_cost_results = decile_cost_results[[
-        'GID_0', 'scenario', 'strategy', 'decile', 'confidence',
+        'total_market_revenue', 'total_market_cost'],
+        'total_market_cost', 'total_phones', 'total_smartphones',
+        ['population_km2'])),
+    ('decile_market_cost_results', ('decile',
+        ['population', 'area_km2'] + MARKET_COST_COLUMNS,
+        'total_market_cost', 'total_phones', 'total_smartphones', [])),
+    ('regional_market_results', ('regional', [
+        'GID_0', 'GID_id', 'scenario', 'strategy', 'decile', 'confidence',
         'population', 'area_km2', 'total_phones', 'total_smartphones',
-        'total_market_revenue', 'total_ran', 'total_backhaul_fronthaul',
-        'total_civils', 'total_core_network',
-        'total_administration', 'total_spectrum_cost', 'total_tax',
-        'total_profit_margin', 'total_market_cost',
-        'total_available_cross_subsidy', 'total_deficit',
-        'total_used_cross_subsidy', 'total_required_state_subsidy'
-    ]]
-    decile_cost_results = decile_cost_results.drop_duplicates()
-    decile_cost_results = decile_cost_results.groupby([
-        'GID_0', 'scenario', 'strategy', 'confidence', 'decile'], as_index=True).sum()
-    decile_cost_results['cost_per_network_user'] = (
-        decile_cost_results['total_market_cost'] /
-        decile_cost_results['total_phones'])
-    decile_cost_results['cost_per_smartphone_user'] = (
-        decile_cost_results['total_market_cost'] /
-        decile_cost_results['total_smartphones'])
-    path = os.path.join(folder,'decile_market_cost_results_{}.csv'.format(metric))
-    decile_cost_results.to_csv(path, index=True)
-
-
-    print('Writing regional results')
-    regional_market_results = pd.DataFrame(regional_results)
-    regional_market_results = define_deciles(regional_market_results)
-    regional_market_results = regional_market_results[[
-        'GID_0', 'GID_id', 'scenario', 'strategy', 'decile',
-        'confidence', 'population', 'area_km2',
-        'total_phones', 'total_smartphones',
-        'total_upgraded_sites','total_new_sites',
-        'total_market_revenue', 'total_market_cost',
-    ]]
-    regional_market_results = regional_market_results.drop_duplicates()
-    regional_market_results['cost_per_network_user'] = (
-        regional_market_results['total_market_cost'] /
-        regional_market_results['total_phones'])
-    regional_market_results['cost_per_smartphone_user'] = (
-        regional_market_results['total_market_cost'] /
-        regional_market_results['total_smartphones'])
-    path = os.path.join(folder,'regional_market_results_{}.csv'.format(metric))
-    regional_market_results.to_csv(path, index=True)
+        'total_upgraded_sites', 'total_new_sites',
+        'total_market_revenue', 'total_market_cost'],
+        'total_market_cost', 'total_phones', 'total_smartphones', [])),
+])
+
+#all columns used by the results tables
+REGIONAL_COLUMNS = list(OrderedDict.fromkeys(
+    DECILE_GROUP + ['GID_id'] + [column for spec in RESULTS_TABLE_SPECS.values()
+        for column in spec[1]]))
@@ -6,12 +6,21 @@ Written by Ed Oughton.
 Winter 2020
 
 """
+import numpy as np
+
+from pytal.financials import get_financial_factors
+from pytal.strategy import parse_strategy
+
 
 def assess(country, regions, option, global_parameters, country_parameters,
     timesteps, costs):
     """
     For each region, assess the viability level.
 
+    Costs are calculated for all regions at once, and the capital available
+    for cross-subsidization is allocated to regions in order of increasing
+    deficit (see allocate_cross_subsidy).
+
     Parameters
     ----------
     country : dict
@@ -38,63 +47,141 @@ def assess(country, regions, option, global_parameters, country_parameters,
         Contains all output data (one dict per region).
 
     """
-    interim = []
+    if len(regions) == 0:
+        return []
+
+    strategy = parse_strategy(option['strategy'])
+    financials = country_parameters['financials']
+    factors = get_financial_factors(global_parameters, timesteps=timesteps)
+
+    network_cost = get_column(regions, 'network_cost')
+    revenue = get_column(regions, 'total_mno_revenue')
+    smartphones = get_column(regions, 'smartphones_on_network')
+    population = np.round(get_column(regions, 'population'))
+
+    # add administration cost
+    administration = (
+        network_cost *
+        (financials['administration_percentage_of_network_cost'] / 100) *
+        factors.timestep_annuity)
+
+    # npv spectrum cost
+    spectrum_cost = 0
+    for unit_cost in get_spectrum_unit_costs(strategy, country_parameters):
+        spectrum_cost = spectrum_cost + unit_cost * population
+
+    #tax on investment
+    tax = np.trunc(network_cost * (get_tax_rate(strategy, country_parameters) / 100))
+
+    #profit margin value calculated on all costs + taxes
+    profit_margin = network_cost * (financials['profit_margin'] / 100)
+
+    total_mno_cost = (
+        network_cost +
+        administration +
+        spectrum_cost +
+        tax +
+        profit_margin
+    )
 
-    strategy = option['strategy']
-    available_for_cross_subsidy = 0
+    #avoid zero division
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cost_per_sp_user = np.where(
+            (total_mno_cost > 0) & (smartphones > 0),
+            total_mno_cost / smartphones, 0)
+
+    #apply cross subsidy
+    difference = revenue - total_mno_cost
+    available_cross_subsidy = np.where(difference > 0, difference, 0)
+    deficit = np.where(difference > 0, 0, np.abs(difference))
+
+    used_cross_subsidy = allocate_cross_subsidy(
+        np.cumsum(available_cross_subsidy)[-1], deficit)
+
+    required_state_subsidy = np.maximum(
+        total_mno_cost - (revenue + used_cross_subsidy), 0)
+
+    columns = {
+        'administration': administration,
+        'spectrum_cost': spectrum_cost,
+        'tax': tax.astype('int64'),
+        'profit_margin': profit_margin,
+        'total_mno_cost': total_mno_cost,
+        'cost_per_sp_user': cost_per_sp_user,
+        'available_cross_subsidy': available_cross_subsidy,
+        'deficit': deficit,
+        'used_cross_subsidy': used_cross_subsidy,
+        'required_state_subsidy': required_state_subsidy,
+    }
+    columns = {key: np.broadcast_to(value, network_cost.shape).tolist()
+        for key, value in columns.items()}
 
-    for region in regions:
+    intermediate_regions = []
 
-        # add administration cost
-        region = get_administration_cost(region, country_parameters,
-            global_parameters, timesteps)
+    for idx in np.argsort(deficit, kind='stable'):
+        region = regions[idx]
+        for key, values in columns.items():
+            region[key] = values[idx]
+        intermediate_regions.append(region)
 
-        # npv spectrum cost
-        region['spectrum_cost'] = get_spectrum_costs(region, option['strategy'],
-            global_parameters, country_parameters)
+    output = calculate_total_market_costs(
+        intermediate_regions, option, country_parameters)
 
-        #tax on investment
-        region['tax'] = calculate_tax(region, strategy, country_parameters)
+    return output#, total_market_costs
 
-        #profit margin value calculated on all costs + taxes
-        region['profit_margin'] = calculate_profit(region, country_parameters)
 
-        region['total_mno_cost'] = (
-            region['network_cost'] +
-            region['administration'] +
-            region['spectrum_cost'] +
-            region['tax'] +
-            region['profit_margin']
-        )
+def get_column(regions, metric):
+    """
+    Return a metric for all regions as an array.
 
-        #avoid zero division
-        if region['total_mno_cost'] > 0 and region['smartphones_on_network'] > 0:
-            region['cost_per_sp_user'] = (
-                region['total_mno_cost'] / region['smartphones_on_network'])
-        else:
-            region['cost_per_sp_user'] = 0
+    Parameters
+    ----------
+    regions : list of dicts
+        Data for all regions (one dict per region).
+    metric : string
+        The metric to return.
 
-        #apply cross subsidy
-        region = allocate_available_excess(region)
-        available_for_cross_subsidy += region['available_cross_subsidy']
+    Returns
+    -------
+    values : numpy array
+        The metric for each region.
 
-        interim.append(region)
+    """
+    return np.array([region[metric] for region in regions], dtype='float64')
 
-    interim = sorted(interim, key=lambda k: k['deficit'], reverse=False)
 
-    intermediate_regions = []
+def allocate_cross_subsidy(available_for_cross_subsidy, deficit):
+    """
+    Allocate the capital available for cross-subsidization to regions
+    in order of increasing deficit, until it is exhausted.
 
-    for region in interim:
+    This gives the same result as applying estimate_subsidies to each
+    region in turn: the capital remaining before each region is the
+    running difference of the available capital and the deficits of all
+    preceding regions, and each region uses this, clipped to its deficit.
 
-        region, available_for_cross_subsidy = estimate_subsidies(
-            region, available_for_cross_subsidy)
+    Parameters
+    ----------
+    available_for_cross_subsidy : float
+        The amount of capital available for cross-subsidization.
+    deficit : numpy array
+        The deficit of each region.
 
-        intermediate_regions.append(region)
+    Returns
+    -------
+    used_cross_subsidy : numpy array
+        The cross-subsidy used by each region.
 
-    output = calculate_total_market_costs(
-        intermediate_regions, option, country_parameters)
+    """
+    order = np.argsort(deficit, kind='stable')
 
-    return output#, total_market_costs
+    remaining = np.subtract.accumulate(
+        np.concatenate([[available_for_cross_subsidy], deficit[order]]))
+
+    used_cross_subsidy = np.empty_like(deficit)
+    used_cross_subsidy[order] = np.clip(remaining[:-1], 0, deficit[order])
+
+    return used_cross_subsidy
 
 
 def get_administration_cost(region, country_parameters, global_parameters, timesteps):
@@ -119,17 +206,9 @@ def get_administration_cost(region, country_parameters, global_parameters, times
         (country_parameters['financials']['administration_percentage_of_network_cost'] /
         100))
 
-    costs = []
-
-    for timestep in timesteps:
+    factors = get_financial_factors(global_parameters, timesteps=timesteps)
 
-        timestep = timestep - 2020
-
-        discounted_cost = discount_admin_cost(annual_cost, timestep, global_parameters)
-
-        costs.append(discounted_cost)
-
-    region['administration'] = sum(costs)
+    region['administration'] = annual_cost * factors.timestep_annuity
 
     return region
 
@@ -144,7 +223,7 @@ def get_spectrum_costs(region, strategy, global_parameters, country_parameters):
     ----------
     region : dict
         Contains all regional data.
-    strategy : dict
+    strategy : string or Strategy
         Controls the strategy variants being tested in the model and is
         defined based on the type of technology generation, core and
         backhaul, and the level of sharing, subsidy, spectrum and tax.
@@ -161,11 +240,38 @@ def get_spectrum_costs(region, strategy, global_parameters, country_parameters):
 
     """
     population = int(round(region['population']))
-    frequencies = country_parameters['frequencies']
-    generation = strategy.split('_')[0]
-    frequencies = frequencies[generation]
 
-    spectrum_cost = strategy.split('_')[5]
+    all_costs = []
+
+    for unit_cost in get_spectrum_unit_costs(strategy, country_parameters):
+        all_costs.append(unit_cost * population)
+
+    return sum(all_costs)
+
+
+def get_spectrum_unit_costs(strategy, country_parameters):
+    """
+    Calculate the spectrum cost per person of each frequency used.
+
+    Parameters
+    ----------
+    strategy : string or Strategy
+        Controls the strategy variants being tested in the model and is
+        defined based on the type of technology generation, core and
+        backhaul, and the level of sharing, subsidy, spectrum and tax.
+    country_parameters : dict
+        All country specific parameters.
+
+    Returns
+    ------
+    unit_costs : list
+        The spectrum cost per person of each frequency.
+
+    """
+    strategy = parse_strategy(strategy)
+    frequencies = strategy.get_frequencies(country_parameters)
+
+    spectrum_cost = strategy.spectrum
 
     coverage_spectrum_cost = 'spectrum_coverage_baseline_usd_mhz_pop'
     capacity_spectrum_cost = 'spectrum_capacity_baseline_usd_mhz_pop'
@@ -190,7 +296,7 @@ def get_spectrum_costs(region, strategy, global_parameters, country_parameters):
             capacity_cost_usd_mhz_pop *
             (1 + (country_parameters['financials']['spectrum_cost_high'] / 100)))
 
-    all_costs = []
+    unit_costs = []
 
     for frequency in frequencies:
 
@@ -199,18 +305,11 @@ def get_spectrum_costs(region, strategy, global_parameters, country_parameters):
         bandwidth_total = channel_number * channel_bandwidth
 
         if frequency['frequency'] < 1000:
-
-            cost = (
-                coverage_cost_usd_mhz_pop * bandwidth_total *
-                population)
-            all_costs.append(cost)
+            unit_costs.append(coverage_cost_usd_mhz_pop * bandwidth_total)
         else:
-            cost = (
-                capacity_cost_usd_mhz_pop * bandwidth_total *
-                population)
-            all_costs.append(cost)
+            unit_costs.append(capacity_cost_usd_mhz_pop * bandwidth_total)
 
-    return sum(all_costs)
+    return unit_costs
 
 
 def calculate_tax(region, strategy, country_parameters):
@@ -221,7 +320,7 @@ def calculate_tax(region, strategy, country_parameters):
     ----------
     region : dict
         Contains all regional data.
-    strategy : dict
+    strategy : string or Strategy
         Controls the strategy variants being tested in the model and is
         defined based on the type of technology generation, core and
         backhaul, and the level of sharing, subsidy, spectrum and tax.
@@ -235,10 +334,7 @@ def calculate_tax(region, strategy, country_parameters):
         Quantity of tax.
 
     """
-    tax_rate = strategy.split('_')[6]
-    tax_rate = 'tax_{}'.format(tax_rate)
-
-    tax_rate = country_parameters['financials'][tax_rate]
+    tax_rate = get_tax_rate(strategy, country_parameters)
 
     investment = region['network_cost']
 
@@ -247,6 +343,28 @@ def calculate_tax(region, strategy, country_parameters):
     return int(tax)
 
 
+def get_tax_rate(strategy, country_parameters):
+    """
+    Return the tax rate (%) for the taxation strategy.
+
+    Parameters
+    ----------
+    strategy : string or Strategy
+        The strategy being tested.
+    country_parameters : dict
+        All country specific parameters.
+
+    Return
+    ------
+    tax_rate : float
+        The tax rate (%).
+
+    """
+    tax_rate = 'tax_{}'.format(parse_strategy(strategy).tax)
+
+    return country_parameters['financials'][tax_rate]
+
+
 def calculate_profit(region, country_parameters):
     """
     Estimate the quantity of profit.
@@ -347,39 +465,47 @@ def estimate_subsidies(region, available_for_cross_subsidy):
     return region, available_for_cross_subsidy
 
 
-def discount_admin_cost(cost, timestep, global_parameters):
+def calculate_total_market_costs(regions, option, country_parameters):
     """
-    Discount admin cost based on return period.
+    Calculate the costs for all Mobile Network Operators (MNOs).
 
-    192,744 = 23,773 / (1 + 0.05) ** (0:9)
 
     Parameters
     ----------
-    cost : float
-        Annual admin network running cost.
-    timestep : int
-        Time period (year) to discount against.
-    global_parameters : dict
-        All global model parameters.
+    regions : list of dicts
+        Data for all regions (one dict per region).
+    option : dict
+        The strategy options being tested.
+    country_parameters : dict
+        All country specific parameters.
 
     Returns
     -------
-    discounted_cost : float
-        The discounted admin cost over the desired time period.
+    output : list of dicts
+        Data for all regions (one dict per region).
 
     """
-    discount_rate = global_parameters['discount_rate'] / 100
+    columns = get_total_market_costs(regions, option, country_parameters)
+
+    columns = {key: values.tolist() for key, values in columns.items()}
 
-    discounted_cost = cost / (1 + discount_rate) ** timestep
+    output = []
 
-    return discounted_cost
+    for idx, region in enumerate(regions):
 
+        for key, values in columns.items():
+            region[key] = values[idx]
 
-def calculate_total_market_costs(regions, option, country_parameters):
-    """
-    Calculate the costs for all Mobile Network Operators (MNOs).
+        output.append(region)
+
+    return output
 
 
+def get_total_market_costs(regions, option, country_parameters):
+    """
+    Scale the metrics of a single MNO to the whole market, for all regions
+    and metrics at once, as round((value / market share) * 100).
+
     Parameters
     ----------
     regions : list of dicts
@@ -391,47 +517,33 @@ def calculate_total_market_costs(regions, option, country_parameters):
 
     Returns
     -------
-    output : list of dicts
-        Data for all regions (one dict per region).
+    columns : dict
+        The market totals (int arrays, zero where a metric is missing),
+        e.g. total_phones, for all regions.
 
     """
-    output = []
-
-    # generation_core_backhaul_sharing_networks_spectrum_tax
-    network_strategy = option['strategy'].split('_')[4]
+    strategy = parse_strategy(option['strategy'])
 
+    #market share of each geotype, computed once per geotype
+    market_shares = {}
     for region in regions:
-
         geotype = region['geotype'].split(' ')[0]
+        if geotype not in market_shares:
+            networks = strategy.get_networks(geotype, country_parameters)
+            market_shares[geotype] = 100 / networks
 
-        net_handle = network_strategy + '_' + geotype
-        networks = country_parameters['networks'][net_handle]
-
-        ms = 100 / networks
-
-        region['total_phones'] = calc(region, 'phones_on_network', ms)
-        region['total_smartphones'] = calc(region, 'smartphones_on_network', ms)
-        region['total_market_revenue'] = calc(region, 'total_mno_revenue', ms)
-        region['total_upgraded_sites'] = calc(region, 'upgraded_mno_sites', ms)
-        region['total_new_sites'] = calc(region, 'new_mno_sites', ms)
-        region['total_ran'] = calc(region, 'ran', ms)
-        region['total_backhaul_fronthaul'] = calc(region, 'backhaul_fronthaul', ms)
-        region['total_civils'] = calc(region, 'civils', ms)
-        region['total_core_network'] = calc(region, 'core_network', ms)
-        region['total_network_cost'] = calc(region, 'network_cost', ms)
-        region['total_administration'] = calc(region, 'administration', ms)
-        region['total_spectrum_cost'] = calc(region, 'spectrum_cost', ms)
-        region['total_tax'] = calc(region, 'tax', ms)
-        region['total_profit_margin'] = calc(region, 'profit_margin', ms)
-        region['total_market_cost'] = calc(region, 'total_mno_cost', ms)
-        region['total_available_cross_subsidy'] = calc(region, 'available_cross_subsidy', ms)
-        region['total_deficit'] = calc(region, 'deficit', ms)
-        region['total_used_cross_subsidy'] = calc(region, 'used_cross_subsidy', ms)
-        region['total_required_state_subsidy'] = calc(region, 'required_state_subsidy', ms)
+    ms = np.array([market_shares[region['geotype'].split(' ')[0]]
+        for region in regions], dtype='float64')
 
-        output.append(region)
+    metrics = [metric for key, metric in MARKET_METRICS]
 
-    return output
+    values = np.array([[region.get(metric, np.nan) for metric in metrics]
+        for region in regions], dtype='float64').reshape(len(regions), len(metrics))
+
+    totals = np.round((values / ms[:, None]) * 100)
+    totals = np.where(np.isnan(values), 0, totals).astype('int64')
+
+    return {key: totals[:, idx] for idx, (key, metric) in enumerate(MARKET_METRICS)}
 
 
 def calc(region, metric, ms):
@@ -453,3 +565,27 @@ def calc(region, metric, ms):
         return round((value / ms) * 100)
     else:
         return 0
+
+
+#market total (all MNOs) and the single MNO metric it is scaled from
+MARKET_METRICS = [
+    ('total_phones', 'phones_on_network'),
+    ('total_smartphones', 'smartphones_on_network'),
+    ('total_market_revenue', 'total_mno_revenue'),
+    ('total_upgraded_sites', 'upgraded_mno_sites'),
+    ('total_new_sites', 'new_mno_sites'),
+    ('total_ran', 'ran'),
+    ('total_backhaul_fronthaul', 'backhaul_fronthaul'),
+    ('total_civils', 'civils'),
+    ('total_core_network', 'core_network'),
+    ('total_network_cost', 'network_cost'),
+    ('total_administration', 'administration'),
+    ('total_spectrum_cost', 'spectrum_cost'),
+    ('total_tax', 'tax'),
+    ('total_profit_margin', 'profit_margin'),
+    ('total_market_cost', 'total_mno_cost'),
+    ('total_available_cross_subsidy', 'available_cross_subsidy'),
+    ('total_deficit', 'deficit'),
+    ('total_used_cross_subsidy', 'used_cross_subsidy'),
+    ('total_required_state_subsidy', 'required_state_subsidy'),
+]
@@ -9,8 +9,12 @@ https://github.com/edwardoughton/pysim5g
 """
 import math
 from itertools import tee
+from collections import namedtuple
 import collections, functools, operator
 
+from pytal.financials import get_financial_factors
+from pytal.strategy import parse_strategy
+
 def find_single_network_cost(region, option, costs, global_parameters,
     country_parameters, core_lut):
     """
@@ -41,10 +45,10 @@ def find_single_network_cost(region, option, costs, global_parameters,
         Contains all regional data.
 
     """
-    strategy = option['strategy']
-    generation = strategy.split('_')[0]
-    core = strategy.split('_')[1]
-    backhaul = strategy.split('_')[2]
+    strategy = parse_strategy(option['strategy'])
+    generation = strategy.generation
+    core = strategy.core
+    backhaul = strategy.backhaul
 
     new_mno_sites = region['new_mno_sites']
     upgraded_mno_sites = region['upgraded_mno_sites']
@@ -52,98 +56,47 @@ def find_single_network_cost(region, option, costs, global_parameters,
 
     new_backhaul = region['backhaul_new']
 
-    regional_cost = []
-    regional_asset_cost = []
-
-    for i in range(1, int(all_sites) + 1):
-
-        if i <= upgraded_mno_sites and generation == '4G':
-
-            cost_structure = upgrade_to_4g(region, strategy, costs,
-                global_parameters, core_lut, country_parameters)
-
-            backhaul_quant = backhaul_quantity(i, new_backhaul)
-
-            total_cost, cost_by_asset = calc_costs(region, cost_structure, backhaul,
-                backhaul_quant, global_parameters, country_parameters)
-
-            regional_cost.append(total_cost)
-            regional_asset_cost.append(cost_by_asset)
-
-
-        if i <= upgraded_mno_sites and generation == '5G' and core == 'nsa':
-
-            cost_structure = upgrade_to_5g_nsa(region, strategy, costs,
-                global_parameters, core_lut, country_parameters)
-
-            backhaul_quant = backhaul_quantity(i, new_backhaul)
-
-            total_cost, cost_by_asset = calc_costs(region, cost_structure, backhaul,
-                backhaul_quant, global_parameters, country_parameters)
-
-            regional_cost.append(total_cost)
-            regional_asset_cost.append(cost_by_asset)
-
-
-        if i <= upgraded_mno_sites and generation == '5G' and core == 'sa':
-
-            cost_structure = upgrade_to_5g_sa(region, strategy, costs,
-                global_parameters, core_lut, country_parameters)
-
-            backhaul_quant = backhaul_quantity(i, new_backhaul)
-
-            total_cost, cost_by_asset = calc_costs(region, cost_structure, backhaul,
-                backhaul_quant, global_parameters, country_parameters)
-
-            regional_cost.append(total_cost)
-            regional_asset_cost.append(cost_by_asset)
-
-
-        if i > upgraded_mno_sites and generation == '4G':
-
-            cost_structure = greenfield_4g(region, strategy, costs,
-                global_parameters, core_lut, country_parameters)
-
-            backhaul_quant = backhaul_quantity(i, new_backhaul)
-
-            total_cost, cost_by_asset = calc_costs(region, cost_structure, backhaul,
-                backhaul_quant, global_parameters, country_parameters)
-
-            regional_cost.append(total_cost)
-            regional_asset_cost.append(cost_by_asset)
+    if generation == '4G':
+        upgrade, greenfield = upgrade_to_4g, greenfield_4g
+    elif generation == '5G' and core == 'nsa':
+        upgrade, greenfield = upgrade_to_5g_nsa, greenfield_5g_nsa
+    elif generation == '5G' and core == 'sa':
+        upgrade, greenfield = upgrade_to_5g_sa, greenfield_5g_sa
+    else:
+        upgrade, greenfield = None, None
 
+    counter = collections.Counter()
 
-        if i > upgraded_mno_sites and generation == '5G' and core == 'nsa':
+    if upgrade is not None:
 
-            cost_structure = greenfield_5g_nsa(region, strategy, costs,
-                global_parameters, core_lut, country_parameters)
+        #region level costs, shared by all site classes (on first use)
+        context = None
 
-            backhaul_quant = backhaul_quantity(i, new_backhaul)
+        factors = get_financial_factors(global_parameters, country_parameters)
 
-            total_cost, cost_by_asset = calc_costs(region, cost_structure, backhaul,
-                backhaul_quant, global_parameters, country_parameters)
+        site_classes = get_site_classes(upgraded_mno_sites, all_sites,
+            new_backhaul)
 
-            regional_cost.append(total_cost)
-            regional_asset_cost.append(cost_by_asset)
+        for upgraded, backhaul_quant, quantity in site_classes:
 
+            if quantity == 0:
+                continue
 
-        if i > upgraded_mno_sites and generation == '5G' and core == 'sa':
+            builder = upgrade if upgraded else greenfield
 
-            cost_structure = greenfield_5g_sa(region, strategy, costs,
-                global_parameters, core_lut, country_parameters)
+            if context is None:
+                context = get_cost_context(region, strategy, costs,
+                    global_parameters, core_lut, country_parameters)
 
-            backhaul_quant = backhaul_quantity(i, new_backhaul)
+            cost_structure = builder(region, strategy, costs,
+                global_parameters, core_lut, country_parameters, context)
 
             total_cost, cost_by_asset = calc_costs(region, cost_structure, backhaul,
-                backhaul_quant, global_parameters, country_parameters)
-
-            regional_cost.append(total_cost)
-            regional_asset_cost.append(cost_by_asset)
+                backhaul_quant, global_parameters, country_parameters, factors)
 
+            for key, value in cost_by_asset.items():
+                counter[key] += value * quantity
 
-    counter = collections.Counter()
-    for d in regional_asset_cost:
-        counter.update(d)
     counter_dict = dict(counter)
 
     network_cost = 0
@@ -156,6 +109,45 @@ def find_single_network_cost(region, option, costs, global_parameters,
     return region
 
 
+def get_site_classes(upgraded_mno_sites, all_sites, new_backhaul):
+    """
+    Split the sites in a region into the (at most) four site classes
+    which share the same cost structure.
+
+    Sites are numbered 1 to all_sites, with upgraded sites first,
+    followed by greenfield sites. The first new_backhaul sites receive
+    a new backhaul link.
+
+    Parameters
+    ----------
+    upgraded_mno_sites : float
+        Number of brownfield sites to upgrade.
+    all_sites : float
+        Total number of sites (upgraded and greenfield).
+    new_backhaul : int
+        Number of new backhaul links needing to be built.
+
+    Returns
+    -------
+    site_classes : list of tuples
+        Contains (upgraded, backhaul_quant, quantity) for each site class.
+
+    """
+    all_sites = max(int(all_sites), 0)
+    upgraded = min(max(math.floor(upgraded_mno_sites), 0), all_sites)
+    with_backhaul = min(max(math.floor(new_backhaul), 0), all_sites)
+
+    upgraded_with_backhaul = min(upgraded, with_backhaul)
+    greenfield_with_backhaul = max(with_backhaul - upgraded, 0)
+
+    return [
+        (True, 1, upgraded_with_backhaul),
+        (True, 0, upgraded - upgraded_with_backhaul),
+        (False, 1, greenfield_with_backhaul),
+        (False, 0, all_sites - upgraded - greenfield_with_backhaul),
+    ]
+
+
 def backhaul_quantity(i, new_backhaul):
     """
     Indicator for whether a new backhaul needs to be built or not.
@@ -180,7 +172,7 @@ def backhaul_quantity(i, new_backhaul):
 
 
 def greenfield_4g(region, strategy, costs, global_parameters,
-    core_lut, country_parameters):
+    core_lut, country_parameters, context=None):
     """
     Get the cost structure for a greenfield 4G asset.
 
@@ -188,7 +180,7 @@ def greenfield_4g(region, strategy, costs, global_parameters,
     ----------
     region : dict
         The region being assessed and all associated parameters.
-    strategy : dict
+    strategy : string or Strategy
         The strategy string controls the strategy variants being tested in the
         model and is defined based on the type of technology generation, core
         and backhaul, and the level of sharing, subsidy, spectrum and tax.
@@ -200,6 +192,8 @@ def greenfield_4g(region, strategy, costs, global_parameters,
         Contains the number of existing and required, core and regional assets.
     country_parameters : dict
         All country specific parameters.
+    context : dict, optional
+        Region level cost terms (see get_cost_context).
 
     Returns
     -------
@@ -207,16 +201,18 @@ def greenfield_4g(region, strategy, costs, global_parameters,
         Contains the asset cost structure.
 
     """
-    backhaul = '{}_backhaul'.format(strategy.split('_')[2])
-    sharing = strategy.split('_')[3]
+    strategy = parse_strategy(strategy)
+
+    if context is None:
+        context = get_cost_context(region, strategy, costs, global_parameters,
+            core_lut, country_parameters)
+
+    sharing = strategy.sharing
     geotype = region['geotype'].split(' ')[0]
 
-    # generation_core_backhaul_sharing_networks_spectrum_tax
-    network_strategy = strategy.split('_')[4]
-    net_handle = network_strategy + '_' + geotype
-    networks = country_parameters['networks'][net_handle]
+    networks = strategy.get_networks(geotype, country_parameters)
 
-    shared_assets = INFRA_SHARING_ASSETS[sharing]
+    shared_assets = strategy.get_shared_assets()
 
     assets = {
         'single_sector_antenna': costs['single_sector_antenna'],
@@ -236,11 +232,11 @@ def greenfield_4g(region, strategy, costs, global_parameters,
         'site_rental': costs['site_rental_{}'.format(geotype)],
         'router': costs['router'],
         'power': costs['power_4G'],
-        'backhaul': get_backhaul_costs(region, backhaul, costs, core_lut),
-        'regional_edge': regional_net_costs(region, 'regional_edge', costs, core_lut, strategy, country_parameters),
-        'regional_node': regional_net_costs(region, 'regional_node', costs, core_lut, strategy, country_parameters),
-        'core_edge': core_costs(region, 'core_edge', costs, core_lut, strategy, country_parameters),
-        'core_node': core_costs(region, 'core_node', costs, core_lut, strategy, country_parameters),
+        'backhaul': context['backhaul'],
+        'regional_edge': context['regional_edge'],
+        'regional_node': context['regional_node'],
+        'core_edge': context['core_edge'],
+        'core_node': context['core_node'],
     }
 
     cost_structure = {}
@@ -261,7 +257,7 @@ def greenfield_4g(region, strategy, costs, global_parameters,
 
 
 def upgrade_to_4g(region, strategy, costs, global_parameters,
-    core_lut, country_parameters):
+    core_lut, country_parameters, context=None):
     """
     Get the cost structure to upgrade a brownfield site to 4G.
 
@@ -269,7 +265,7 @@ def upgrade_to_4g(region, strategy, costs, global_parameters,
     ----------
     region : dict
         The region being assessed and all associated parameters.
-    strategy : dict
+    strategy : string or Strategy
         The strategy string controls the strategy variants being tested in the
         model and is defined based on the type of technology generation, core
         and backhaul, and the level of sharing, subsidy, spectrum and tax.
@@ -281,6 +277,8 @@ def upgrade_to_4g(region, strategy, costs, global_parameters,
         Contains the number of existing and required, core and regional assets.
     country_parameters : dict
         All country specific parameters.
+    context : dict, optional
+        Region level cost terms (see get_cost_context).
 
     Returns
     -------
@@ -288,16 +286,18 @@ def upgrade_to_4g(region, strategy, costs, global_parameters,
         Contains the asset cost structure.
 
     """
-    backhaul = '{}_backhaul'.format(strategy.split('_')[2])
-    sharing = strategy.split('_')[3]
+    strategy = parse_strategy(strategy)
+
+    if context is None:
+        context = get_cost_context(region, strategy, costs, global_parameters,
+            core_lut, country_parameters)
+
+    sharing = strategy.sharing
     geotype = region['geotype'].split(' ')[0]
 
-    # generation_core_backhaul_sharing_networks_spectrum_tax
-    network_strategy = strategy.split('_')[4]
-    net_handle = network_strategy + '_' + geotype
-    networks = country_parameters['networks'][net_handle]
+    networks = strategy.get_networks(geotype, country_parameters)
 
-    shared_assets = INFRA_SHARING_ASSETS[sharing]
+    shared_assets = strategy.get_shared_assets()
 
     assets = {
         'single_sector_antenna': costs['single_sector_antenna'],
@@ -313,9 +313,9 @@ def upgrade_to_4g(region, strategy, costs, global_parameters,
         'site_rental': costs['site_rental_{}'.format(geotype)],
         'router': costs['router'],
         'power': costs['power_4G'],
-        'backhaul': get_backhaul_costs(region, backhaul, costs, core_lut),
-        'regional_edge': regional_net_costs(region, 'regional_edge', costs, core_lut, strategy, country_parameters),
-        'regional_node': regional_net_costs(region, 'regional_node', costs, core_lut, strategy, country_parameters),
+        'backhaul': context['backhaul'],
+        'regional_edge': context['regional_edge'],
+        'regional_node': context['regional_node'],
     }
 
     cost_structure = {}
@@ -336,7 +336,7 @@ def upgrade_to_4g(region, strategy, costs, global_parameters,
 
 
 def greenfield_5g_nsa(region, strategy, costs,
-    global_parameters, core_lut, country_parameters):
+    global_parameters, core_lut, country_parameters, context=None):
     """
     Get the cost structure for a greenfield 5G NSA asset.
 
@@ -344,7 +344,7 @@ def greenfield_5g_nsa(region, strategy, costs,
     ----------
     region : dict
         The region being assessed and all associated parameters.
-    strategy : dict
+    strategy : string or Strategy
         The strategy string controls the strategy variants being tested in the
         model and is defined based on the type of technology generation, core
         and backhaul, and the level of sharing, subsidy, spectrum and tax.
@@ -356,6 +356,8 @@ def greenfield_5g_nsa(region, strategy, costs,
         Contains the number of existing and required, core and regional assets.
     country_parameters : dict
         All country specific parameters.
+    context : dict, optional
+        Region level cost terms (see get_cost_context).
 
     Returns
     -------
@@ -363,16 +365,18 @@ def greenfield_5g_nsa(region, strategy, costs,
         Contains the asset cost structure.
 
     """
-    backhaul = '{}_backhaul'.format(strategy.split('_')[2])
-    sharing = strategy.split('_')[3]
+    strategy = parse_strategy(strategy)
+
+    if context is None:
+        context = get_cost_context(region, strategy, costs, global_parameters,
+            core_lut, country_parameters)
+
+    sharing = strategy.sharing
     geotype = region['geotype'].split(' ')[0]
 
-    # generation_core_backhaul_sharing_networks_spectrum_tax
-    network_strategy = strategy.split('_')[4]
-    net_handle = network_strategy + '_' + geotype
-    networks = country_parameters['networks'][net_handle]
+    networks = strategy.get_networks(geotype, country_parameters)
 
-    shared_assets = INFRA_SHARING_ASSETS[sharing]
+    shared_assets = strategy.get_shared_assets()
 
     assets = {
         'single_sector_antenna': costs['single_sector_antenna'],
@@ -392,11 +396,11 @@ def greenfield_5g_nsa(region, strategy, costs,
         'site_rental': costs['site_rental_{}'.format(geotype)],
         'router': costs['router'],
         'power': costs['power_5G'],
-        'backhaul': get_backhaul_costs(region, backhaul, costs, core_lut),
-        'regional_edge': regional_net_costs(region, 'regional_edge', costs, core_lut, strategy, country_parameters),
-        'regional_node': regional_net_costs(region, 'regional_node', costs, core_lut, strategy, country_parameters),
-        'core_edge': core_costs(region, 'core_edge', costs, core_lut, strategy, country_parameters),
-        'core_node': core_costs(region, 'core_node', costs, core_lut, strategy, country_parameters),
+        'backhaul': context['backhaul'],
+        'regional_edge': context['regional_edge'],
+        'regional_node': context['regional_node'],
+        'core_edge': context['core_edge'],
+        'core_node': context['core_node'],
     }
 
     cost_structure = {}
@@ -417,7 +421,7 @@ def greenfield_5g_nsa(region, strategy, costs,
 
 
 def upgrade_to_5g_nsa(region, strategy, costs,
-    global_parameters, core_lut, country_parameters):
+    global_parameters, core_lut, country_parameters, context=None):
     """
     Get the cost structure to upgrade a brownfield site to 5G NSA.
 
@@ -425,7 +429,7 @@ def upgrade_to_5g_nsa(region, strategy, costs,
     ----------
     region : dict
         The region being assessed and all associated parameters.
-    strategy : dict
+    strategy : string or Strategy
         The strategy string controls the strategy variants being tested in the
         model and is defined based on the type of technology generation, core
         and backhaul, and the level of sharing, subsidy, spectrum and tax.
@@ -437,6 +441,8 @@ def upgrade_to_5g_nsa(region, strategy, costs,
         Contains the number of existing and required, core and regional assets.
     country_parameters : dict
         All country specific parameters.
+    context : dict, optional
+        Region level cost terms (see get_cost_context).
 
     Returns
     -------
@@ -444,15 +450,17 @@ def upgrade_to_5g_nsa(region, strategy, costs,
         Contains the asset cost structure.
 
     """
-    backhaul = '{}_backhaul'.format(strategy.split('_')[2])
-    sharing = strategy.split('_')[3]
+    strategy = parse_strategy(strategy)
+
+    if context is None:
+        context = get_cost_context(region, strategy, costs, global_parameters,
+            core_lut, country_parameters)
+
+    sharing = strategy.sharing
     geotype = region['geotype'].split(' ')[0]
 
-    # generation_core_backhaul_sharing_networks_spectrum_tax
-    network_strategy = strategy.split('_')[4]
-    net_handle = network_strategy + '_' + geotype
-    networks = country_parameters['networks'][net_handle]
-    shared_assets = INFRA_SHARING_ASSETS[sharing]
+    networks = strategy.get_networks(geotype, country_parameters)
+    shared_assets = strategy.get_shared_assets()
 
     assets = {
         'single_sector_antenna': costs['single_sector_antenna'],
@@ -469,12 +477,12 @@ def upgrade_to_5g_nsa(region, strategy, costs,
         'site_rental': costs['site_rental_{}'.format(geotype)],
         'router': costs['router'],
         'power': costs['power_5G'],
-        'backhaul': get_backhaul_costs(region, backhaul, costs, core_lut),
+        'backhaul': context['backhaul'],
         'local_node': 0,
-        'regional_edge': regional_net_costs(region, 'regional_edge', costs, core_lut, strategy, country_parameters),
-        'regional_node': regional_net_costs(region, 'regional_node', costs, core_lut, strategy, country_parameters),
-        'core_edge': core_costs(region, 'core_edge', costs, core_lut, strategy, country_parameters),
-        'core_node': core_costs(region, 'core_node', costs, core_lut, strategy, country_parameters),
+        'regional_edge': context['regional_edge'],
+        'regional_node': context['regional_node'],
+        'core_edge': context['core_edge'],
+        'core_node': context['core_node'],
     }
 
     cost_structure = {}
@@ -495,7 +503,7 @@ def upgrade_to_5g_nsa(region, strategy, costs,
 
 
 def greenfield_5g_sa(region, strategy, costs,
-    global_parameters, core_lut, country_parameters):
+    global_parameters, core_lut, country_parameters, context=None):
     """
     Get the cost structure for a greenfield 5G SA asset.
 
@@ -503,7 +511,7 @@ def greenfield_5g_sa(region, strategy, costs,
     ----------
     region : dict
         The region being assessed and all associated parameters.
-    strategy : dict
+    strategy : string or Strategy
         The strategy string controls the strategy variants being tested in the
         model and is defined based on the type of technology generation, core
         and backhaul, and the level of sharing, subsidy, spectrum and tax.
@@ -515,6 +523,8 @@ def greenfield_5g_sa(region, strategy, costs,
         Contains the number of existing and required, core and regional assets.
     country_parameters : dict
         All country specific parameters.
+    context : dict, optional
+        Region level cost terms (see get_cost_context).
 
     Returns
     -------
@@ -522,16 +532,18 @@ def greenfield_5g_sa(region, strategy, costs,
         Contains the asset cost structure.
 
     """
-    backhaul = '{}_backhaul'.format(strategy.split('_')[2])
-    sharing = strategy.split('_')[3]
+    strategy = parse_strategy(strategy)
+
+    if context is None:
+        context = get_cost_context(region, strategy, costs, global_parameters,
+            core_lut, country_parameters, cloud_ran=True)
+
+    sharing = strategy.sharing
     geotype = region['geotype'].split(' ')[0]
 
-    # generation_core_backhaul_sharing_networks_spectrum_tax
-    network_strategy = strategy.split('_')[4]
-    net_handle = network_strategy + '_' + geotype
-    networks = country_parameters['networks'][net_handle]
+    networks = strategy.get_networks(geotype, country_parameters)
 
-    shared_assets = INFRA_SHARING_ASSETS[sharing]
+    shared_assets = strategy.get_shared_assets()
 
     assets = {
         'single_sector_antenna': costs['single_sector_antenna'],
@@ -543,8 +555,8 @@ def greenfield_5g_sa(region, strategy, costs,
         'rack': costs['rack'],
         'cloud_power_supply_converter': costs['cloud_power_supply_converter'],
         'power_generator_battery_system': costs['power_generator_battery_system_5G'],
-        'fronthaul': get_fronthaul_costs(region, costs),
-        'cloud_backhaul': get_backhaul_costs(region, backhaul, costs, core_lut),
+        'fronthaul': context['fronthaul'],
+        'cloud_backhaul': context['backhaul'],
         'tower': costs['tower'],
         'civil_materials': costs['civil_materials'],
         'transportation': costs['transportation'],
@@ -552,11 +564,11 @@ def greenfield_5g_sa(region, strategy, costs,
         'site_rental': costs['site_rental_{}'.format(geotype)],
         'router': costs['router'],
         'power': costs['power_5G'],
-        'local_node': local_net_costs(region, costs, strategy, country_parameters, global_parameters),
-        'regional_edge': regional_net_costs(region, 'regional_edge', costs, core_lut, strategy, country_parameters),
-        'regional_node': regional_net_costs(region, 'regional_node', costs, core_lut, strategy, country_parameters),
-        'core_edge': core_costs(region, 'core_edge', costs, core_lut, strategy, country_parameters),
-        'core_node': core_costs(region, 'core_node', costs, core_lut, strategy, country_parameters),
+        'local_node': context['local_node'],
+        'regional_edge': context['regional_edge'],
+        'regional_node': context['regional_node'],
+        'core_edge': context['core_edge'],
+        'core_node': context['core_node'],
     }
 
     cost_structure = {}
@@ -577,7 +589,7 @@ def greenfield_5g_sa(region, strategy, costs,
 
 
 def upgrade_to_5g_sa(region, strategy, costs,
-    global_parameters, core_lut, country_parameters):
+    global_parameters, core_lut, country_parameters, context=None):
     """
     Get the cost structure to upgrade a brownfield site to 5G SA.
 
@@ -585,7 +597,7 @@ def upgrade_to_5g_sa(region, strategy, costs,
     ----------
     region : dict
         The region being assessed and all associated parameters.
-    strategy : dict
+    strategy : string or Strategy
         The strategy string controls the strategy variants being tested in the
         model and is defined based on the type of technology generation, core
         and backhaul, and the level of sharing, subsidy, spectrum and tax.
@@ -597,6 +609,8 @@ def upgrade_to_5g_sa(region, strategy, costs,
         Contains the number of existing and required, core and regional assets.
     country_parameters : dict
         All country specific parameters.
+    context : dict, optional
+        Region level cost terms (see get_cost_context).
 
     Returns
     -------
@@ -604,16 +618,17 @@ def upgrade_to_5g_sa(region, strategy, costs,
         Contains the asset cost structure.
 
     """
-    backhaul = '{}_backhaul'.format(strategy.split('_')[2])
-    sharing = strategy.split('_')[3]
+    strategy = parse_strategy(strategy)
+
+    if context is None:
+        context = get_cost_context(region, strategy, costs, global_parameters,
+            core_lut, country_parameters, cloud_ran=True)
+
     geotype = region['geotype'].split(' ')[0]
 
-    # generation_core_backhaul_sharing_networks_spectrum_tax
-    network_strategy = strategy.split('_')[4]
-    net_handle = network_strategy + '_' + geotype
-    networks = country_parameters['networks'][net_handle]
+    networks = strategy.get_networks(geotype, country_parameters)
 
-    shared_assets = INFRA_SHARING_ASSETS[sharing]
+    shared_assets = strategy.get_shared_assets()
 
     assets = {
         'single_sector_antenna': costs['single_sector_antenna'],
@@ -625,17 +640,17 @@ def upgrade_to_5g_sa(region, strategy, costs,
         'rack': costs['rack'],
         'cloud_power_supply_converter': costs['cloud_power_supply_converter'],
         'power_generator_battery_system': costs['power_generator_battery_system_5G'],
-        'fronthaul': get_fronthaul_costs(region, costs),
-        'cloud_backhaul': get_backhaul_costs(region, backhaul, costs, core_lut),
+        'fronthaul': context['fronthaul'],
+        'cloud_backhaul': context['backhaul'],
         'installation': costs['installation'],
         'site_rental': costs['site_rental_{}'.format(geotype)],
         'router': costs['router'],
         'power': costs['power_5G'],
-        'local_node': local_net_costs(region, costs, strategy, country_parameters, global_parameters),
-        'regional_edge': regional_net_costs(region, 'regional_edge', costs, core_lut, strategy, country_parameters),
-        'regional_node': regional_net_costs(region, 'regional_node', costs, core_lut, strategy, country_parameters),
-        'core_edge': core_costs(region, 'core_edge', costs, core_lut, strategy, country_parameters),
-        'core_node': core_costs(region, 'core_node', costs, core_lut, strategy, country_parameters),
+        'local_node': context['local_node'],
+        'regional_edge': context['regional_edge'],
+        'regional_node': context['regional_node'],
+        'core_edge': context['core_edge'],
+        'core_node': context['core_node'],
     }
 
     cost_structure = {}
@@ -650,6 +665,67 @@ def upgrade_to_5g_sa(region, strategy, costs,
     return cost_structure
 
 
+def get_cost_context(region, strategy, costs, global_parameters,
+    core_lut, country_parameters, cloud_ran=None):
+    """
+    Calculate the cost terms which only depend on the region (and not the
+    site being built), once per region and strategy, to be shared by all
+    site cost structures.
+
+    Parameters
+    ----------
+    region : dict
+        The region being assessed and all associated parameters.
+    strategy : string or Strategy
+        The strategy string controls the strategy variants being tested in the
+        model and is defined based on the type of technology generation, core
+        and backhaul, and the level of sharing, subsidy, spectrum and tax.
+    costs : dict
+        All equipment costs.
+    global_parameters : dict
+        All global model parameters.
+    core_lut : dict
+        Contains the number of existing and required, core and regional assets.
+    country_parameters : dict
+        All country specific parameters.
+    cloud_ran : bool, optional
+        Include the fronthaul and local node costs (used by 5G SA). Defaults
+        to whether the strategy is 5G SA.
+
+    Returns
+    -------
+    context : dict
+        The backhaul cost, and regional and core edge and node cost per
+        site (plus the fronthaul and local node cost per site for 5G SA).
+
+    """
+    strategy = parse_strategy(strategy)
+
+    if cloud_ran is None:
+        cloud_ran = strategy.generation == '5G' and strategy.core == 'sa'
+
+    backhaul = '{}_backhaul'.format(strategy.backhaul)
+
+    context = {
+        'backhaul': get_backhaul_costs(region, backhaul, costs, core_lut),
+        'regional_edge': regional_net_costs(region, 'regional_edge', costs,
+            core_lut, strategy, country_parameters),
+        'regional_node': regional_net_costs(region, 'regional_node', costs,
+            core_lut, strategy, country_parameters),
+        'core_edge': core_costs(region, 'core_edge', costs, core_lut,
+            strategy, country_parameters),
+        'core_node': core_costs(region, 'core_node', costs, core_lut,
+            strategy, country_parameters),
+    }
+
+    if cloud_ran:
+        context['fronthaul'] = get_fronthaul_costs(region, costs)
+        context['local_node'] = local_net_costs(region, costs, strategy,
+            country_parameters, global_parameters)
+
+    return context
+
+
 def get_fronthaul_costs(region, costs):
     """
     Calculate fronthaul costs.
@@ -703,8 +779,7 @@ def get_backhaul_costs(region, backhaul, costs, core_lut):
     nodes = 0
     for asset_type in ['core_node', 'regional_node']:
         for age in ['new', 'existing']:
-            combined_key = '{}_{}'.format(region['GID_id'], age)
-            nodes += core_lut[asset_type][combined_key]
+            nodes += get_core_value(region, core_lut, asset_type, age, required=True)
     node_density_km2 = nodes / region['area_km2']
 
     if node_density_km2 > 0:
@@ -747,7 +822,7 @@ def local_net_costs(region, costs, strategy, country_parameters,
         The region being assessed and all associated parameters.
     costs : dict
         All equipment costs.
-    strategy : dict
+    strategy : string or Strategy
         The strategy string controls the strategy variants being tested in the
         model and is defined based on the type of technology generation, core
         and backhaul, and the level of sharing, subsidy, spectrum and tax.
@@ -762,7 +837,7 @@ def local_net_costs(region, costs, strategy, country_parameters,
         Contains all regional data.
 
     """
-    core = strategy.split('_')[1]
+    core = parse_strategy(strategy).core
     cost_each = costs['regional_node_lower_{}'.format(core)]
 
     # have 1 local node per n km^2
@@ -793,7 +868,7 @@ def regional_net_costs(region, asset_type, costs, core_lut, strategy, country_pa
         All equipment costs.
     core_lut : dict
         Contains the number of existing and required, core and regional assets.
-    strategy : dict
+    strategy : string or Strategy
         The strategy string controls the strategy variants being tested in the
         model and is defined based on the type of technology generation, core
         and backhaul, and the level of sharing, subsidy, spectrum and tax.
@@ -806,17 +881,17 @@ def regional_net_costs(region, asset_type, costs, core_lut, strategy, country_pa
         Regional network cost for defined asset type per cell site.
 
     """
-    core = strategy.split('_')[1]
+    core = parse_strategy(strategy).core
 
-    if asset_type in core_lut.keys():
+    if has_core_asset(region, core_lut, asset_type):
 
-        combined_key = '{}_{}'.format(region['GID_id'], 'new')
+        value = get_core_value(region, core_lut, asset_type, 'new')
 
-        if combined_key in core_lut[asset_type]:
+        if value is not None:
 
             if asset_type == 'regional_edge':
 
-                distance_m = core_lut[asset_type][combined_key]
+                distance_m = value
                 cost_m = costs['regional_edge']
                 cost = int(distance_m * cost_m)
 
@@ -831,7 +906,7 @@ def regional_net_costs(region, asset_type, costs, core_lut, strategy, country_pa
 
             elif asset_type == 'regional_node':
 
-                regional_nodes = core_lut[asset_type][combined_key]
+                regional_nodes = value
 
                 cost_each = costs['regional_node_{}'.format(core)]
 
@@ -870,7 +945,7 @@ def core_costs(region, asset_type, costs, core_lut, strategy, country_parameters
         All equipment costs.
     core_lut : dict
         Contains the number of existing and required, core and regional assets.
-    strategy : dict
+    strategy : string or Strategy
         The strategy string controls the strategy variants being tested in the
         model and is defined based on the type of technology generation, core
         and backhaul, and the level of sharing, subsidy, spectrum and tax.
@@ -883,19 +958,18 @@ def core_costs(region, asset_type, costs, core_lut, strategy, country_parameters
         Core network cost for defined asset type per cell site.
 
     """
-    core = strategy.split('_')[1]
+    core = parse_strategy(strategy).core
 
     if asset_type == 'core_edge':
 
-        if asset_type in core_lut.keys():
+        if has_core_asset(region, core_lut, asset_type):
 
             total_cost = []
 
             #only grab the new edges that need to be built
-            combined_key = '{}_{}'.format(region['GID_id'], 'new')
+            distance_m = get_core_value(region, core_lut, asset_type, 'new')
 
-            if combined_key in core_lut[asset_type].keys():
-                distance_m = core_lut[asset_type][combined_key]
+            if distance_m is not None:
 
                 cost = int(distance_m * costs['core_edge'])
                 total_cost.append(cost)
@@ -913,14 +987,12 @@ def core_costs(region, asset_type, costs, core_lut, strategy, country_parameters
 
     elif asset_type == 'core_node':
 
-        if asset_type in core_lut.keys():
+        if has_core_asset(region, core_lut, asset_type):
 
             total_cost = []
 
             #only grab the new nodes that need to be built
-            combined_key = '{}_{}'.format(region['GID_id'], 'new')
-
-            nodes = core_lut[asset_type][combined_key]
+            nodes = get_core_value(region, core_lut, asset_type, 'new', required=True)
 
             cost = int(nodes * costs['core_node_{}'.format(core)])
             total_cost.append(cost)
@@ -943,7 +1015,139 @@ def core_costs(region, asset_type, costs, core_lut, strategy, country_parameters
     return 0
 
 
-def discount_capex_and_opex(capex, global_parameters, country_parameters):
+def compile_core_lut(core_lut):
+    """
+    Compile the core network lookup table into one record per region.
+
+    Parameters
+    ----------
+    core_lut : dict
+        Contains the number of existing and required, core and regional assets,
+        keyed by asset type and then '{GID_id}_{new|existing}'.
+
+    Returns
+    -------
+    core_records : dict
+        One record per GID_id, holding the value of each field in
+        CORE_LUT_FIELDS (None where the lookup table has no entry).
+
+    """
+    core_records = {}
+
+    for asset_type, values in core_lut.items():
+        for combined_key, value in values.items():
+
+            gid_id, source = combined_key.rsplit('_', 1)
+
+            if (asset_type, source) not in CORE_LUT_FIELDS:
+                continue
+
+            if gid_id not in core_records:
+                core_records[gid_id] = dict.fromkeys(CORE_LUT_FIELDS.values())
+
+            core_records[gid_id][CORE_LUT_FIELDS[(asset_type, source)]] = value
+
+    return core_records
+
+
+def attach_core_lut(regions, core_records):
+    """
+    Attach the compiled core network record to each region, so costing
+    needs no core lookup table keys.
+
+    Parameters
+    ----------
+    regions : list of dicts
+        Data for all regions (one dict per region).
+    core_records : dict
+        One record per GID_id (see compile_core_lut).
+
+    Returns
+    -------
+    regions : list of dicts
+        Data for all regions (one dict per region).
+
+    """
+    empty = dict.fromkeys(CORE_LUT_FIELDS.values())
+
+    for region in regions:
+        region.update(core_records.get(region['GID_id'], empty))
+
+    return regions
+
+
+def has_core_asset(region, core_lut, asset_type):
+    """
+    Check whether an asset type is covered by the attached core record
+    or the core lookup table.
+
+    Parameters
+    ----------
+    region : dict
+        The region being assessed and all associated parameters.
+    core_lut : dict
+        Contains the number of existing and required, core and regional assets.
+    asset_type : string
+        The core asset type.
+
+    Returns
+    -------
+    has_asset : bool
+        Whether the asset type can be looked up.
+
+    """
+    if core_lut is not None and asset_type in core_lut:
+        return True
+
+    field = CORE_LUT_FIELDS.get((asset_type, 'new'))
+
+    return field is not None and field in region
+
+
+def get_core_value(region, core_lut, asset_type, source, required=False):
+    """
+    Get the quantity of a core or regional asset for a region, from the
+    attached core record if present, otherwise from the core lookup table.
+
+    Parameters
+    ----------
+    region : dict
+        The region being assessed and all associated parameters.
+    core_lut : dict
+        Contains the number of existing and required, core and regional assets.
+    asset_type : string
+        The core asset type (core_edge, core_node, regional_edge or
+        regional_node).
+    source : string
+        Either 'new' or 'existing'.
+    required : bool
+        Raise a KeyError if the value is missing.
+
+    Returns
+    -------
+    value : int
+        Asset quantity (or None when missing and not required).
+
+    """
+    field = CORE_LUT_FIELDS[(asset_type, source)]
+
+    if field in region:
+        value = region[field]
+    elif core_lut is not None and asset_type in core_lut:
+        combined_key = '{}_{}'.format(region['GID_id'], source)
+        value = core_lut[asset_type].get(combined_key)
+    else:
+        value = None
+
+    if value is None and required:
+        raise KeyError('{} {} not found for {}'.format(
+            source, asset_type, region['GID_id']))
+
+    return value
+
+
+def discount_capex_and_opex(capex, global_parameters, country_parameters,
+    factors=None):
     """
     Discount capex and opex costs based on return period.
 
@@ -955,6 +1159,8 @@ def discount_capex_and_opex(capex, global_parameters, country_parameters):
         All global model parameters.
     country_parameters : dict
         All country specific parameters.
+    factors : FinancialFactors, optional
+        Financial factors for the parameters (resolved when not given).
 
     Returns
     -------
@@ -962,30 +1168,21 @@ def discount_capex_and_opex(capex, global_parameters, country_parameters):
         The discounted cost over the desired time period.
 
     """
-    return_period = global_parameters['return_period']
-    discount_rate = global_parameters['discount_rate'] / 100
-    wacc = country_parameters['financials']['wacc']
-
-    costs_over_time_period = []
-
-    costs_over_time_period.append(capex)
+    if factors is None:
+        factors = get_financial_factors(global_parameters, country_parameters)
 
     opex = round(capex * (global_parameters['opex_percentage_of_capex'] / 100))
 
-    for i in range(0, return_period):
-        costs_over_time_period.append(
-            opex / (1 + discount_rate)**i
-        )
-
-    discounted_cost = round(sum(costs_over_time_period))
+    discounted_cost = round(capex + opex * factors.annuity)
 
     #add wacc
-    discounted_cost = discounted_cost * (1 + (wacc/100))
+    discounted_cost = discounted_cost * factors.wacc_multiplier
 
     return discounted_cost
 
 
-def discount_opex(opex, global_parameters, country_parameters):
+def discount_opex(opex, global_parameters, country_parameters,
+    factors=None):
     """
     Discount opex based on return period.
 
@@ -997,6 +1194,8 @@ def discount_opex(opex, global_parameters, country_parameters):
         All global model parameters.
     country_parameters : dict
         All country specific parameters.
+    factors : FinancialFactors, optional
+        Financial factors for the parameters (resolved when not given).
 
     Returns
     -------
@@ -1004,27 +1203,19 @@ def discount_opex(opex, global_parameters, country_parameters):
         The discounted cost over the desired time period.
 
     """
-    return_period = global_parameters['return_period']
-    discount_rate = global_parameters['discount_rate'] / 100
-    wacc = country_parameters['financials']['wacc']
+    if factors is None:
+        factors = get_financial_factors(global_parameters, country_parameters)
 
-    costs_over_time_period = []
-
-    for i in range(0, return_period):
-        costs_over_time_period.append(
-            opex / (1 + discount_rate)**i
-        )
-
-    discounted_cost = round(sum(costs_over_time_period))
+    discounted_cost = round(opex * factors.annuity)
 
     #add wacc
-    discounted_cost = discounted_cost * (1 + (wacc/100))
+    discounted_cost = discounted_cost * factors.wacc_multiplier
 
     return discounted_cost
 
 
 def calc_costs(region, cost_structure, backhaul, backhaul_quantity,
-    global_parameters, country_parameters):
+    global_parameters, country_parameters, factors=None):
     """
     Calculate the total cost for all greenfield and brownfield assets
     in a region.
@@ -1053,6 +1244,8 @@ def calc_costs(region, cost_structure, backhaul, backhaul_quantity,
         All country specific parameters.
     core_lut : dict
         Contains the number of existing and required, core and regional assets.
+    factors : FinancialFactors, optional
+        Financial factors for the parameters (resolved when not given).
 
     Returns
     -------
@@ -1065,137 +1258,133 @@ def calc_costs(region, cost_structure, backhaul, backhaul_quantity,
     all_sites = region['upgraded_mno_sites'] + region['new_mno_sites']
     geotype = region['geotype'].split(' ')[0]
 
+    if factors is None:
+        factors = get_financial_factors(global_parameters, country_parameters)
+
     total_cost = 0
-    cost_by_asset = []
 
-    for asset_name1, cost in cost_structure.items():
-        for asset_name2, type_of_cost in COST_TYPE.items():
-            if asset_name1 == asset_name2:
+    cost_by_asset = {
+        'ran': 0,
+        'backhaul_fronthaul': 0,
+        'civils': 0,
+        'core_network': 0,
+    }
 
-                if asset_name1 == 'backhaul' and backhaul_quantity == 0:
-                    continue
+    for asset_name, cost in cost_structure.items():
 
-                if asset_name1 == 'regional_node' and backhaul == 'microwave':
-                    continue
+        asset = ASSET_TABLE.get(asset_name)
 
-                if asset_name1 == 'regional_edge' and backhaul == 'microwave':
-                    continue
+        if asset is None:
+            continue
 
-                if type_of_cost == 'capex_and_opex':
+        if asset_name == 'backhaul' and backhaul_quantity == 0:
+            continue
 
-                    cost = discount_capex_and_opex(cost, global_parameters,
-                        country_parameters)
+        if asset.fiber_only and backhaul == 'microwave':
+            continue
 
-                    if asset_name1 == 'single_sector_antenna':
-                        cost = cost * global_parameters['sectorization']
+        if asset.cost_type == 'capex_and_opex':
 
-                    if asset_name1 == 'cots_processing':
+            cost = discount_capex_and_opex(cost, global_parameters,
+                country_parameters, factors)
 
-                        split = 'cots_processing_split_{}'.format(geotype)
-                        quantity = int(math.ceil(all_sites / global_parameters[split]))
-                        cost = cost * quantity
+            cost = apply_quantity_rule(asset, cost, all_sites, geotype,
+                global_parameters)
 
-                    if asset_name1 == 'low_latency_switch':
-                        quantity = int(math.ceil(all_sites /
-                            global_parameters['low_latency_switch_split']))
-                        cost = cost * quantity
+        elif asset.cost_type == 'capex':
+            cost = cost * factors.wacc_multiplier
 
-                    if asset_name1 == 'rack':
-                        quantity = int(math.ceil(all_sites /
-                            global_parameters['rack_split']))
-                        cost = cost * quantity
+        elif asset.cost_type == 'opex':
+            cost = discount_opex(cost, global_parameters, country_parameters,
+                factors)
 
-                    if asset_name1 == 'cloud_power_supply_converter':
-                        quantity = int(math.ceil(all_sites /
-                            global_parameters['cloud_power_supply_converter_split']))
-                        cost = cost * quantity
+        else:
+            return 'Did not recognize cost type'
 
-                    if asset_name1 == 'cloud_backhaul':
-                        quantity = int(math.ceil(all_sites /
-                            global_parameters['cloud_backhaul_split']))
-                        cost = (cost * quantity) / all_sites
+        total_cost += cost
 
-                elif type_of_cost == 'capex':
-                    cost = cost * (1 + (country_parameters['financials']['wacc'] / 100))
+        if asset.category is not None:
+            cost_by_asset[asset.category] += cost
 
-                elif type_of_cost == 'opex':
-                    cost = discount_opex(cost, global_parameters, country_parameters)
+    return int(round(total_cost)), cost_by_asset
 
-                else:
-                    return 'Did not recognize cost type'
 
-                total_cost += cost
+def apply_quantity_rule(asset, cost, all_sites, geotype, global_parameters):
+    """
+    Scale the discounted cost of an asset by the quantity needed per site.
 
-                cost_by_asset.append({
-                    'asset': asset_name1,
-                    'cost': cost,
-                })
+    Parameters
+    ----------
+    asset : AssetCost
+        The compiled asset (see compile_asset_table).
+    cost : float
+        The discounted cost of a single asset.
+    all_sites : float
+        Total number of sites (upgraded and greenfield) in the region.
+    geotype : string
+        The region geotype (urban, suburban or rural).
+    global_parameters : dict
+        All global model parameters.
 
-    cost_by_asset = {item['asset']: item['cost'] for item in cost_by_asset}
+    Returns
+    -------
+    cost : float
+        The cost of the asset per site.
 
-    ran = [
-        'single_sector_antenna',
-        'single_remote_radio_unit',
-        'io_fronthaul',
-        'processing',
-        'io_s1_x2',
-        'control_unit',
-        'cooling_fans',
-        'distributed_power_supply_converter',
-        'bbu_cabinet',
-        'cots_processing',
-        'io_n2_n3',
-        'low_latency_switch',
-        'rack',
-        'cloud_power_supply_converter',
-        'power',
-    ]
+    """
+    if asset.quantity_rule == 'sectorization':
+        return cost * global_parameters['sectorization']
 
-    backhaul_fronthaul = [
-        'fronthaul',
-        'backhaul',
-        'cloud_backhaul',
-    ]
+    if asset.quantity_rule == 'split':
 
-    civils = [
-        'tower',
-        'civil_materials',
-        'transportation',
-        'installation',
-        'site_rental',
-        'power_generator_battery_system',
-    ]
+        split = global_parameters[asset.split.format(geotype=geotype)]
+        quantity = int(math.ceil(all_sites / split))
 
-    core = [
-        'regional_node',
-        'regional_edge',
-        'core_node',
-        'core_edge',
-    ]
+        if asset.per_site:
+            return (cost * quantity) / all_sites
 
-    ran_cost = 0
-    backhaul_fronthaul_cost = 0
-    civils_cost = 0
-    core_cost = 0
-
-    for key, value in cost_by_asset.items():
-        if key in ran:
-            ran_cost += value
-        if key in backhaul_fronthaul:
-            backhaul_fronthaul_cost += value
-        if key in civils:
-            civils_cost += value
-        if key in core:
-            core_cost += value
+        return cost * quantity
 
-    cost_by_asset = {
-        'ran': ran_cost,
-        'backhaul_fronthaul': backhaul_fronthaul_cost,
-        'civils': civils_cost,
-        'core_network': core_cost,
-    }
+    return cost
 
-    return int(round(total_cost)), cost_by_asset
+
+def compile_asset_table():
+    """
+    Compile the asset catalogue into one record per asset, holding its cost
+    type, cost category and quantity rule (the assets shared under each
+    sharing strategy are held by the Strategy, see get_shared_assets).
+
+    Returns
+    -------
+    asset_table : dict
+        One AssetCost per asset name.
+
+    """
+    categories = {}
+    for category, asset_names in ASSET_CATEGORIES.items():
+        for asset_name in asset_names:
+            categories[asset_name] = category
+
+    asset_table = {}
+
+    for asset_name, cost_type in COST_TYPE.items():
+
+        quantity_rule, split, per_site = None, None, False
+
+        #quantities only apply to assets with capex and opex (so not the rack)
+        if cost_type == 'capex_and_opex' and asset_name in QUANTITY_RULES:
+            quantity_rule, split, per_site = QUANTITY_RULES[asset_name]
+
+        asset_table[asset_name] = AssetCost(
+            cost_type=cost_type,
+            category=categories.get(asset_name),
+            quantity_rule=quantity_rule,
+            split=split,
+            per_site=per_site,
+            fiber_only=asset_name in ['regional_node', 'regional_edge'],
+        )
+
+    return asset_table
 
 
 INFRA_SHARING_ASSETS = {
@@ -1299,3 +1488,72 @@ COST_TYPE = {
     'core_node': 'capex_and_opex',
     'core_edge': 'capex_and_opex',
 }
+
+#cost category of each asset (assets without one, e.g. the local node, only
+#count towards the total cost)
+ASSET_CATEGORIES = {
+    'ran': [
+        'single_sector_antenna',
+        'single_remote_radio_unit',
+        'io_fronthaul',
+        'processing',
+        'io_s1_x2',
+        'control_unit',
+        'cooling_fans',
+        'distributed_power_supply_converter',
+        'bbu_cabinet',
+        'cots_processing',
+        'io_n2_n3',
+        'low_latency_switch',
+        'rack',
+        'cloud_power_supply_converter',
+        'power',
+    ],
+    'backhaul_fronthaul': [
+        'fronthaul',
+        'backhaul',
+        'cloud_backhaul',
+    ],
+    'civils': [
+        'tower',
+        'civil_materials',
+        'transportation',
+        'installation',
+        'site_rental',
+        'power_generator_battery_system',
+    ],
+    'core_network': [
+        'regional_node',
+        'regional_edge',
+        'core_node',
+        'core_edge',
+    ],
+}
+
+#quantity of each asset per site: (rule, global parameter, cost per site)
+QUANTITY_RULES = {
+    'single_sector_antenna': ('sectorization', None, False),
+    'cots_processing': ('split', 'cots_processing_split_{geotype}', False),
+    'low_latency_switch': ('split', 'low_latency_switch_split', False),
+    'rack': ('split', 'rack_split', False),
+    'cloud_power_supply_converter': ('split', 'cloud_power_supply_converter_split', False),
+    'cloud_backhaul': ('split', 'cloud_backhaul_split', True),
+}
+
+AssetCost = namedtuple('AssetCost', [
+    'cost_type', 'category', 'quantity_rule', 'split', 'per_site',
+    'fiber_only'
+])
+
+CORE_LUT_FIELDS = {
+    ('core_edge', 'new'): 'core_edge_new',
+    ('core_edge', 'existing'): 'core_edge_existing',
+    ('core_node', 'new'): 'core_node_new',
+    ('core_node', 'existing'): 'core_node_existing',
+    ('regional_edge', 'new'): 'regional_edge_new',
+    ('regional_edge', 'existing'): 'regional_edge_existing',
+    ('regional_node', 'new'): 'regional_node_new',
+    ('regional_node', 'existing'): 'regional_node_existing',
+}
+
+ASSET_TABLE = compile_asset_table()
@@ -6,6 +6,14 @@ Written by Ed Oughton.
 Winter 2020
 
 """
+import numpy as np
+
+from pytal.financials import get_discount_divisor
+from pytal.strategy import parse_scenario, parse_strategy
+
+#region attributes used to estimate demand
+DEMAND_FIELDS = ['geotype', 'population', 'area_km2', 'mean_luminosity_km2']
+
 
 def estimate_demand(regions, option, global_parameters,
     country_parameters, timesteps, penetration_lut, smartphone_lut):
@@ -15,6 +23,9 @@ def estimate_demand(regions, option, global_parameters,
         - Total data demand (in Mbps per square kilometer)
         - Total revenue (net present value over the assessment period in USD)
 
+    All regions are estimated at once by estimate_demand_arrays, and the
+    results written back to the region dicts.
+
     Parameters
     ----------
     regions : list of dicts
@@ -40,122 +51,420 @@ def estimate_demand(regions, option, global_parameters,
     -------
     regions : list of dicts
         Data for all regions (one dict per region).
+    annual_output : AnnualDemand
+        Annual demand for all regions.
+
+    """
+    scenario = parse_scenario(option['scenario'])
+    strategy = parse_strategy(option['strategy'])
+
+    demand = estimate_demand_arrays(
+        get_region_columns(regions),
+        option,
+        global_parameters,
+        country_parameters,
+        timesteps,
+        penetration_lut,
+        smartphone_lut
+    )
+
+    output = update_regions(regions, demand)
+
+    annual_output = collect_annual_demand(output, demand, scenario.name,
+        strategy.name, global_parameters['confidence'][0], timesteps)
+
+    return output, annual_output
+
+
+def get_region_columns(regions):
+    """
+    Get the region attributes used by estimate_demand_arrays as columns.
+
+    Parameters
+    ----------
+    regions : list of dicts
+        Data for all regions (one dict per region).
+
+    Returns
+    -------
+    columns : dict
+        Values for all regions, by attribute.
+
+    """
+    return {
+        field: [region[field] for region in regions]
+        for field in DEMAND_FIELDS
+    }
+
+
+def update_regions(regions, demand):
+    """
+    Write the demand estimated by estimate_demand_arrays to the regions (in
+    place). Attributes which vary by year hold the values for the final year.
+
+    Parameters
+    ----------
+    regions : list of dicts
+        Data for all regions (one dict per region).
+    demand : dict
+        Output of estimate_demand_arrays for the regions.
+
+    Returns
+    -------
+    output : list of dicts
+        The regions with a positive area (other regions are not modeled).
 
     """
     output = []
-    annual_output = []
-
-    # generation_core_backhaul_sharing_networks_spectrum_tax
-    network_strategy = option['strategy'].split('_')[4]
-
-    for region in regions:
-
-        if not region['area_km2'] > 0:
-            continue
-
-        geotype = region['geotype'].split(' ')[0]
-
-        net_handle = network_strategy + '_' + geotype
-        networks = country_parameters['networks'][net_handle]
-
-        if geotype == 'suburban':
-            #smartphone lut only has urban-rural split, hence no suburban
-            geotype_sps = 'urban'
-        else:
-            geotype_sps = geotype
-
-        revenue = []
-        demand_mbps_km2 = []
-
-        scenario_per_user_capacity = get_per_user_capacity(
-            region['geotype'], option)
-
-        for timestep in timesteps:
-
-            region['arpu_discounted_monthly'] = estimate_arpu(
-                region,
-                timestep,
-                global_parameters,
-                country_parameters
-            )
-
-            region['penetration'] = penetration_lut[timestep]
-
-            #cell_penetration : float
-            #Number of cell phones per member of the population.
-            region['population_with_phones'] = (
-                region['population'] * (region['penetration'] / 100))
-
-            #phones : int
-            #Total number of phones on the network being modeled.
-            region['phones_on_network'] = (
-                region['population_with_phones'] /
-                networks)
-
-            #get phone density
-            region['phone_density_on_network_km2'] = (
-                region['phones_on_network'] / region['area_km2']
-            )
-
-            #add regional smartphone penetration
-            region['smartphone_penetration'] = smartphone_lut[geotype_sps][timestep]
-
-            #phones : int
-            #Total number of smartphones on the network being modeled.
-            region['smartphones_on_network'] = (
-                region['phones_on_network'] *
-                (region['smartphone_penetration'] / 100)
-            )
-
-            #get smartphone density
-            region['sp_density_on_network_km2'] = (
-                region['smartphones_on_network'] / region['area_km2']
-            )
-
-            # demand_mbps_km2 : float
-            # Total demand in mbps / km^2.
-            demand_mbps_km2.append(
-                (region['smartphones_on_network'] *
-                scenario_per_user_capacity / #User demand in Mbps
-                global_parameters['overbooking_factor'] /
-                region['area_km2']
-                ))
-
-            annual_revenue = (
-                region['arpu_discounted_monthly'] *
-                region['phones_on_network'] *
-                12
-            )
-
-            revenue.append(annual_revenue)
-
-            annual_output.append({
-                'GID_0': region['GID_0'],
-                'GID_id': region['GID_id'],
-                'scenario': option['scenario'],
-                'strategy': option['strategy'],
-                'confidence': global_parameters['confidence'][0],
-                'year': timestep,
-                'population': region['population'],
-                'area_km2': region['area_km2'],
-                'population_km2': region['population_km2'],
-                'geotype': region['geotype'],
-                'arpu_discounted_monthly': region['arpu_discounted_monthly'],
-                'penetration': region['penetration'],
-                'population_with_phones': region['population_with_phones'],
-                'phones_on_network': region['phones_on_network'],
-                'smartphone_penetration': region['smartphone_penetration'],
-                'smartphones_on_network': region['smartphones_on_network'],
-                'revenue': annual_revenue,
-            })
-
-        region['demand_mbps_km2'] = max(demand_mbps_km2)
-        region['total_mno_revenue'] = round(sum(revenue))
-        region['revenue_km2'] = round(sum(revenue) / region['area_km2'])
+
+    final_year = {
+        field: demand[field][:, -1].tolist() for field in [
+            'arpu_discounted_monthly', 'population_with_phones',
+            'phones_on_network', 'smartphone_penetration',
+            'smartphones_on_network'
+        ]
+    }
+    penetration = float(demand['penetration'][-1])
+
+    demand_mbps_km2 = demand['demand_mbps_km2'].tolist()
+    total_mno_revenue = demand['total_mno_revenue'].tolist()
+    revenue_km2 = demand['revenue_km2'].tolist()
+
+    for idx in np.flatnonzero(demand['valid']):
+
+        region = regions[idx]
+
+        for field, values in final_year.items():
+            region[field] = values[idx]
+
+        region['penetration'] = penetration
+
+        region['phone_density_on_network_km2'] = (
+            region['phones_on_network'] / region['area_km2'])
+
+        region['sp_density_on_network_km2'] = (
+            region['smartphones_on_network'] / region['area_km2'])
+
+        region['demand_mbps_km2'] = demand_mbps_km2[idx]
+        region['total_mno_revenue'] = int(total_mno_revenue[idx])
+        region['revenue_km2'] = int(revenue_km2[idx])
 
         output.append(region)
 
-    return output, annual_output
+    return output
+
+
+def collect_annual_demand(regions, demand, scenario, strategy, confidence,
+    timesteps):
+    """
+    Collect the annual demand estimated by estimate_demand_arrays.
+
+    Parameters
+    ----------
+    regions : list of dicts
+        The modeled regions (with a positive area), in order.
+    demand : dict
+        Output of estimate_demand_arrays.
+    scenario : string
+        The scenario being tested.
+    strategy : string
+        The strategy being tested.
+    confidence : int
+        The confidence interval.
+    timesteps : list
+        All years for the assessment period.
+
+    Returns
+    -------
+    annual_output : AnnualDemand
+        Annual demand for all regions.
+
+    """
+    valid = np.flatnonzero(demand['valid'])
+
+    #penetration only varies by year, so is broadcast to all regions
+    matrices = {
+        field: np.broadcast_to(demand[field],
+            (len(demand['valid']), len(timesteps)))[valid]
+        for field in AnnualDemand.ANNUAL_FIELDS
+    }
+
+    region_fields = {
+        field: [region[field] for region in regions]
+        for field in AnnualDemand.REGION_FIELDS
+    }
+
+    return AnnualDemand(scenario, strategy, confidence, timesteps,
+        region_fields, matrices)
+
+
+class AnnualDemand(object):
+    """
+    Annual demand for all regions, held as columns.
+
+    Values which vary by year are held as flat arrays (one element per
+    region and year, ordered by region and then year), while region
+    attributes are stored once per region, and the scenario, strategy and
+    confidence once in total. Rows are only built when iterated over.
+
+    Parameters
+    ----------
+    scenario : string
+        The scenario being tested.
+    strategy : string
+        The strategy being tested.
+    confidence : int
+        The confidence interval.
+    timesteps : list
+        All years for the assessment period.
+    regions : dict
+        Values of the region attributes (REGION_FIELDS) by field, with one
+        element per region.
+    matrices : dict
+        (regions x years) arrays of the annual values (ANNUAL_FIELDS) by
+        field.
+
+    """
+    REGION_FIELDS = [
+        'GID_0', 'GID_id', 'population', 'area_km2', 'population_km2', 'geotype'
+    ]
+
+    ANNUAL_FIELDS = [
+        'arpu_discounted_monthly', 'penetration', 'population_with_phones',
+        'phones_on_network', 'smartphone_penetration',
+        'smartphones_on_network', 'revenue'
+    ]
+
+    #national per year totals (the other annual fields are rates)
+    NATIONAL_FIELDS = [
+        'population', 'area_km2', 'population_with_phones',
+        'phones_on_network', 'smartphones_on_network', 'revenue'
+    ]
+
+    def __init__(self, scenario, strategy, confidence, timesteps, regions,
+        matrices):
+
+        self.scenario = scenario
+        self.strategy = strategy
+        self.confidence = confidence
+        self.timesteps = list(timesteps)
+        self.regions = {field: list(regions[field]) for field in self.REGION_FIELDS}
+        self.columns = {
+            field: np.asarray(matrices[field], dtype='float64').ravel()
+            for field in self.ANNUAL_FIELDS
+        }
+        self.length = len(self.regions['GID_id']) * len(self.timesteps)
+
+    def __len__(self):
+        return self.length
+
+    def relabel(self, strategy):
+        """
+        Return a copy labelled with another strategy, sharing the columns.
+
+        """
+        relabelled = object.__new__(AnnualDemand)
+        relabelled.__dict__.update(self.__dict__)
+        relabelled.strategy = strategy
+
+        return relabelled
+
+    def to_columns(self):
+        """
+        Return all annual demand as columns, with one element per region
+        and year.
+
+        Returns
+        -------
+        columns : dict
+            Arrays (or lists) by field, in the order of the annual output of
+            estimate_demand.
+
+        """
+        years = len(self.timesteps)
+        regions = len(self.regions['GID_id'])
+
+        columns = {}
+        columns['GID_0'] = np.repeat(self.regions['GID_0'], years)
+        columns['GID_id'] = np.repeat(self.regions['GID_id'], years)
+        columns['scenario'] = [self.scenario] * self.length
+        columns['strategy'] = [self.strategy] * self.length
+        columns['confidence'] = [self.confidence] * self.length
+        columns['year'] = np.tile(self.timesteps, regions)
+
+        for field in self.REGION_FIELDS[2:]:
+            columns[field] = np.repeat(self.regions[field], years)
+
+        for field in self.ANNUAL_FIELDS:
+            columns[field] = self.columns[field]
+
+        return columns
+
+    def national(self):
+        """
+        Return national totals for each year.
+
+        Returns
+        -------
+        columns : dict
+            Arrays (or lists) by field, with one element per year.
+
+        """
+        years = len(self.timesteps)
+        regions = len(self.regions['GID_id'])
+
+        gid_0 = self.regions['GID_0'][0] if regions > 0 else None
+
+        columns = {
+            'GID_0': [gid_0] * years,
+            'scenario': [self.scenario] * years,
+            'strategy': [self.strategy] * years,
+            'confidence': [self.confidence] * years,
+            'year': list(self.timesteps),
+        }
+
+        for field in self.NATIONAL_FIELDS:
+            if field in self.columns:
+                values = self.columns[field]
+                columns[field] = values.reshape(regions, years).sum(axis=0)
+            else:
+                columns[field] = np.full(years, float(np.sum(self.regions[field])))
+
+        return columns
+
+    def __iter__(self):
+
+        columns = self.to_columns()
+        fields = list(columns.keys())
+
+        for idx in range(self.length):
+            yield {field: columns[field][idx] for field in fields}
+
+
+def estimate_demand_arrays(regions, option, global_parameters,
+    country_parameters, timesteps, penetration_lut, smartphone_lut):
+    """
+    Array-backed equivalent of estimate_demand.
+
+    All regions and timesteps are evaluated at once as (regions x years)
+    matrices, rather than region by region.
+
+    Parameters
+    ----------
+    regions : dict of array-likes or pandas df
+        Region table as columns (GID_id, geotype, population, area_km2 and
+        mean_luminosity_km2 are required).
+    option : dict
+        Contains the scenario and strategy. The strategy string controls
+        the strategy variants being tested in the model and is defined based
+        on the type of technology generation, core and backhaul, and the
+        strategy for infrastructure sharing, the number of networks in each
+        geotype, spectrum and taxation.
+    global_parameters : dict
+        All global model parameters.
+    country_parameters : dict
+        All country specific parameters.
+    timesteps : list
+        All years for the assessment period.
+    penetration_lut : list of dicts
+        Contains annual cell phone penetration values.
+    smartphone_lut : list of dicts
+        Contains annual penetration values for smartphones.
+
+    Returns
+    -------
+    output : dict
+        Per region arrays (demand_mbps_km2, total_mno_revenue, revenue_km2),
+        (regions x years) matrices for the annual metrics and a boolean
+        'valid' mask for regions with a positive area (other regions
+        contain nan, as estimate_demand skips them).
+
+    """
+    strategy = parse_strategy(option['strategy'])
+
+    population = np.asarray(regions['population'], dtype='float64')
+    area_km2 = np.asarray(regions['area_km2'], dtype='float64')
+    luminosity = np.asarray(regions['mean_luminosity_km2'], dtype='float64')
+
+    valid = area_km2 > 0
+    area_km2 = np.where(valid, area_km2, np.nan)
+
+    unique_geotypes, geotype_idx = np.unique(
+        np.asarray(regions['geotype'], dtype=str), return_inverse=True)
+    geotypes = [geotype.split(' ')[0] for geotype in unique_geotypes]
+
+    networks = np.array([
+        strategy.get_networks(geotype, country_parameters)
+        for geotype in geotypes
+    ], dtype='float64')[geotype_idx]
+
+    per_user_capacity = np.array([
+        get_per_user_capacity(geotype, option) for geotype in geotypes
+    ], dtype='float64')[geotype_idx]
+
+    #smartphone lut only has urban-rural split, hence no suburban
+    smartphone_penetration = np.array([
+        [smartphone_lut['urban' if geotype == 'suburban' else geotype][timestep]
+            for timestep in timesteps]
+        for geotype in geotypes
+    ], dtype='float64')[geotype_idx]
+
+    arpu = np.where(
+        luminosity > country_parameters['luminosity']['high'],
+        country_parameters['arpu']['high'],
+        np.where(
+            luminosity > country_parameters['luminosity']['medium'],
+            country_parameters['arpu']['medium'],
+            country_parameters['arpu']['low']
+        )
+    )
+
+    divisors = np.array([
+        get_discount_divisor(global_parameters['discount_rate'], timestep - 2020)
+        for timestep in timesteps
+    ], dtype='float64')
+    arpu_discounted_monthly = arpu[:, None] / divisors[None, :]
+
+    penetration = np.array(
+        [penetration_lut[timestep] for timestep in timesteps], dtype='float64')
+
+    population_with_phones = population[:, None] * (penetration[None, :] / 100)
+
+    phones_on_network = population_with_phones / networks[:, None]
+
+    smartphones_on_network = phones_on_network * (smartphone_penetration / 100)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+
+        demand_mbps_km2 = (
+            smartphones_on_network *
+            per_user_capacity[:, None] /
+            global_parameters['overbooking_factor'] /
+            area_km2[:, None]
+        )
+
+        revenue = arpu_discounted_monthly * phones_on_network * 12
+
+        #summed year by year, as for a single region
+        total_revenue = np.zeros(len(population))
+        for year_idx in range(len(timesteps)):
+            total_revenue = total_revenue + revenue[:, year_idx]
+
+        output = {
+            'valid': valid,
+            'demand_mbps_km2': demand_mbps_km2.max(axis=1),
+            'total_mno_revenue': np.where(valid, np.round(total_revenue), np.nan),
+            'revenue_km2': np.round(total_revenue / area_km2),
+            'arpu_discounted_monthly': arpu_discounted_monthly,
+            'penetration': penetration,
+            'population_with_phones': population_with_phones,
+            'phones_on_network': phones_on_network,
+            'smartphone_penetration': smartphone_penetration,
+            'smartphones_on_network': smartphones_on_network,
+            'revenue': revenue,
+        }
+
+    return output
 
 
 def get_per_user_capacity(geotype, option):
@@ -180,17 +489,13 @@ def get_per_user_capacity(geotype, option):
         The targetted per user capacity in Mbps.
 
     """
-    if geotype.split(' ')[0] == 'urban':
+    scenario = parse_scenario(option['scenario'])
 
-        return int(option['scenario'].split('_')[1])
+    geotype = geotype.split(' ')[0]
 
-    elif geotype.split(' ')[0] == 'suburban':
+    if geotype in scenario.per_user_capacity:
 
-        return int(option['scenario'].split('_')[2])
-
-    elif geotype.split(' ')[0] == 'rural':
-
-        return int(option['scenario'].split('_')[3])
+        return scenario.per_user_capacity[geotype]
 
     else:
         return 'Did not recognise geotype'
@@ -253,8 +558,7 @@ def discount_arpu(arpu, timestep, global_parameters):
         The discounted revenue over the desired time period.
 
     """
-    discount_rate = global_parameters['discount_rate'] / 100
-
-    discounted_arpu = arpu / (1 + discount_rate) ** timestep
+    discounted_arpu = arpu / get_discount_divisor(
+        global_parameters['discount_rate'], timestep)
 
     return discounted_arpu
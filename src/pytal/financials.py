@@ -0,0 +1,134 @@
+"""
+Financial factors
+
+Discount and annuity factors only depend on the discount rate, return
+period, wacc and assessment period, so they are computed once and shared
+by the cost, demand and assessment modules.
+
+Written by Ed Oughton.
+
+Winter 2020
+
+"""
+from functools import lru_cache
+
+BASE_YEAR = 2020
+
+
+class FinancialFactors(object):
+    """
+    Precomputed discount and annuity factors.
+
+    Attributes
+    ----------
+    annuity : float
+        Sum of the discount factors over the return period, i.e. the
+        discounted value of a cost of one paid in every year.
+    wacc_multiplier : float
+        Multiplier applying the Weighted Average Cost of Capital.
+    timestep_annuity : float
+        Sum of the discount factors over all timesteps.
+
+    """
+    __slots__ = (
+        'annuity',
+        'wacc_multiplier',
+        'timestep_annuity',
+    )
+
+    def __init__(self, discount_rate, return_period, wacc, timesteps):
+
+        rate = discount_rate / 100
+
+        annuity = sum(1 / (1 + rate) ** i for i in range(0, return_period))
+
+        timestep_annuity = sum(
+            1 / get_discount_divisor(discount_rate, timestep - BASE_YEAR)
+            for timestep in timesteps
+        )
+
+        object.__setattr__(self, 'annuity', annuity)
+        object.__setattr__(self, 'wacc_multiplier', 1 + (wacc / 100))
+        object.__setattr__(self, 'timestep_annuity', timestep_annuity)
+
+    def __setattr__(self, key, value):
+        raise AttributeError('FinancialFactors objects are immutable')
+
+
+@lru_cache(maxsize=None)
+def build_financial_factors(discount_rate, return_period, wacc, timesteps):
+    """
+    Return the (cached) financial factors for a set of parameters.
+
+    Parameters
+    ----------
+    discount_rate : float
+        Discount rate (%).
+    return_period : int
+        Number of years over which costs are incurred.
+    wacc : float
+        Weighted Average Cost of Capital (%).
+    timesteps : tuple
+        All years for the assessment period.
+
+    Returns
+    -------
+    factors : FinancialFactors
+        The precomputed factors.
+
+    """
+    return FinancialFactors(discount_rate, return_period, wacc, timesteps)
+
+
+def get_financial_factors(global_parameters, country_parameters=None,
+    timesteps=()):
+    """
+    Return the (cached) financial factors for the model parameters.
+
+    Parameters
+    ----------
+    global_parameters : dict
+        All global model parameters.
+    country_parameters : dict, optional
+        All country specific parameters (used for the wacc).
+    timesteps : list, optional
+        All years for the assessment period.
+
+    Returns
+    -------
+    factors : FinancialFactors
+        The precomputed factors.
+
+    """
+    if country_parameters is not None:
+        wacc = country_parameters['financials']['wacc']
+    else:
+        wacc = 0
+
+    return build_financial_factors(
+        global_parameters['discount_rate'],
+        global_parameters.get('return_period', 0),
+        wacc,
+        tuple(timesteps)
+    )
+
+
+@lru_cache(maxsize=None)
+def get_discount_divisor(discount_rate, timestep):
+    """
+    Return the (cached) discount divisor (1 + discount_rate) ** timestep.
+
+    Parameters
+    ----------
+    discount_rate : float
+        Discount rate (%).
+    timestep : int
+        Number of years from the base year.
+
+    Returns
+    -------
+    divisor : float
+        The discount divisor.
+
+    """
+    return (1 + (discount_rate / 100)) ** timestep
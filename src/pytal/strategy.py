@@ -0,0 +1,337 @@
+"""
+Parse scenario and strategy strings.
+
+The strategy string is defined based on
+generation_core_backhaul_sharing_networks_spectrum_tax, and the scenario
+string based on name_urban_suburban_rural (per user capacity in Mbps).
+
+Written by Ed Oughton.
+
+Winter 2020
+
+"""
+from functools import lru_cache
+
+GEOTYPES = ('urban', 'suburban', 'rural')
+
+# the strategy fields each model stage depends on (the scenario is
+# used by every stage)
+STAGE_FIELDS = {
+    'demand': ('network_strategy',),
+    'supply': ('generation', 'core', 'backhaul', 'sharing', 'network_strategy'),
+    'assess': ('generation', 'core', 'backhaul', 'sharing', 'network_strategy',
+        'spectrum', 'tax'),
+}
+
+
+class Strategy(object):
+    """
+    Immutable, parsed representation of a strategy string.
+
+    Parameters
+    ----------
+    name : string
+        The strategy string, e.g. '4G_epc_microwave_baseline_baseline_baseline_baseline'.
+    country_parameters : dict, optional
+        All country specific parameters. When provided, the number of networks
+        in each geotype and the frequencies for the technology generation are
+        resolved once, and reused by all functions receiving this strategy.
+
+    A strategy compiled with country parameters is only valid for that
+    country, as the precomputed lookups take precedence over the country
+    parameters passed to get_networks and get_frequencies. Strategies
+    with the same name compiled for countries with different lookups are
+    therefore not equal.
+
+    """
+    __slots__ = (
+        'name',
+        'generation',
+        'core',
+        'backhaul',
+        'sharing',
+        'network_strategy',
+        'spectrum',
+        'tax',
+        'shared_assets',
+        'networks',
+        'frequencies',
+    )
+
+    def __init__(self, name, country_parameters=None):
+
+        from pytal.costs import INFRA_SHARING_ASSETS
+
+        parts = name.split('_')
+        parts = parts + [None] * (7 - len(parts))
+
+        sharing = parts[3]
+
+        if sharing in INFRA_SHARING_ASSETS:
+            shared_assets = frozenset(INFRA_SHARING_ASSETS[sharing])
+        else:
+            shared_assets = None
+
+        networks = None
+        frequencies = None
+
+        if country_parameters is not None:
+
+            if 'networks' in country_parameters:
+                networks = {}
+                for geotype in GEOTYPES:
+                    net_handle = '{}_{}'.format(parts[4], geotype)
+                    if net_handle in country_parameters['networks']:
+                        networks[geotype] = country_parameters['networks'][net_handle]
+
+            if 'frequencies' in country_parameters:
+                frequencies = country_parameters['frequencies'].get(parts[0])
+                if frequencies is not None:
+                    frequencies = tuple(frequencies)
+
+        values = {
+            'name': name,
+            'generation': parts[0],
+            'core': parts[1],
+            'backhaul': parts[2],
+            'sharing': sharing,
+            'network_strategy': parts[4],
+            'spectrum': parts[5],
+            'tax': parts[6],
+            'shared_assets': shared_assets,
+            'networks': networks,
+            'frequencies': frequencies,
+        }
+
+        for key, value in values.items():
+            object.__setattr__(self, key, value)
+
+    def __setattr__(self, key, value):
+        raise AttributeError('Strategy objects are immutable')
+
+    def __delattr__(self, key):
+        raise AttributeError('Strategy objects are immutable')
+
+    def __repr__(self):
+        return 'Strategy({!r})'.format(self.name)
+
+    def __str__(self):
+        return self.name
+
+    def __eq__(self, other):
+        if isinstance(other, Strategy):
+            return (
+                self.name == other.name and
+                self.networks == other.networks and
+                self.frequencies == other.frequencies
+            )
+        return NotImplemented
+
+    def __hash__(self):
+        #the frequencies are left out, as they hold dicts (equal strategies
+        #still hash the same)
+        if self.networks is None:
+            return hash((self.name, None))
+        return hash((self.name, tuple(sorted(self.networks.items()))))
+
+    def get_networks(self, geotype, country_parameters):
+        """
+        Return the number of networks for a geotype (e.g. urban, suburban
+        or rural), using the precomputed lookup where available.
+
+        """
+        if self.networks is not None and geotype in self.networks:
+            return self.networks[geotype]
+
+        net_handle = self.network_strategy + '_' + geotype
+
+        return country_parameters['networks'][net_handle]
+
+    def get_frequencies(self, country_parameters):
+        """
+        Return the frequencies used by the technology generation, using the
+        precomputed lookup where available.
+
+        """
+        if self.frequencies is not None:
+            return self.frequencies
+
+        return country_parameters['frequencies'][self.generation]
+
+    def get_stage_key(self, stage):
+        """
+        Return the values of the strategy fields a model stage
+        ('demand', 'supply' or 'assess') depends on.
+
+        """
+        return tuple(getattr(self, field) for field in STAGE_FIELDS[stage])
+
+    def get_shared_assets(self):
+        """
+        Return the set of assets shared under the infrastructure sharing
+        strategy.
+
+        """
+        if self.shared_assets is None:
+            raise KeyError(self.sharing)
+
+        return self.shared_assets
+
+
+class Scenario(object):
+    """
+    Immutable, parsed representation of a scenario string.
+
+    Parameters
+    ----------
+    name : string
+        The scenario string, e.g. 'S1_25_10_2'.
+
+    """
+    __slots__ = (
+        'name',
+        'per_user_capacity',
+    )
+
+    def __init__(self, name):
+
+        parts = name.split('_')
+
+        per_user_capacity = {}
+        for idx, geotype in enumerate(GEOTYPES):
+            if len(parts) > idx + 1:
+                per_user_capacity[geotype] = int(parts[idx + 1])
+
+        object.__setattr__(self, 'name', name)
+        object.__setattr__(self, 'per_user_capacity', per_user_capacity)
+
+    def __setattr__(self, key, value):
+        raise AttributeError('Scenario objects are immutable')
+
+    def __delattr__(self, key):
+        raise AttributeError('Scenario objects are immutable')
+
+    def __repr__(self):
+        return 'Scenario({!r})'.format(self.name)
+
+    def __str__(self):
+        return self.name
+
+    def __eq__(self, other):
+        if isinstance(other, Scenario):
+            return self.name == other.name
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(self.name)
+
+
+@lru_cache(maxsize=None)
+def _parse_strategy_string(strategy):
+    return Strategy(strategy)
+
+
+@lru_cache(maxsize=None)
+def _parse_scenario_string(scenario):
+    return Scenario(scenario)
+
+
+def parse_strategy(strategy):
+    """
+    Return a Strategy, parsing (and caching) strategy strings.
+
+    Parameters
+    ----------
+    strategy : string or Strategy
+        The strategy being tested.
+
+    Returns
+    -------
+    strategy : Strategy
+        The parsed strategy.
+
+    """
+    if isinstance(strategy, Strategy):
+        return strategy
+
+    return _parse_strategy_string(strategy)
+
+
+def parse_scenario(scenario):
+    """
+    Return a Scenario, parsing (and caching) scenario strings.
+
+    Parameters
+    ----------
+    scenario : string or Scenario
+        The scenario being tested.
+
+    Returns
+    -------
+    scenario : Scenario
+        The parsed scenario.
+
+    """
+    if isinstance(scenario, Scenario):
+        return scenario
+
+    return _parse_scenario_string(scenario)
+
+
+def get_stage_key(option, stage, ci=None):
+    """
+    Return a hashable key identifying the results of a model stage, so
+    options which only differ in fields the stage does not depend on
+    (e.g. spectrum and tax for demand and supply) can share them.
+
+    Parameters
+    ----------
+    option : dict
+        Contains the scenario and strategy.
+    stage : string
+        The model stage ('demand', 'supply' or 'assess').
+    ci : int, optional
+        Confidence interval (used by supply and assess).
+
+    Returns
+    -------
+    key : tuple
+        The stage key.
+
+    """
+    scenario = parse_scenario(option['scenario'])
+    strategy = parse_strategy(option['strategy'])
+
+    key = (stage, scenario.name) + strategy.get_stage_key(stage)
+
+    if stage != 'demand':
+        key = key + (ci,)
+
+    return key
+
+
+def compile_option(option, country_parameters=None):
+    """
+    Parse the scenario and strategy strings of an option once, so they
+    can be passed to all demand, supply, cost and assessment functions.
+
+    Parameters
+    ----------
+    option : dict
+        Contains the scenario and strategy strings.
+    country_parameters : dict, optional
+        All country specific parameters, used to precompute the network and
+        frequency lookups.
+
+    Returns
+    -------
+    option : dict
+        A copy of the option with Scenario and Strategy objects.
+
+    """
+    compiled = dict(option)
+
+    compiled['scenario'] = parse_scenario(str(option['scenario']))
+    compiled['strategy'] = Strategy(str(option['strategy']), country_parameters)
+
+    return compiled
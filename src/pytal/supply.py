@@ -7,10 +7,15 @@ Winter 2020
 
 """
 import math
+from bisect import bisect_right
+from collections import namedtuple
 from itertools import tee
 from operator import itemgetter
 
+import numpy as np
+
 from pytal.costs import find_single_network_cost
+from pytal.strategy import parse_scenario, parse_strategy
 
 
 def estimate_supply(country, regions, capacity_lut, option, global_parameters,
@@ -52,34 +57,25 @@ def estimate_supply(country, regions, capacity_lut, option, global_parameters,
     """
     output_regions = []
 
-    for region in regions:
-
-        region['network_site_density'] = find_site_density(region, option,
-            global_parameters, country_parameters, capacity_lut, ci)
+    scenario = parse_scenario(option['scenario'])
+    strategy = parse_strategy(option['strategy'])
 
-        total_sites_required = math.ceil(region['network_site_density'] *
-            region['area_km2'])
+    curves = compile_capacity_curves(capacity_lut, option, global_parameters,
+        country_parameters, ci)
 
-        region = estimate_site_upgrades(
-            region,
-            option['strategy'],
-            total_sites_required,
-            country_parameters
-        )
+    site_densities = find_site_densities(
+        [region['demand_mbps_km2'] for region in regions],
+        [region['geotype'] for region in regions],
+        curves
+    )
 
-        region = estimate_backhaul_upgrades(region, option['strategy'], country_parameters)
+    for region, site_density in zip(regions, site_densities):
 
-        region = find_single_network_cost(
-            region,
-            option,
-            costs,
-            global_parameters,
-            country_parameters,
-            core_lut,
-        )
+        region = estimate_region_supply(region, site_density, option,
+            global_parameters, country_parameters, costs, core_lut)
 
-        region['scenario'] = option['scenario']
-        region['strategy'] = option['strategy']
+        region['scenario'] = scenario.name
+        region['strategy'] = strategy.name
         region['confidence'] = ci
 
         output_regions.append(region)
@@ -87,8 +83,139 @@ def estimate_supply(country, regions, capacity_lut, option, global_parameters,
     return output_regions
 
 
+def estimate_supply_by_ci(country, regions, capacity_lut, option,
+    global_parameters, country_parameters, costs, core_lut,
+    confidence_intervals):
+    """
+    Estimate supply for all confidence intervals at once.
+
+    Demand does not depend on the confidence interval, so the site densities
+    for every confidence interval are looked up together, and each region is
+    only costed once for each distinct site density (e.g. when the demand is
+    beyond every capacity curve).
+
+    Parameters
+    ----------
+    country : dict
+        Country information.
+    regions : list of dicts
+        Data for all regions (one dict per region), left unchanged.
+    capacity_lut : dict
+        A dictionary containing the lookup capacities.
+    option : dict
+        Contains the scenario and strategy.
+    global_parameters : dict
+        All global model parameters.
+    country_parameters : dict
+        All country specific parameters.
+    costs : dict
+        All equipment costs.
+    core_lut : dict
+        Contains the number of existing and required, core and regional assets.
+    confidence_intervals : list
+        All confidence intervals.
+
+    Returns
+    -------
+    output : dict
+        Data for all regions (one dict per region) by confidence interval.
+
+    """
+    scenario = parse_scenario(option['scenario'])
+    strategy = parse_strategy(option['strategy'])
+
+    site_densities = find_site_densities_by_ci(
+        [region['demand_mbps_km2'] for region in regions],
+        [region['geotype'] for region in regions],
+        [compile_capacity_curves(capacity_lut, option, global_parameters,
+            country_parameters, ci) for ci in confidence_intervals]
+    )
+
+    output = {ci: [] for ci in confidence_intervals}
+
+    for idx, region in enumerate(regions):
+
+        results = {}
+
+        for ci_idx, ci in enumerate(confidence_intervals):
+
+            site_density = site_densities[ci_idx][idx]
+
+            if site_density not in results:
+                results[site_density] = estimate_region_supply(dict(region),
+                    site_density, option, global_parameters,
+                    country_parameters, costs, core_lut)
+
+            output_region = dict(results[site_density])
+
+            output_region['scenario'] = scenario.name
+            output_region['strategy'] = strategy.name
+            output_region['confidence'] = ci
+
+            output[ci].append(output_region)
+
+    return output
+
+
+def estimate_region_supply(region, site_density, option, global_parameters,
+    country_parameters, costs, core_lut):
+    """
+    Estimate the sites, backhaul and network cost for a region, given the
+    site density needed to meet demand.
+
+    Parameters
+    ----------
+    region : dict
+        Data for a single region.
+    site_density : float
+        Estimated site density.
+    option : dict
+        Contains the scenario and strategy.
+    global_parameters : dict
+        All global model parameters.
+    country_parameters : dict
+        All country specific parameters.
+    costs : dict
+        All equipment costs.
+    core_lut : dict
+        Contains the number of existing and required, core and regional assets.
+
+    Returns
+    -------
+    region : dict
+        Data for a single region.
+
+    """
+    strategy = parse_strategy(option['strategy'])
+
+    region['network_site_density'] = site_density
+
+    total_sites_required = math.ceil(region['network_site_density'] *
+        region['area_km2'])
+
+    region = estimate_site_upgrades(
+        region,
+        strategy,
+        total_sites_required,
+        country_parameters
+    )
+
+    region = estimate_backhaul_upgrades(region, strategy, country_parameters)
+
+    region = find_single_network_cost(
+        region,
+        option,
+        costs,
+        global_parameters,
+        country_parameters,
+        core_lut,
+    )
+
+    return region
+
+
 def find_site_density(region, option, global_parameters, country_parameters,
-    capacity_lut, ci):
+    capacity_lut, ci, curves=None):
     """
     For a given region, estimate the number of needed sites.
 
@@ -110,6 +237,8 @@ def find_site_density(region, option, global_parameters, country_parameters,
         A dictionary containing the lookup capacities.
     ci : int
         Confidence interval.
+    curves : dict, optional
+        Precompiled capacity curves by geotype (see compile_capacity_curves).
 
     Return
     ------
@@ -119,99 +248,270 @@ def find_site_density(region, option, global_parameters, country_parameters,
     """
     demand = region['demand_mbps_km2']
     geotype = region['geotype'].split(' ')[0]
-    ant_type = 'macro'
-    generation = option['strategy'].split('_')[0]
-    frequencies = country_parameters['frequencies']
-    frequencies = frequencies[generation]
+
+    if curves is not None and geotype in curves:
+        curve = curves[geotype]
+    else:
+        strategy = parse_strategy(option['strategy'])
+        curve = build_capacity_curve(
+            capacity_lut,
+            geotype,
+            strategy.generation,
+            strategy.get_frequencies(country_parameters),
+            ci,
+            global_parameters
+        )
+
+    return lookup_site_density(curve, demand)
+
+
+CapacityCurve = namedtuple('CapacityCurve', ['densities', 'capacities', 'monotonic'])
+
+
+def build_capacity_curve(capacity_lut, geotype, generation, frequencies, ci,
+    global_parameters, ant_type='macro'):
+    """
+    Merge the density to capacity lookups for all frequencies into a single
+    curve, sorted by site density.
+
+    The capacities of all frequencies are summed for each unique site density,
+    and scaled by the (downlink) channel bandwidth.
+
+    Parameters
+    ----------
+    capacity_lut : dict
+        A dictionary containing the lookup capacities.
+    geotype : string
+        The settlement type e.g. urban, suburban or rural.
+    generation : string
+        The cellular generation such as 4G or 5G.
+    frequencies : list of dicts
+        The frequencies (and bandwidths) used by the generation.
+    ci : int
+        Confidence interval.
+    global_parameters : dict
+        All global model parameters.
+    ant_type : string
+        The antenna type, such as a macro cell or micro cell.
+
+    Returns
+    -------
+    curve : CapacityCurve
+        Sorted site densities and capacities (as numpy arrays), and whether
+        capacity never decreases with density.
+
+    """
     ci = str(ci)
-    unique_densities = set()
 
-    capacity = 0
+    density_capacities = []
 
     for item in frequencies:
 
         frequency = str(item['frequency'])
-        bandwidth = str(item['bandwidth'].split('x')[1])
+        channels, bandwidth = item['bandwidth'].split('x')
+        channels, bandwidth = float(channels), float(bandwidth)
+
+        if channels == 1: #allocate downlink channel width when using TDD
+            downlink = float(global_parameters['tdd_dl_to_ul'].split(':')[0])
+            bandwidth = bandwidth * (downlink / 100)
 
-        density_capacities = lookup_capacity(
+        density_capacities.append(np.asarray(lookup_capacity(
             capacity_lut,
             geotype,
             ant_type,
             frequency,
             generation,
             ci
-        )
+        ), dtype='float64').reshape(-1, 2))
+
+    # the capacities are scaled by the bandwidth of the last frequency
+    density_capacities = np.concatenate(density_capacities)
+
+    densities, inverse = np.unique(density_capacities[:, 0], return_inverse=True)
+    capacities = np.bincount(inverse.ravel(), weights=density_capacities[:, 1],
+        minlength=len(densities))
 
-        for item in density_capacities:
-            site_density, capacity = item
-            unique_densities.add(site_density)
+    capacities = capacities * bandwidth
 
-    density_lut = []
+    monotonic = bool(np.all(np.diff(capacities) >= 0))
 
-    for density in list(unique_densities):
+    return CapacityCurve(densities, capacities, monotonic)
 
-        capacity = 0
 
-        for item in frequencies:
+def compile_capacity_curves(capacity_lut, option, global_parameters,
+    country_parameters, ci):
+    """
+    Build the capacity curves for every geotype once per country and option.
+
+    Parameters
+    ----------
+    capacity_lut : dict
+        A dictionary containing the lookup capacities.
+    option : dict
+        Contains the scenario and strategy.
+    global_parameters : dict
+        All global model parameters.
+    country_parameters : dict
+        All country specific parameters.
+    ci : int
+        Confidence interval.
+
+    Returns
+    -------
+    curves : dict
+        CapacityCurve by geotype (geotypes missing from the lookup table
+        are left out).
 
-            frequency = str(item['frequency'])
-            channels, bandwidth = item['bandwidth'].split('x')
-            channels, bandwidth = float(channels), float(bandwidth)
+    """
+    strategy = parse_strategy(option['strategy'])
+    frequencies = strategy.get_frequencies(country_parameters)
 
-            if channels == 1: #allocate downlink channel width when using TDD
-                downlink = float(global_parameters['tdd_dl_to_ul'].split(':')[0])
-                bandwidth = bandwidth * (downlink / 100)
+    curves = {}
+
+    for geotype in ['urban', 'suburban', 'rural']:
+        try:
+            curves[geotype] = build_capacity_curve(capacity_lut, geotype,
+                strategy.generation, frequencies, ci, global_parameters)
+        except (KeyError, ValueError):
+            continue
+
+    return curves
+
+
+def lookup_site_density(curve, demand):
+    """
+    Find the site density needed to meet the demand, by interpolating
+    along the capacity curve.
 
-            density_capacities = lookup_capacity(
-                capacity_lut,
-                geotype,
-                ant_type,
-                frequency,
-                generation,
-                ci
+    Parameters
+    ----------
+    curve : CapacityCurve
+        Sorted site densities and capacities.
+    demand : float
+        Demand in Mbps per square kilometer.
+
+    Returns
+    -------
+    site_density : float
+        Estimated site density.
+
+    """
+    densities, capacities, monotonic = curve
+
+    if demand > capacities[-1]:
+
+        return float(densities[-1])
+
+    elif demand < capacities[0]:
+
+        return float(densities[0])
+
+    if monotonic:
+
+        idx = bisect_right(capacities, demand)
+
+        if idx == len(capacities):
+            return float(densities[-1])
+
+        return interpolate(
+            float(capacities[idx - 1]), float(densities[idx - 1]),
+            float(capacities[idx]), float(densities[idx]),
+            demand
+        )
+
+    for idx in range(1, len(capacities)):
+
+        if capacities[idx - 1] <= demand < capacities[idx]:
+
+            return interpolate(
+                float(capacities[idx - 1]), float(densities[idx - 1]),
+                float(capacities[idx]), float(densities[idx]),
+                demand
             )
 
-            for density_capacity in density_capacities:
+    return float(densities[-1])
 
-                if density_capacity[0] == density:
-                    capacity += density_capacity[1]
 
-        density_lut.append((density, capacity))
+def find_site_densities(demand_mbps_km2, geotypes, curves):
+    """
+    Estimate the site density for all regions in one call.
 
-    density_lut = sorted(density_lut, key=lambda tup: tup[0])
+    Parameters
+    ----------
+    demand_mbps_km2 : list or array
+        Demand in Mbps per square kilometer for each region.
+    geotypes : list or array
+        Geotype of each region (e.g. 'urban' or 'rural 1').
+    curves : dict
+        Precompiled capacity curves by geotype (see compile_capacity_curves).
 
-    max_density, max_capacity = density_lut[-1]
-    min_density, min_capacity = density_lut[0]
+    Returns
+    -------
+    site_densities : list of floats
+        Estimated site density for each region.
 
-    max_capacity = max_capacity * bandwidth
-    min_capacity = min_capacity * bandwidth
+    """
+    demand = np.asarray(demand_mbps_km2, dtype='float64')
+    geotypes = np.array([geotype.split(' ')[0] for geotype in geotypes])
 
-    if demand > max_capacity:
+    site_densities = np.full(len(demand), np.nan)
 
-        return max_density
+    for geotype in np.unique(geotypes):
 
-    elif demand < min_capacity:
+        if geotype not in curves:
+            raise KeyError("Geotype %s not found in capacity curves", geotype)
 
-        return min_density
+        densities, capacities, monotonic = curves[geotype]
 
-    else:
+        mask = geotypes == geotype
+        values = demand[mask]
 
-        for a, b in pairwise(density_lut):
+        if not monotonic:
+            site_densities[mask] = [
+                lookup_site_density(curves[geotype], value) for value in values]
+            continue
 
-            lower_density, lower_capacity  = a
-            upper_density, upper_capacity  = b
+        idx = np.searchsorted(capacities, values, side='right')
+        upper = np.clip(idx, 1, len(capacities) - 1)
+        lower = upper - 1
 
-            lower_capacity = lower_capacity * bandwidth
-            upper_capacity = upper_capacity * bandwidth
+        x0, y0 = capacities[lower], densities[lower]
+        x1, y1 = capacities[upper], densities[upper]
 
-            if lower_capacity <= demand < upper_capacity:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            result = (y0 * (x1 - values) + y1 * (values - x0)) / (x1 - x0)
 
-                site_density = interpolate(
-                    lower_capacity, lower_density,
-                    upper_capacity, upper_density,
-                    demand
-                )
-                return site_density
+        result = np.where(idx >= len(capacities), densities[-1], result)
+        result = np.where(values < capacities[0], densities[0], result)
+
+        site_densities[mask] = result
+
+    return site_densities.tolist()
+
+
+def find_site_densities_by_ci(demand_mbps_km2, geotypes, curves_by_ci):
+    """
+    Estimate the site density for all regions and confidence intervals.
+
+    Parameters
+    ----------
+    demand_mbps_km2 : list or array
+        Demand in Mbps per square kilometer for each region.
+    geotypes : list or array
+        Geotype of each region (e.g. 'urban' or 'rural 1').
+    curves_by_ci : list of dicts
+        Precompiled capacity curves by geotype, for each confidence interval.
+
+    Returns
+    -------
+    site_densities : list of lists
+        Estimated site density for each confidence interval and region.
+
+    """
+    demand = np.asarray(demand_mbps_km2, dtype='float64')
+
+    return [find_site_densities(demand, geotypes, curves)
+        for curves in curves_by_ci]
 
 
 def lookup_capacity(capacity_lut, env, ant_type, frequency,
@@ -223,7 +523,7 @@ def lookup_capacity(capacity_lut, env, ant_type, frequency,
 
     Parameters
     ----------
-    capacity_lut : dict
+    capacity_lut : dict or mapping
         A dictionary containing the lookup capacities.
     env : string
         The settlement type e.g. urban, suburban or rural.
@@ -238,8 +538,9 @@ def lookup_capacity(capacity_lut, env, ant_type, frequency,
 
     Returns
     -------
-    site_densities_to_capacities : list of tuples
-        Returns a list of site density to capacity tuples.
+    site_densities_to_capacities : list of tuples or array
+        Returns a list of site density to capacity tuples (or a zero-copy
+        array slice for compiled lookup tables).
 
     """
     if (env, ant_type, frequency, generation, ci) not in capacity_lut:
@@ -287,7 +588,7 @@ def estimate_site_upgrades(region, strategy, total_sites_required,
     ----------
     region : dict
         Contains all regional data.
-    strategy : dict
+    strategy : string or Strategy
         Controls the strategy variants being tested in the model and is
         defined based on the type of technology generation, core and
         backhaul, and the level of sharing, subsidy, spectrum and tax.
@@ -302,7 +603,7 @@ def estimate_site_upgrades(region, strategy, total_sites_required,
         Contains all regional data.
 
     """
-    generation = strategy.split('_')[0]
+    generation = parse_strategy(strategy).generation
     geotype = region['geotype'].split(' ')[0]
 
     #get the number of networks in the area
@@ -350,7 +651,7 @@ def estimate_backhaul_upgrades(region, strategy, country_parameters):
     ----------
     region : dict
         Contains all regional data.
-    strategy : dict
+    strategy : string or Strategy
         The strategy string controls the strategy variants being tested in the
         model and is defined based on the type of technology generation, core
         and backhaul, and the level of sharing, subsidy, spectrum and tax.
@@ -363,7 +664,7 @@ def estimate_backhaul_upgrades(region, strategy, country_parameters):
         Contains all regional data.
 
     """
-    backhaul = strategy.split('_')[2]
+    backhaul = parse_strategy(strategy).backhaul
     geotype = region['geotype'].split(' ')[0]
     networks = country_parameters['networks']['baseline' + '_' + geotype]
     all_sites = (region['new_mno_sites'] + region['upgraded_mno_sites']) #/ networks
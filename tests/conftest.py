@@ -1,5 +1,10 @@
+import os
+import sys
 from pytest import fixture
 
+#the scripts folder is not a package, so add it to the path for its tests
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+
 
 @fixture(scope='function')
 def setup_region():
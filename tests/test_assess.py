@@ -1,8 +1,10 @@
 import pytest
+import numpy as np
 from pytal.assess import (get_administration_cost,
     get_spectrum_costs, calculate_tax, calculate_profit,
     assess, estimate_subsidies, allocate_available_excess,
-    calculate_total_market_costs, calc)
+    allocate_cross_subsidy, calculate_total_market_costs,
+    get_total_market_costs, calc)
 
 
 def test_assess(setup_option, setup_global_parameters, setup_country_parameters,
@@ -293,6 +295,36 @@ def test_estimate_subsidies():
     assert available_cross_subsidy == 0
 
 
+def test_allocate_cross_subsidy():
+    """
+    Unit test.
+
+    """
+    deficit = np.array([3000, 0, 1000, 5000])
+
+    answer = allocate_cross_subsidy(5000, deficit)
+
+    assert list(answer) == [3000, 0, 1000, 1000]
+
+    answer = allocate_cross_subsidy(0, deficit)
+
+    assert list(answer) == [0, 0, 0, 0]
+
+    #check against allocating region by region
+    deficit = np.random.RandomState(1).rand(50) * 1000
+    answer = allocate_cross_subsidy(20000, deficit)
+
+    available = 20000
+    for idx in np.argsort(deficit, kind='stable'):
+        region = {
+            'total_mno_revenue': 0,
+            'total_mno_cost': deficit[idx],
+            'deficit': deficit[idx],
+        }
+        region, available = estimate_subsidies(region, available)
+        assert answer[idx] == region['used_cross_subsidy']
+
+
 def test_allocate_available_excess():
     """
     Unit test.
@@ -361,6 +393,27 @@ def test_calculate_total_market_costs(setup_option, setup_country_parameters):
     assert answer[0]['total_used_cross_subsidy'] == 100
 
 
+def test_get_total_market_costs(setup_option, setup_country_parameters):
+    """
+    Unit test.
+
+    """
+    regions = [
+        {'geotype': 'rural 1', 'phones_on_network': 33.3, 'ran': 10},
+        {'geotype': 'urban', 'phones_on_network': 100},
+    ]
+
+    answer = get_total_market_costs(regions, setup_option, setup_country_parameters)
+
+    for idx, region in enumerate(regions):
+        geotype = region['geotype'].split(' ')[0]
+        ms = 100 / setup_country_parameters['networks']['baseline_' + geotype]
+        assert answer['total_phones'][idx] == calc(region, 'phones_on_network', ms)
+        assert answer['total_ran'][idx] == calc(region, 'ran', ms)
+
+    assert answer['total_ran'][1] == 0
+
+
 def test_calc():
 
     region = {
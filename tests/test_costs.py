@@ -4,7 +4,10 @@ from pytal.costs import (greenfield_4g, upgrade_to_4g, greenfield_5g_nsa,
     upgrade_to_5g_nsa, greenfield_5g_sa, upgrade_to_5g_sa,
     get_fronthaul_costs, get_backhaul_costs, local_net_costs,
     regional_net_costs, core_costs, discount_opex,
-    discount_capex_and_opex, calc_costs, find_single_network_cost)
+    discount_capex_and_opex, calc_costs, find_single_network_cost,
+    get_site_classes, compile_core_lut, attach_core_lut, get_core_value,
+    compile_asset_table, get_cost_context)
+from pytal.financials import get_financial_factors
 
 #test approach is to:
 #integration test meta cost function
@@ -198,7 +201,30 @@ def test_find_single_network_cost(setup_region, setup_costs,
         setup_core_lut
     )
 
-    assert answer['network_cost'] == 2674016.4000000004#1451800.0 + 1027906
+    #site classes are costed once and multiplied, so compare at the
+    #precision of the per-site sum
+    assert round(answer['network_cost'], 1) == 2674016.4#1451800.0 + 1027906
+
+
+def test_get_site_classes():
+    """
+    Unit test.
+
+    """
+    #(upgraded, backhaul_quant, quantity)
+    assert get_site_classes(3, 5, 4) == [
+        (True, 1, 3), (True, 0, 0), (False, 1, 1), (False, 0, 1)]
+
+    #fractional upgrades round down, as with the per-site loop
+    assert get_site_classes(2.5, 4.5, 1) == [
+        (True, 1, 1), (True, 0, 1), (False, 1, 0), (False, 0, 2)]
+
+    assert get_site_classes(0, 0, 0) == [
+        (True, 1, 0), (True, 0, 0), (False, 1, 0), (False, 0, 0)]
+
+    #backhaul exceeding the number of sites is capped
+    assert get_site_classes(1, 2, 10) == [
+        (True, 1, 1), (True, 0, 0), (False, 1, 1), (False, 0, 0)]
 
 
 def test_greenfield_4g(setup_region, setup_option, setup_costs,
@@ -826,6 +852,13 @@ def test_discount_opex(setup_global_parameters, setup_country_parameters):
     assert discount_opex(1000, setup_global_parameters, setup_country_parameters) == (
         1952 * (1 + (setup_country_parameters['financials']['wacc'] / 100)))
 
+    #precomputed financial factors are used when given
+    factors = get_financial_factors(setup_global_parameters,
+        setup_country_parameters)
+    assert discount_opex(1000, setup_global_parameters, setup_country_parameters,
+        factors) == discount_opex(1000, setup_global_parameters,
+        setup_country_parameters)
+
 
 def test_calc_costs(setup_region, setup_global_parameters, setup_country_parameters):
     """
@@ -935,3 +968,102 @@ def test_calc_costs(setup_region, setup_global_parameters, setup_country_paramet
         setup_country_parameters)
 
     assert answer == 0
+
+
+def test_compile_core_lut(setup_region, setup_costs, setup_global_parameters,
+    setup_country_parameters, setup_core_lut):
+    """
+    Unit test.
+
+    """
+    core_records = compile_core_lut(setup_core_lut)
+
+    assert core_records['MWI.1.1.1_1']['core_node_new'] == 2
+    assert core_records['MWI.1.1.1_1']['regional_edge_existing'] == 1000
+
+    regions = attach_core_lut([dict(setup_region[0]), {'GID_id': 'unknown'}],
+        core_records)
+
+    assert regions[0]['core_edge_new'] == 1000
+    assert regions[1]['core_edge_new'] is None
+
+    #attached records are used in place of the lookup table
+    assert get_core_value(regions[0], {}, 'regional_node', 'new') == 2
+    assert get_core_value(setup_region[0], setup_core_lut, 'regional_node', 'new') == 2
+    assert get_core_value(regions[1], setup_core_lut, 'core_edge', 'new') is None
+
+    with pytest.raises(KeyError):
+        get_core_value(regions[1], setup_core_lut, 'core_node', 'new', required=True)
+
+    region = regions[0]
+    region['new_mno_sites'] = 3
+    region['upgraded_mno_sites'] = 2
+    region['network_site_density'] = 0.5
+    region['backhaul_new'] = 1
+
+    answer = find_single_network_cost(dict(region),
+        {'strategy': '5G_sa_fiber_baseline_baseline_baseline_baseline'},
+        setup_costs, setup_global_parameters, setup_country_parameters, {})
+
+    setup_region[0].update(region)
+    for field in list(core_records['MWI.1.1.1_1'].keys()):
+        del setup_region[0][field]
+
+    expected = find_single_network_cost(setup_region[0],
+        {'strategy': '5G_sa_fiber_baseline_baseline_baseline_baseline'},
+        setup_costs, setup_global_parameters, setup_country_parameters,
+        setup_core_lut)
+
+    assert answer['network_cost'] == expected['network_cost']
+
+
+def test_compile_asset_table():
+    """
+    Unit test.
+
+    """
+    asset_table = compile_asset_table()
+
+    assert asset_table['bbu_cabinet'].cost_type == 'capex'
+    assert asset_table['bbu_cabinet'].category == 'ran'
+    assert asset_table['single_sector_antenna'].quantity_rule == 'sectorization'
+    assert asset_table['cloud_backhaul'].per_site == True
+    assert asset_table['regional_node'].fiber_only == True
+    assert asset_table['local_node'].category is None
+
+    #the rack is capex only, so has no quantity rule applied
+    assert asset_table['rack'].quantity_rule is None
+
+    assert 'router' not in asset_table
+
+
+def test_get_cost_context(setup_region, setup_costs, setup_global_parameters,
+    setup_core_lut, setup_country_parameters):
+    """
+    Unit test.
+
+    """
+    setup_region[0]['new_mno_sites'] = 3
+    setup_region[0]['upgraded_mno_sites'] = 2
+    setup_region[0]['network_site_density'] = 0.5
+
+    strategy = '5G_sa_fiber_baseline_baseline_baseline_baseline'
+
+    context = get_cost_context(setup_region[0], strategy, setup_costs,
+        setup_global_parameters, setup_core_lut, setup_country_parameters)
+
+    assert context['backhaul'] == get_backhaul_costs(setup_region[0],
+        'fiber_backhaul', setup_costs, setup_core_lut)
+    assert context['fronthaul'] == get_fronthaul_costs(setup_region[0], setup_costs)
+
+    for builder in [greenfield_5g_sa, upgrade_to_5g_sa]:
+        assert builder(setup_region[0], strategy, setup_costs,
+            setup_global_parameters, setup_core_lut, setup_country_parameters,
+            context) == builder(setup_region[0], strategy, setup_costs,
+            setup_global_parameters, setup_core_lut, setup_country_parameters)
+
+    context = get_cost_context(setup_region[0],
+        '4G_epc_microwave_baseline_baseline_baseline_baseline', setup_costs,
+        setup_global_parameters, setup_core_lut, setup_country_parameters)
+
+    assert 'fronthaul' not in context
@@ -1,5 +1,6 @@
 import pytest
-from pytal.demand import estimate_demand, get_per_user_capacity, estimate_arpu
+from pytal.demand import (estimate_demand, get_per_user_capacity, estimate_arpu,
+    estimate_demand_arrays, get_region_columns)
 
 
 def test_estimate_demand(
@@ -226,3 +227,169 @@ def test_estimate_arpu(setup_region, setup_timesteps, setup_global_parameters,
         setup_country_parameters)
 
     assert answer == 2
+
+
+def test_estimate_demand_arrays(
+    setup_region,
+    setup_option,
+    setup_global_parameters,
+    setup_country_parameters,
+    ):
+    """
+    Integration test, checking the array engine against a per region
+    calculation.
+
+    """
+    timesteps = list(range(2020, 2030 + 1))
+    penetration_lut = {t: 40 + t - 2020 for t in timesteps}
+    smartphone_lut = {
+        'urban': {t: 50 + t - 2020 for t in timesteps},
+        'rural': {t: 20 + t - 2020 for t in timesteps},
+    }
+
+    regions = []
+    for geotype, luminosity, area in [('urban', 10, 2), ('suburban 1', 2, 5),
+        ('rural 3', 0, 40), ('rural 5', 0, 0)]:
+        region = dict(setup_region[0])
+        region['geotype'] = geotype
+        region['mean_luminosity_km2'] = luminosity
+        region['area_km2'] = area
+        regions.append(region)
+
+    columns = {key: [region[key] for region in regions] for key in regions[0]}
+
+    answer = estimate_demand_arrays(
+        columns,
+        setup_option,
+        setup_global_parameters,
+        setup_country_parameters,
+        timesteps,
+        penetration_lut,
+        smartphone_lut
+    )
+
+    assert list(answer['valid']) == [True, True, True, False]
+
+    #per region and year calculation (for modeled regions)
+    for idx, region in enumerate(regions[:3]):
+
+        geotype = region['geotype'].split(' ')[0]
+        geotype_sps = 'urban' if geotype == 'suburban' else geotype
+        networks = setup_country_parameters['networks'][
+            'baseline_{}'.format(geotype)]
+        capacity = get_per_user_capacity(region['geotype'], setup_option)
+
+        revenue = []
+        demand_mbps_km2 = []
+
+        for year_idx, timestep in enumerate(timesteps):
+
+            arpu = estimate_arpu(region, timestep, setup_global_parameters,
+                setup_country_parameters)
+            phones = region['population'] * (penetration_lut[timestep] / 100) / networks
+            smartphones = phones * (smartphone_lut[geotype_sps][timestep] / 100)
+
+            demand_mbps_km2.append(smartphones * capacity /
+                setup_global_parameters['overbooking_factor'] / region['area_km2'])
+            revenue.append(arpu * phones * 12)
+
+            assert answer['phones_on_network'][idx][year_idx] == pytest.approx(phones)
+            assert answer['revenue'][idx][year_idx] == pytest.approx(revenue[-1])
+
+        assert answer['demand_mbps_km2'][idx] == pytest.approx(max(demand_mbps_km2))
+        assert answer['total_mno_revenue'][idx] == round(sum(revenue))
+        assert answer['revenue_km2'][idx] == round(sum(revenue) / region['area_km2'])
+
+    expected, annual_expected = estimate_demand(
+        [dict(region) for region in regions],
+        setup_option,
+        setup_global_parameters,
+        setup_country_parameters,
+        timesteps,
+        penetration_lut,
+        smartphone_lut
+    )
+
+    #regions without area are not modeled
+    assert [region['GID_id'] for region in expected] == [
+        region['GID_id'] for region in regions[:3]]
+    assert expected[1]['total_mno_revenue'] == answer['total_mno_revenue'][1]
+    assert expected[2]['phones_on_network'] == answer['phones_on_network'][2][-1]
+    assert expected[2]['penetration'] == penetration_lut[2030]
+    assert len(annual_expected) == 3 * len(timesteps)
+
+
+def test_estimate_demand_annual(
+    setup_region,
+    setup_region_rural,
+    setup_option,
+    setup_global_parameters,
+    setup_country_parameters,
+    ):
+    """
+    Integration test, checking the annual output against the demand arrays.
+
+    """
+    timesteps = [2020, 2021, 2022]
+    penetration_lut = {t: 40 + t - 2020 for t in timesteps}
+    smartphone_lut = {
+        'urban': {t: 50 + t - 2020 for t in timesteps},
+        'rural': {t: 20 + t - 2020 for t in timesteps},
+    }
+
+    regions = [dict(setup_region[0]), dict(setup_region_rural[0])]
+
+    expected = estimate_demand_arrays(
+        get_region_columns(regions),
+        setup_option,
+        setup_global_parameters,
+        setup_country_parameters,
+        timesteps,
+        penetration_lut,
+        smartphone_lut
+    )
+
+    answer, annual_answer = estimate_demand(
+        [dict(region) for region in regions],
+        setup_option,
+        setup_global_parameters,
+        setup_country_parameters,
+        timesteps,
+        penetration_lut,
+        smartphone_lut
+    )
+
+    assert len(answer) == 2
+    assert len(annual_answer) == 6
+
+    #rows are ordered by region and then year
+    rows = list(annual_answer)
+    assert list(rows[0].keys()) == [
+        'GID_0', 'GID_id', 'scenario', 'strategy', 'confidence', 'year',
+        'population', 'area_km2', 'population_km2', 'geotype',
+        'arpu_discounted_monthly', 'penetration', 'population_with_phones',
+        'phones_on_network', 'smartphone_penetration',
+        'smartphones_on_network', 'revenue'
+    ]
+
+    for idx, region in enumerate(regions):
+        for year_idx, timestep in enumerate(timesteps):
+            row = rows[idx * len(timesteps) + year_idx]
+            assert row['GID_id'] == region['GID_id']
+            assert row['year'] == timestep
+            assert row['strategy'] == setup_option['strategy']
+            assert row['population'] == region['population']
+            assert row['geotype'] == region['geotype']
+            assert row['penetration'] == penetration_lut[timestep]
+            assert row['phones_on_network'] == (
+                expected['phones_on_network'][idx][year_idx])
+            assert row['revenue'] == expected['revenue'][idx][year_idx]
+
+    national = annual_answer.national()
+    assert list(national['year']) == timesteps
+    assert national['revenue'][1] == pytest.approx(
+        sum(row['revenue'] for row in rows if row['year'] == 2021))
+
+    relabelled = annual_answer.relabel('other')
+    assert relabelled.strategy == 'other'
+    assert annual_answer.strategy == setup_option['strategy']
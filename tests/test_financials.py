@@ -0,0 +1,33 @@
+import pytest
+from pytal.financials import (get_financial_factors,
+    get_discount_divisor)
+
+
+def test_get_financial_factors(setup_global_parameters, setup_country_parameters):
+    """
+    Unit test.
+
+    """
+    factors = get_financial_factors(setup_global_parameters,
+        setup_country_parameters, [2020, 2021])
+
+    # return period = 2, discount rate = 5%
+    assert factors.annuity == pytest.approx(1 + 1 / 1.05)
+    assert factors.wacc_multiplier == 1.1
+    assert factors.timestep_annuity == pytest.approx(1 + 1 / 1.05)
+
+    #factors are cached for the same parameters
+    assert get_financial_factors(setup_global_parameters,
+        setup_country_parameters, [2020, 2021]) is factors
+
+    with pytest.raises(AttributeError):
+        factors.annuity = 1
+
+
+def test_get_discount_divisor():
+    """
+    Unit test.
+
+    """
+    assert get_discount_divisor(5, 0) == 1
+    assert get_discount_divisor(5, 2) == 1.05 ** 2
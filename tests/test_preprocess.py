@@ -0,0 +1,242 @@
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pytest
+
+gpd = pytest.importorskip('geopandas')
+pytest.importorskip('fiona')
+pytest.importorskip('networkx')
+pytest.importorskip('rtree')
+pytest.importorskip('scipy')
+rasterio = pytest.importorskip('rasterio')
+
+from affine import Affine
+from rasterio.transform import from_origin
+from rasterio.windows import Window
+from shapely.geometry import Point, Polygon, box
+
+from preprocess import (get_zonal_sums, get_raster_window, find_settlements,
+    get_region_windows, find_region_settlements, find_nodes_in_regions,
+    get_agglomerations)
+
+
+class RasterStub(object):
+    """
+    The raster attributes used by get_raster_window.
+
+    """
+    def __init__(self, transform, width, height):
+        self.transform = transform
+        self.width = width
+        self.height = height
+
+
+def write_raster(path, array, transform, nodata=None):
+
+    with rasterio.open(path, 'w', driver='GTiff', height=array.shape[0],
+        width=array.shape[1], count=1, dtype=array.dtype, transform=transform,
+        nodata=nodata) as sink:
+        sink.write(array, 1)
+
+
+def test_get_zonal_sums(tmp_path):
+    """
+    Unit test.
+
+    """
+    path = str(tmp_path / 'raster.tif')
+
+    array = np.array([
+        [1, 2, 3, 4],
+        [5, np.nan, 7, 8],
+        [9, 10, 99, 12],
+        [13, 14, 15, -2],
+    ], dtype='float32')
+
+    #one unit pixels, with the raster covering (0, 0, 4, 4)
+    write_raster(path, array, from_origin(0, 4, 1, 1), nodata=99)
+
+    geometries = [
+        box(0, 0, 2, 4),
+        box(2, 0, 4, 4),
+        #overlaps both of the above
+        box(1, 0, 3, 2),
+        None,
+        Polygon(),
+    ]
+
+    sums = get_zonal_sums(path, geometries)
+
+    #nan, nodata and negative pixels are excluded, and pixels covered by
+    #overlapping geometries are counted in each of them
+    assert list(sums) == [54, 49, 39, 0, 0]
+
+    assert list(get_zonal_sums(path, [None])) == [0]
+
+
+def test_get_raster_window():
+    """
+    Unit test.
+
+    """
+    #half unit pixels, with the raster covering (10, 17, 14, 20)
+    src = RasterStub(Affine(0.5, 0, 10, 0, -0.5, 20), width=8, height=6)
+
+    #partially covered pixels are included
+    assert get_raster_window(src, (10.2, 18.1, 11.3, 19.6)) == Window(0, 0, 3, 4)
+
+    #bounds beyond the raster are clipped to its extent
+    assert get_raster_window(src, (13, 16, 15, 18)) == Window(6, 4, 2, 2)
+    assert get_raster_window(src, (9, 16, 15, 21)) == Window(0, 0, 8, 6)
+
+    #bounds outside the raster
+    assert get_raster_window(src, (20, 0, 21, 1)) is None
+
+
+def test_find_settlements():
+    """
+    Unit test.
+
+    """
+    data = np.zeros((7, 7))
+
+    #diagonal neighbours are separate settlements (4-connectivity)
+    data[0, 0] = 10
+    data[1, 1] = 10
+
+    #a settlement including a nodata pixel
+    data[0, 5] = 255
+    data[0, 6] = 20
+
+    #a ring around a pixel below the threshold
+    data[3:6, 3:6] = 6
+    data[4, 4] = 1
+
+    settlements = find_settlements(data, from_origin(0, 7, 1, 1), 5, nodata=255)
+
+    #settlements are ordered by their first pixel (by row, then column)
+    assert len(settlements) == 4
+
+    #nodata pixels are excluded from the count and sum
+    assert list(settlements['count']) == [1, 1, 1, 8]
+    assert list(settlements['sum']) == [10, 20, 10, 48]
+
+    #centroids are the mean pixel centers, so the ring is centered on the
+    #pixel it surrounds
+    assert list(settlements['x']) == [0.5, 6, 1.5, 4.5]
+    assert list(settlements['y']) == [6.5, 6.5, 5.5, 2.5]
+
+    #no pixels at or above the threshold
+    assert len(find_settlements(data, from_origin(0, 7, 1, 1), 300)) == 0
+
+
+def test_get_region_windows(tmp_path):
+    """
+    Unit test.
+
+    """
+    path = str(tmp_path / 'settlements.tif')
+
+    array = np.arange(48, dtype='float32').reshape(6, 8)
+    write_raster(path, array, from_origin(10, 20, 0.5, 0.5), nodata=-1)
+
+    regions = gpd.GeoDataFrame({
+        'GID_2': ['A', 'B', 'C'],
+        'geometry': [
+            box(10.2, 18.1, 11.3, 19.6),
+            #partially beyond the raster
+            box(13, 16, 15, 18),
+            #outside the raster
+            box(20, 0, 21, 1),
+        ]
+    }, crs='epsg:4326')
+
+    with rasterio.open(path) as src:
+
+        windows = get_region_windows(src, regions, 'GID_2')
+
+        for region in regions.to_dict('records'):
+
+            window = get_raster_window(src, region['geometry'].bounds)
+            answer = windows[region['GID_2']]
+
+            assert answer['nodata'] == -1
+
+            if window is None:
+                assert answer['data'].size == 0
+                continue
+
+            #each window is sliced from the raster as read in full
+            assert np.array_equal(answer['data'], src.read(1, window=window))
+            assert answer['transform'] == src.window_transform(window)
+
+    assert windows['A']['data'].shape == (4, 3)
+    assert windows['B']['transform'] == from_origin(13, 18, 0.5, 0.5)
+    assert windows['A']['data'].base is windows['B']['data'].base
+
+
+def test_find_region_settlements():
+    """
+    Unit test.
+
+    """
+    data = np.zeros((4, 4))
+    data[0, 0] = 10
+    data[2:, 2:] = 20
+
+    windows = {
+        'A': {'data': data, 'transform': from_origin(0, 4, 1, 1), 'nodata': None},
+        'B': {'data': data[2:], 'transform': from_origin(0, 2, 1, 1),
+            'nodata': None},
+    }
+
+    expected = find_region_settlements(windows, ['A', 'B'], 5)
+
+    assert list(expected['A']['sum']) == [10, 80]
+    assert list(expected['B']['sum']) == [80]
+
+    #the same settlements are found when given a pool of workers
+    with ThreadPoolExecutor(2) as executor:
+        answer = find_region_settlements(windows, ['A', 'B'], 5, executor)
+
+    for region_id in ['A', 'B']:
+        assert answer[region_id].equals(expected[region_id])
+
+
+def test_find_nodes_in_regions():
+    """
+    Unit test.
+
+    """
+    #two adjacent squares and a region without nodes
+    regions = [box(0, 0, 1, 1), box(1, 0, 2, 1), box(5, 5, 6, 6)]
+
+    nodes = [
+        Point(1.5, 0.5),
+        #on the shared edge
+        Point(1, 0.5),
+        Point(0.5, 0.5),
+        #outside all regions
+        Point(3, 3),
+    ]
+
+    #nodes on a shared edge intersect both regions
+    assert find_nodes_in_regions(nodes, regions) == [[1, 2], [0, 1], []]
+
+    assert find_nodes_in_regions([], regions) == [[], [], []]
+
+    regions = [
+        {'GID_0': 'MWI', 'GID_2': 'MWI.{}'.format(idx), 'geometry': region}
+        for idx, region in enumerate(regions)
+    ]
+
+    agglomerations = get_agglomerations([0, 1, 2], regions, nodes,
+        [10, 20, 30, 40], 'GID_2')
+
+    assert [(item['properties']['id'], item['properties']['population'])
+        for item in agglomerations] == [
+            (0, 20), (0, 30), (1, 10), (1, 20), ('regional_node', 1)]
+
+    #regions without nodes fall back to their centroid
+    assert agglomerations[-1]['geometry'] == {
+        'type': 'Point', 'coordinates': (5.5, 5.5)}
+    assert agglomerations[-1]['properties']['GID_2'] == 'MWI.2'
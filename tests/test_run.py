@@ -0,0 +1,247 @@
+import os
+import pickle
+from concurrent.futures import Future
+import numpy as np
+import pytest
+
+pytest.importorskip('geopandas')
+pytest.importorskip('tqdm')
+
+import run
+from run import CapacityLookupTable, load_capacity_lookup
+from pytal.demand import estimate_demand
+from pytal.supply import estimate_supply
+from pytal.assess import assess
+
+STRATEGY = '4G_epc_microwave_baseline_baseline_baseline_baseline'
+
+CAPACITY_LUT_HEADER = ('environment,ant_type,frequency_GHz,generation,'
+    'confidence_interval,sites_per_km2,capacity_mbps_km2\n')
+
+
+def write_capacity_lut(path, capacity):
+
+    with open(path, 'w') as sink:
+        sink.write(CAPACITY_LUT_HEADER)
+        sink.write('Urban,macro,0.8,4G,50,0.5,{}\n'.format(capacity))
+        sink.write('Urban,macro,0.8,4G,50,0.1,10\n')
+
+
+def test_load_capacity_lookup(tmp_path):
+    """
+    Unit test.
+
+    """
+    path = str(tmp_path / 'capacity_lut.csv')
+    folder = str(tmp_path / 'compiled')
+    key = ('urban', 'macro', '800', '4G', '50')
+
+    write_capacity_lut(path, 20)
+
+    lut = load_capacity_lookup(path, folder)
+
+    assert isinstance(lut, CapacityLookupTable)
+    assert list(lut.keys()) == [key]
+    assert lut[key].tolist() == [[0.1, 10], [0.5, 20]]
+
+    #pickled by path, so workers map the same compiled file
+    assert lut.__reduce__() == (CapacityLookupTable,
+        (lut.data_path, lut.index_path))
+    unpickled = pickle.loads(pickle.dumps(lut))
+    assert isinstance(unpickled.data, np.memmap)
+    assert unpickled[key].tolist() == lut[key].tolist()
+
+    #recompiled when the csv size changes
+    write_capacity_lut(path, 200)
+    assert load_capacity_lookup(path, folder)[key].tolist() == [[0.1, 10], [0.5, 200]]
+
+    #recompiled when only the csv mtime changes (same size)
+    stat = os.stat(path)
+    write_capacity_lut(path, 300)
+    assert os.stat(path).st_size == stat.st_size
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert load_capacity_lookup(path, folder)[key].tolist() == [[0.1, 10], [0.5, 300]]
+
+    #not recompiled when the csv is unchanged
+    data_mtime = os.stat(os.path.join(folder, 'capacity_lut.npy')).st_mtime_ns
+    load_capacity_lookup(path, folder)
+    assert os.stat(os.path.join(folder, 'capacity_lut.npy')).st_mtime_ns == data_mtime
+
+
+def setup_worker(monkeypatch, region, lookup, global_parameters,
+    country_parameters, costs, core_lut):
+    """
+    Hold a prepared country (three regions, one without area) in the worker.
+
+    """
+    regions = []
+    for idx, (geotype, area) in enumerate([('urban', 2), ('rural 1', 50),
+        ('rural 5', 0)]):
+        regions.append(dict(region, GID_id='MWI.{}'.format(idx),
+            geotype=geotype, area_km2=area, total_estimated_sites=100,
+            sites_4G=0, backhaul_fiber=0, backhaul_copper=0,
+            backhaul_microwave=0, backhaul_satellite=0))
+
+    for key, values in list(lookup.items()):
+        lookup[('rural',) + key[1:]] = [(density, capacity / 4)
+            for density, capacity in values]
+
+    core_lut = {
+        asset_type: {
+            '{}_{}'.format(region['GID_id'], source): list(values.values())[0]
+            for region in regions for source in ['new', 'existing']
+        }
+        for asset_type, values in core_lut.items()
+    }
+
+    timesteps = [2020, 2021]
+    penetration_lut = {2020: 50, 2021: 60}
+    smartphone_lut = {
+        'urban': {2020: 50, 2021: 55},
+        'rural': {2020: 30, 2021: 35},
+    }
+
+    monkeypatch.setitem(run.COUNTRY_PARAMETERS, 'MWI', country_parameters)
+
+    run.init_worker(lookup, global_parameters, costs, timesteps)
+    run.WORKER['countries']['MWI'] = {
+        'regions': regions,
+        'columns': run.get_region_columns(regions),
+        'penetration_lut': penetration_lut,
+        'smartphone_lut': smartphone_lut,
+        'core_lut': core_lut,
+    }
+
+    return regions, core_lut, timesteps, penetration_lut, smartphone_lut
+
+
+def test_plan_work_units():
+    """
+    Unit test.
+
+    """
+    options = [
+        {'scenario': 'S1_25_10_2', 'strategy': STRATEGY},
+        {'scenario': 'S1_25_10_2', 'strategy': STRATEGY[:-8] + 'high'},
+        {'scenario': 'S1_25_10_2', 'strategy': STRATEGY.replace('microwave', 'fiber')},
+        {'scenario': 'S1_25_10_2', 'strategy': '4G_epc_microwave_baseline_shared_baseline_baseline'},
+        {'scenario': 'S1_25_10_2', 'strategy': STRATEGY},
+    ]
+
+    units = run.plan_work_units([{'iso3': 'MWI'}, {'iso3': 'UGA'}], options, [50])
+
+    assert [unit['country']['iso3'] for unit in units] == ['MWI'] * 3 + ['UGA'] * 3
+
+    #demand is shared by adjacent options with the same scenario and networks,
+    #and supply by those which only differ by spectrum or tax
+    assert [unit['supply_groups'] for unit in units[:3]] == [
+        [[options[0], options[1]], [options[2]]],
+        [[options[3]]],
+        [[options[4]]],
+    ]
+
+    #options keep their order
+    assert [option for unit in units[:3] for group in unit['supply_groups']
+        for option in group] == options
+
+
+def test_run_work_unit(monkeypatch, setup_region, setup_lookup,
+    setup_global_parameters, setup_country_parameters, setup_costs,
+    setup_core_lut):
+    """
+    Integration test, checking the work units against a serial sweep.
+
+    """
+    setup_global_parameters['confidence'] = [50]
+
+    regions, core_lut, timesteps, penetration_lut, smartphone_lut = setup_worker(
+        monkeypatch, setup_region[0], setup_lookup, setup_global_parameters,
+        setup_country_parameters, setup_costs, setup_core_lut)
+
+    country = {'iso3': 'MWI'}
+
+    options = [
+        {'scenario': 'S1_50_50_50', 'strategy': STRATEGY},
+        {'scenario': 'S1_50_50_50', 'strategy': STRATEGY.replace('microwave', 'fiber')},
+        {'scenario': 'S1_50_50_50', 'strategy': '4G_epc_microwave_baseline_shared_baseline_baseline'},
+        {'scenario': 'S1_50_50_50', 'strategy': STRATEGY[:-8] + 'high'},
+    ]
+
+    units = run.plan_work_units([country], options, [50])
+
+    answer = []
+    for unit in units:
+        answer += run.run_work_unit(unit)
+
+    assert len(answer) == len(options)
+
+    for option, (annual_demand, final_results) in zip(options, answer):
+
+        data_demand, expected_demand = estimate_demand(
+            [dict(region) for region in regions], option,
+            setup_global_parameters, setup_country_parameters, timesteps,
+            penetration_lut, smartphone_lut)
+
+        data_supply = estimate_supply(country, data_demand, setup_lookup,
+            option, setup_global_parameters, setup_country_parameters,
+            setup_costs, core_lut, 50)
+
+        expected = assess(country, data_supply, option, setup_global_parameters,
+            setup_country_parameters, timesteps, setup_costs)
+
+        assert final_results == expected
+        assert annual_demand.strategy == option['strategy']
+        assert list(annual_demand) == list(expected_demand)
+
+    #the worker only holds the current country
+    assert list(run.WORKER['countries'].keys()) == ['MWI']
+
+
+class RecordingExecutor(object):
+    """
+    Executor running each unit on submit, recording the units in flight
+    (submitted, with results not yet collected).
+
+    """
+    def __init__(self):
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def submit(self, function, *args):
+
+        executor = self
+
+        class RecordingFuture(Future):
+            def result(self, timeout=None):
+                executor.in_flight -= 1
+                return Future.result(self, timeout)
+
+        future = RecordingFuture()
+        future.set_result(function(*args))
+
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+        return future
+
+
+def test_run_work_units(monkeypatch):
+    """
+    Unit test.
+
+    """
+    monkeypatch.setattr(run, 'run_work_unit',
+        lambda unit: [(unit, 'results_{}_{}'.format(unit, ci)) for ci in [1, 2]])
+
+    units = list(range(5))
+
+    expected = [(unit, 'results_{}_{}'.format(unit, ci))
+        for unit in units for ci in [1, 2]]
+
+    assert list(run.run_work_units(units)) == expected
+
+    #results keep the unit order, with at most max_pending units in flight
+    executor = RecordingExecutor()
+    assert list(run.run_work_units(units, executor, max_pending=2)) == expected
+    assert executor.max_in_flight == 2
+    assert executor.in_flight == 0
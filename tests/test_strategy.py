@@ -0,0 +1,154 @@
+import pytest
+from pytal.strategy import (Strategy, Scenario, parse_strategy, parse_scenario,
+    compile_option, get_stage_key)
+from pytal.costs import find_single_network_cost
+from pytal.demand import estimate_demand
+
+
+def test_strategy(setup_country_parameters):
+    """
+    Unit test.
+
+    """
+    strategy = Strategy('5G_sa_fiber_srn_shared_low_high', setup_country_parameters)
+
+    assert strategy.generation == '5G'
+    assert strategy.core == 'sa'
+    assert strategy.backhaul == 'fiber'
+    assert strategy.sharing == 'srn'
+    assert strategy.network_strategy == 'shared'
+    assert strategy.spectrum == 'low'
+    assert strategy.tax == 'high'
+    assert 'core_node' in strategy.shared_assets
+    assert strategy.networks == {'urban': 3, 'suburban': 3, 'rural': 1}
+    assert strategy.get_networks('rural', setup_country_parameters) == 1
+    assert strategy.get_frequencies(setup_country_parameters)[1]['frequency'] == 3500
+    assert str(strategy) == '5G_sa_fiber_srn_shared_low_high'
+
+    with pytest.raises(AttributeError):
+        strategy.generation = '4G'
+
+    with pytest.raises(AttributeError):
+        strategy.other = 1
+
+    #strategies compiled for countries with other lookups are not equal
+    other_parameters = dict(setup_country_parameters)
+    other_parameters['networks'] = dict(setup_country_parameters['networks'])
+    other_parameters['networks']['shared_rural'] = 2
+
+    other = Strategy('5G_sa_fiber_srn_shared_low_high', other_parameters)
+
+    assert other.get_networks('rural', other_parameters) == 2
+    assert other != strategy
+    assert other != parse_strategy(strategy.name)
+    assert Strategy(strategy.name, setup_country_parameters) == strategy
+    assert hash(Strategy(strategy.name, setup_country_parameters)) == hash(strategy)
+
+    strategy = parse_strategy('4G_epc_microwave_unknown_baseline_baseline_baseline')
+
+    assert strategy.networks is None
+    assert strategy.get_networks('urban', setup_country_parameters) == 3
+
+    with pytest.raises(KeyError):
+        strategy.get_shared_assets()
+
+
+def test_scenario():
+    """
+    Unit test.
+
+    """
+    scenario = Scenario('S1_25_10_2')
+
+    assert scenario.per_user_capacity == {'urban': 25, 'suburban': 10, 'rural': 2}
+
+    with pytest.raises(AttributeError):
+        scenario.name = 'S2'
+
+
+def test_parse_strategy():
+    """
+    Unit test.
+
+    """
+    strategy = parse_strategy('4G_epc_microwave_baseline_baseline_baseline_baseline')
+
+    assert parse_strategy('4G_epc_microwave_baseline_baseline_baseline_baseline') is strategy
+    assert parse_strategy(strategy) is strategy
+    assert parse_scenario('S1_25_10_2') is parse_scenario('S1_25_10_2')
+
+
+def test_get_stage_key():
+    """
+    Unit test.
+
+    """
+    baseline = {'scenario': 'S1_25_10_2',
+        'strategy': '4G_epc_microwave_baseline_baseline_baseline_baseline'}
+    spectrum_tax = {'scenario': 'S1_25_10_2',
+        'strategy': '4G_epc_microwave_baseline_baseline_low_high'}
+    sharing = {'scenario': 'S1_25_10_2',
+        'strategy': '4G_epc_microwave_passive_baseline_baseline_baseline'}
+
+    #spectrum and tax variants share demand and supply
+    assert get_stage_key(baseline, 'demand') == get_stage_key(spectrum_tax, 'demand')
+    assert get_stage_key(baseline, 'supply', 50) == get_stage_key(spectrum_tax, 'supply', 50)
+    assert get_stage_key(baseline, 'assess', 50) != get_stage_key(spectrum_tax, 'assess', 50)
+
+    #sharing only changes supply
+    assert get_stage_key(baseline, 'demand') == get_stage_key(sharing, 'demand')
+    assert get_stage_key(baseline, 'supply', 50) != get_stage_key(sharing, 'supply', 50)
+
+    assert get_stage_key(baseline, 'supply', 50) != get_stage_key(baseline, 'supply', 5)
+
+
+def test_compile_option(setup_region, setup_option, setup_costs,
+    setup_global_parameters, setup_country_parameters, setup_core_lut,
+    setup_timesteps, setup_penetration_lut):
+    """
+    Integration test, checking compiled options give the same results as
+    the string options.
+
+    """
+    option = compile_option(setup_option, setup_country_parameters)
+
+    assert isinstance(option['strategy'], Strategy)
+    assert isinstance(option['scenario'], Scenario)
+    assert setup_option['strategy'] == option['strategy'].name
+
+    answer, annual_answer = estimate_demand(
+        [dict(setup_region[0])],
+        option,
+        setup_global_parameters,
+        setup_country_parameters,
+        setup_timesteps,
+        setup_penetration_lut,
+        {'urban': {2020: 50}}
+    )
+
+    expected, annual_expected = estimate_demand(
+        [dict(setup_region[0])],
+        setup_option,
+        setup_global_parameters,
+        setup_country_parameters,
+        setup_timesteps,
+        setup_penetration_lut,
+        {'urban': {2020: 50}}
+    )
+
+    assert answer == expected
+    assert list(annual_answer) == list(annual_expected)
+
+    region = dict(setup_region[0])
+    region['new_mno_sites'] = 1
+    region['upgraded_mno_sites'] = 1
+    region['network_site_density'] = 0.5
+    region['backhaul_new'] = 1
+
+    answer = find_single_network_cost(dict(region), option, setup_costs,
+        setup_global_parameters, setup_country_parameters, setup_core_lut)
+
+    expected = find_single_network_cost(dict(region), setup_option, setup_costs,
+        setup_global_parameters, setup_country_parameters, setup_core_lut)
+
+    assert answer['network_cost'] == expected['network_cost']
@@ -2,10 +2,15 @@ import pytest
 from pytal.demand import estimate_demand
 from pytal.supply import (
     estimate_supply,
+    estimate_supply_by_ci,
     find_site_density,
     estimate_site_upgrades,
     estimate_backhaul_upgrades,
-    lookup_capacity
+    lookup_capacity,
+    build_capacity_curve,
+    compile_capacity_curves,
+    lookup_site_density,
+    find_site_densities
 )
 
 
@@ -45,6 +50,49 @@ def test_estimate_supply(
     assert round(answer[0]['network_site_density'], 1) == 0.9
 
 
+def test_estimate_supply_by_ci(
+    setup_region,
+    setup_lookup,
+    setup_option,
+    setup_global_parameters,
+    setup_country_parameters,
+    setup_costs,
+    setup_core_lut
+    ):
+    """
+    Integration test, checking all confidence intervals against estimate_supply.
+
+    """
+    setup_region[0]['total_estimated_sites'] = 100
+    setup_region[0]['sites_4G'] = 0
+    setup_region[0]['backhaul_fiber'] = 0
+    setup_region[0]['backhaul_copper'] = 0
+    setup_region[0]['backhaul_microwave'] = 0
+    setup_region[0]['backhaul_satellite'] = 0
+
+    #a lower capacity curve for the 5th percentile
+    for key, values in list(setup_lookup.items()):
+        setup_lookup[key[:-1] + ('5',)] = [(density, capacity / 2)
+            for density, capacity in values]
+
+    regions = [dict(setup_region[0])]
+
+    answer = estimate_supply_by_ci('MWI', regions, setup_lookup, setup_option,
+        setup_global_parameters, setup_country_parameters, setup_costs,
+        setup_core_lut, [5, 50])
+
+    assert regions == [setup_region[0]]
+
+    for ci in [5, 50]:
+        expected = estimate_supply('MWI', [dict(setup_region[0])], setup_lookup,
+            setup_option, setup_global_parameters, setup_country_parameters,
+            setup_costs, setup_core_lut, ci)
+        assert answer[ci] == expected
+
+    assert (answer[5][0]['network_site_density'] >
+        answer[50][0]['network_site_density'])
+
+
 def test_find_site_density(
     setup_region,
     setup_option,
@@ -140,6 +188,74 @@ def test_find_site_density(
     assert answer == 0.01
 
 
+def test_build_capacity_curve(
+    setup_lookup,
+    setup_global_parameters,
+    setup_country_parameters,
+    setup_ci
+    ):
+    """
+    Unit test.
+
+    """
+    curve = build_capacity_curve(setup_lookup, 'urban', '4G',
+        setup_country_parameters['frequencies']['4G'], setup_ci,
+        setup_global_parameters)
+
+    assert list(curve.densities) == [0.01, 0.02, 0.05, 0.15, 2]
+    #capacities summed over 800 and 1800 MHz, and multiplied by 10 MHz
+    assert list(curve.capacities) == [60, 120, 250, 550, 11000]
+    assert curve.monotonic
+
+    #TDD downlink is 80% of 50 MHz
+    curve = build_capacity_curve(setup_lookup, 'urban', '5G',
+        setup_country_parameters['frequencies']['5G'], setup_ci,
+        setup_global_parameters)
+
+    assert list(curve.capacities) == [240, 480, 1000, 2200, 44000]
+
+
+def test_find_site_densities(
+    setup_lookup,
+    setup_option,
+    setup_global_parameters,
+    setup_country_parameters,
+    setup_ci
+    ):
+    """
+    Unit test, checking the batch lookup against find_site_density.
+
+    """
+    curves = compile_capacity_curves(setup_lookup, setup_option,
+        setup_global_parameters, setup_country_parameters, setup_ci)
+
+    assert list(curves.keys()) == ['urban']
+
+    demand = [100000, 0.005, 250, 120, 90, 11000, 60]
+
+    answer = find_site_densities(demand, ['urban'] * len(demand), curves)
+
+    for value, site_density in zip(demand, answer):
+
+        assert site_density == find_site_density(
+            {'demand_mbps_km2': value, 'geotype': 'urban'},
+            setup_option,
+            setup_global_parameters,
+            setup_country_parameters,
+            setup_lookup,
+            setup_ci
+        )
+
+        assert site_density == lookup_site_density(curves['urban'], value)
+
+    assert answer[:4] == [2, 0.01, 0.05, 0.02]
+    assert answer[4] == pytest.approx(0.015)
+    assert answer[5] == 2
+
+    with pytest.raises(KeyError):
+        find_site_densities([1], ['rural'], curves)
+
+
 def test_estimate_site_upgrades(
     setup_region,
     setup_option,
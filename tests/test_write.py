@@ -0,0 +1,95 @@
+import os
+import pandas as pd
+import pytest
+
+from write import aggregate_results, ResultsSink, REGIONAL_COLUMNS
+
+
+def get_regional_results(gid_0, strategy, populations):
+    """
+    Results for a batch of regions, with one region per population.
+
+    """
+    output = []
+
+    for idx, population in enumerate(populations):
+        region = {column: 1 for column in REGIONAL_COLUMNS}
+        region.update({
+            'GID_0': gid_0,
+            'GID_id': '{}.{}'.format(gid_0, idx),
+            'scenario': 'S1_25_10_2',
+            'strategy': strategy,
+            'confidence': 50,
+            'decile': 100 - 10 * idx,
+            'population': population,
+        })
+        output.append(region)
+
+    return output
+
+
+def test_aggregate_results():
+    """
+    Unit test.
+
+    """
+    #two regions with identical results, in different deciles
+    tables = aggregate_results(get_regional_results('UGA', 'baseline', [10, 10]))
+
+    #each table drops duplicates on its own columns, so identical regions are
+    #only counted once nationally, but kept regionally and by decile
+    national = tables['national_mno_results']
+    assert len(national) == 1
+    assert national['population'].iloc[0] == 10
+
+    deciles = tables['decile_mno_results']
+    assert list(deciles['population']) == [10, 10]
+
+    regional = tables['regional_mno_results']
+    assert list(regional['GID_id']) == ['UGA.0', 'UGA.1']
+
+
+def test_results_sink(tmp_path):
+    """
+    Integration test.
+
+    """
+    folder = str(tmp_path)
+
+    sink = ResultsSink(folder, 'test')
+
+    sink.add(get_regional_results('UGA', 'baseline', [10, 20]))
+    sink.add(get_regional_results('MWI', 'baseline', [30]))
+
+    #repeated batches are only written once
+    sink.add(get_regional_results('UGA', 'baseline', [10, 20]))
+
+    sink.close()
+
+    #regional results are appended batch by batch, with unique row labels
+    regional = pd.read_csv(os.path.join(folder, 'regional_mno_results_test.csv'),
+        index_col=0)
+    assert list(regional.index) == [0, 1, 2]
+    assert list(regional['GID_id']) == ['UGA.0', 'UGA.1', 'MWI.0']
+    assert list(regional['population']) == [10, 20, 30]
+
+    #national and decile results are sorted across batches
+    national = pd.read_csv(os.path.join(folder, 'national_mno_results_test.csv'))
+    assert list(national['GID_0']) == ['MWI', 'UGA']
+    assert list(national['population']) == [30, 30]
+
+    deciles = pd.read_csv(os.path.join(folder, 'decile_mno_results_test.csv'))
+    assert list(zip(deciles['GID_0'], deciles['decile'])) == [
+        ('MWI', 100), ('UGA', 90), ('UGA', 100)]
+    assert list(deciles['population']) == [30, 20, 10]
+
+    #a new sink starts new files
+    sink = ResultsSink(folder, 'test')
+    sink.add(get_regional_results('MWI', 'baseline', [30]))
+    sink.close()
+
+    regional = pd.read_csv(os.path.join(folder, 'regional_mno_results_test.csv'))
+    assert len(regional) == 1
+
+    with pytest.raises(ValueError):
+        ResultsSink(folder, 'test', formats=['xlsx'])